@@ -6,8 +6,10 @@ from pathlib import Path
 from typing import List, Tuple
 from configparser import ConfigParser
 
+from . import gitcmd, trace
+from .cmdline import WRITER_NAMES, editor_targets, unwrap, write_targets
 from .trops import TropsBase, TropsError
-from .utils import absolute_path
+from .utils import absolute_path, is_in_git_work_tree, prepend_line, strtobool
 
 
 class TropsCapCmd(TropsBase):
@@ -72,6 +74,7 @@ class TropsCapCmd(TropsBase):
 
         # Fast-path: skip early if command is in ignore list (performance)
         sanitized_for_ignore = self._sanitize_for_sudo(executed_cmd)
+        trace.mark('classify')
         if self.ignore_cmds and sanitized_for_ignore and sanitized_for_ignore[0] in self.ignore_cmds:
             # Ignored command; flush deferred logs to preserve previous behavior
             self._flush_deferred_file_logs()
@@ -88,11 +91,20 @@ class TropsCapCmd(TropsBase):
         # Side-effect operations that should happen even if the command is repeated
         # 1) Track files edited by common editors
         self._track_editor_files(executed_cmd)
+        trace.mark('editor')
         # 2) Track files written via tee
         wrote_with_tee = self._add_tee_output_file(executed_cmd)
+        trace.mark('tee')
         # 3) Try pushing if remote is configured and we actually added/updated files
         if wrote_with_tee:
             self._push_if_remote_set()
+            trace.mark('push')
+        # 4) Track files written via shell redirection or in-place editors
+        self._add_redirect_output_files(executed_cmd)
+        trace.mark('redirect')
+        # 5) Snapshot the installed package set after package manager commands
+        self._pkg_log(executed_cmd)
+        trace.mark('pkg')
 
         # Skip if repeated within the same minute (after performing file updates)
         if self._is_repeat_command(str(last_cmd_path), time_and_cmd):
@@ -114,10 +126,43 @@ class TropsCapCmd(TropsBase):
 
         # Flush any deferred file logs after the command has been logged
         self._flush_deferred_file_logs()
+        trace.mark('log')
+        # Rotate trops.log in the background once it reaches the configured limits
+        self._rotate_log_if_due()
+        trace.mark('rotate')
 
         if not self.disable_header:
             self.print_header()
 
+    def _rotate_log_if_due(self) -> None:
+        if not (self.get_config_value('log_rotate_size', default='')
+                or self.get_config_value('log_rotate_age', default='')):
+            return
+        from .logarchive import rotation_due
+
+        try:
+            codec, max_bytes, max_age = self.log_rotation_settings()
+        except TropsError as e:
+            print(e, file=sys.stderr)
+            return
+        if rotation_due(self.trops_logfile, max_bytes, max_age):
+            self._rotate_in_background(codec, max_bytes, max_age)
+
+    def _rotate_in_background(self, codec, max_bytes, max_age) -> None:
+        """Compress the log in a detached child so the prompt does not wait."""
+        from .logarchive import rotate
+
+        if os.fork():
+            return
+        try:
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            rotate(self.trops_logfile, codec, max_bytes, max_age)
+        finally:
+            os._exit(0)
+
     def _compose_capture_message(self, executed_cmd: List[str], return_code: int) -> str:
         parts: List[str] = [
             f"CM {' '.join(executed_cmd)} #> PWD={os.getenv('PWD')}",
@@ -148,115 +193,132 @@ class TropsCapCmd(TropsBase):
         print(f'\n-= {"|".join(self.trops_header)} =-')
 
     def _yum_log(self, executed_cmd: List[str]) -> None:
-        import subprocess
-
-        # Check if sudo is used
-        executed_cmd = executed_cmd[1:] if executed_cmd[0] == 'sudo' else executed_cmd
-
-        if executed_cmd[0] in ['yum', 'dnf'] and any(x in executed_cmd for x in ['install', 'update', 'remove']):
-            cmd = ['rpm', '-qa']
-            result = subprocess.run(cmd, capture_output=True, check=True)
-            pkg_list = result.stdout.decode('utf-8').splitlines()
-            pkg_list.sort()
-
-            pkg_list_file = os.path.join(self.trops_dir, f'log/rpm_pkg_list.{self.hostname}')
-            with open(pkg_list_file, 'w') as f:
-                f.write('\n'.join(pkg_list))
+        # Look through sudo and other wrappers
+        executed_cmd = self._sanitize_for_sudo(executed_cmd)
+        if not executed_cmd:
+            return
 
-            self.add_and_commit_file(pkg_list_file)
+        if executed_cmd[0] in ['yum', 'dnf'] and \
+                any(x in executed_cmd for x in ['install', 'update', 'upgrade', 'remove', 'erase', 'reinstall', 'downgrade', 'autoremove']):
+            self._snapshot_packages('rpm', f'log/rpm_pkg_list.{self.hostname}')
+        elif executed_cmd[0] == 'rpm' and any(
+                tok in ('--install', '--upgrade', '--erase', '--freshen', '--reinstall') or
+                (len(tok) > 1 and tok[0] == '-' and tok[1] in 'iUeF') for tok in executed_cmd[1:]):
+            self._snapshot_packages('rpm', f'log/rpm_pkg_list.{self.hostname}')
 
     def _apt_log(self, executed_cmd: List[str]) -> None:
-        if 'apt' in executed_cmd and any(x in executed_cmd for x in ['upgrade', 'install', 'update', 'remove', 'autoremove']):
+        executed_cmd = self._sanitize_for_sudo(executed_cmd)
+        if not executed_cmd:
+            return
+        if executed_cmd[0] in ['apt', 'apt-get', 'aptitude'] and \
+                any(x in executed_cmd for x in ['upgrade', 'install', 'update', 'remove', 'autoremove', 'purge', 'dist-upgrade', 'full-upgrade', 'reinstall']):
+            self._update_pkg_list(' '.join(executed_cmd))
+        elif executed_cmd[0] == 'dpkg' and any(
+                tok in ('-i', '-r', '-P', '--install', '--remove', '--purge', '--unpack', '--configure') for tok in executed_cmd[1:]):
             self._update_pkg_list(' '.join(executed_cmd))
-        # TODO: Add log trops git show hex
 
     def _update_pkg_list(self, args: str) -> None:
-        import subprocess
+        self._snapshot_packages('dpkg', f'log/apt_pkg_list.{ self.hostname }')
 
-        # Update the pkg_List
-        cmd = ['apt', 'list', '--installed']
-        result = subprocess.run(cmd, capture_output=True)
-        pkg_list = result.stdout.decode('utf-8').splitlines()
-        pkg_list.sort()
+    def _snapshot_packages(self, kind: str, rel_list_file: str) -> None:
+        """Refresh the package list file and commit it only if packages changed."""
+        from .pkgsnap import PackageSnapshot
 
-        pkg_list_file = self.trops_dir + \
-            f'/log/apt_pkg_list.{ self.hostname }'
-        with open(pkg_list_file, 'w') as f:
-            f.write('\n'.join(pkg_list))
+        pkg_list_file = os.path.join(self.trops_dir, rel_list_file)
+        state_file = os.path.join(self.trops_dir, 'tmp', f'pkg_snapshot.{kind}')
+        summary = PackageSnapshot(kind, pkg_list_file, state_file).update()
+        if summary is None:
+            return
+        self.add_and_commit_file(pkg_list_file, note=summary)
 
-        self.add_and_commit_file(pkg_list_file)
+    def _pkg_log(self, executed_cmd: List[str]) -> None:
+        """Snapshot the installed packages after package manager commands."""
+        if not hasattr(self, 'git_cmd'):
+            return
+        self._yum_log(executed_cmd)
+        self._apt_log(executed_cmd)
 
     def _add_file_in_git_repo(self, executed_cmd: List[str], start_index: int, first_line_comment: str = None) -> None:
+        # Where the source command of a ttee output is recorded:
+        # file (first line of the file), commit (commit message) or notes (git notes)
+        comment_mode = None
+        if first_line_comment:
+            comment_mode = self.get_config_value('ttee_comment', default='file')
+            if comment_mode not in ('commit', 'notes'):
+                comment_mode = 'file'
         for file_arg in executed_cmd[start_index:]:
             file_path = absolute_path(file_arg)
             if not os.path.isfile(file_path):
                 continue
             # Optionally prepend a comment line describing the source command (for tee outputs)
-            if first_line_comment:
+            if comment_mode == 'file':
                 try:
-                    with open(file_path, 'r+', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        if not content.startswith(first_line_comment):
-                            f.seek(0)
-                            f.write(first_line_comment + "\n" + content)
-                except Exception:
-                    try:
-                        with open(file_path, 'w', encoding='utf-8', errors='ignore') as f:
-                            f.write(first_line_comment + "\n")
-                    except Exception:
-                        pass
+                    prepend_line(file_path, first_line_comment)
+                except OSError:
+                    pass
             # Ignore if path is already tracked in another repo
             if file_is_in_a_git_repo(file_path):
                 self.logger.info(
                     f"FL {file_path} is under a git repository #> PWD=*, EXIT=*, TROPS_SID={self.trops_sid}, TROPS_ENV={self.trops_env}")
                 sys.exit(0)
             git_msg, log_note = self._generate_git_msg_and_log_note(file_path)
-            result = self._add_and_commit_file(file_path, git_msg)
-            if result.returncode == 0:
-                msg = result.stdout.decode('utf-8').splitlines()[0]
-                print(msg)
-                self._add_file_log(file_path, log_note)
+            if comment_mode == 'commit':
+                git_msg = f"{git_msg}\n\n{first_line_comment}"
+            result = self._add_and_commit_file(file_path, git_msg, log_note)
+            if result is None:
+                # Another capture-cmd holds the commit lock; it commits
+                # the file and writes the FL line
+                continue
+            if result.commit:
+                print(result.summary)
+                if comment_mode == 'notes':
+                    gitcmd.run(self.git_cmd + ['notes', 'add', '-f', '-m', first_line_comment, result.commit],
+                               capture_output=True)
                 # Push immediately after a successful commit if remote is set
                 self._push_if_remote_set()
             else:
                 print('No update')
 
-    def _add_file_log(self, file_path: str, log_note: str) -> None:
+    def _add_file_log(self, message: str) -> None:
         """Add an FL log entry"""
-        import subprocess
-        rel_path = os.path.relpath(os.path.realpath(absolute_path(file_path)), start=os.path.realpath(self.work_tree))
-        cmd = self.git_cmd + ['log', '--oneline', '-1', rel_path]
-        output = subprocess.check_output(
-            cmd).decode("utf-8").split()
-        if rel_path in output:
-            mode = oct(os.stat(file_path).st_mode)[-4:]
-            owner = Path(file_path).owner()
-            group = Path(file_path).group()
-            message = f"FL trops show { output[0] }:{ rel_path }  #> { log_note }, O={ owner },G={ group },M={ mode }"
-            if self.trops_sid:
-                message += f" TROPS_SID={ self.trops_sid }"
-            message += f" TROPS_ENV={ self.trops_env }"
-            if self.trops_tags:
-                message += f" TROPS_TAGS={self.trops_tags}"
-            # Defer logging if requested so that command log comes first
-            if getattr(self, '_defer_file_logs', False):
-                self._deferred_file_logs.append(message)
-            else:
-                self.logger.info(message)
+        # Defer logging if requested so that command log comes first
+        if getattr(self, '_defer_file_logs', False):
+            self._deferred_file_logs.append(message)
+        else:
+            self.logger.info(message)
+
+    def _add_and_commit_file(self, file_path: str, git_msg: str, log_note: str):
+        """Add a file in the git repo and commit if changed, logging an FL entry.
+
+        Returns the trops.commitq.CommitResult, or None when the commit was
+        left to another process.
+        """
+        from .commitq import HASH
 
-    def _add_and_commit_file(self, file_path: str, git_msg: str):
-        """Add a file in the git repo and commit if changed"""
-        import subprocess
         rel_path = os.path.relpath(os.path.realpath(absolute_path(file_path)), start=os.path.realpath(self.work_tree))
-        subprocess.run(self.git_cmd + ['add', rel_path], capture_output=True)
-        return subprocess.run(self.git_cmd + ['commit', '-m', git_msg, rel_path], capture_output=True)
+        self._apply_large_file_policy(file_path, rel_path)
+        mode = oct(os.stat(file_path).st_mode)[-4:]
+        owner = Path(file_path).owner()
+        group = Path(file_path).group()
+        message = f"FL trops show { HASH }:{ rel_path }  #> { log_note }, O={ owner },G={ group },M={ mode }"
+        if self.trops_sid:
+            message += f" TROPS_SID={ self.trops_sid }"
+        message += f" TROPS_ENV={ self.trops_env }"
+        if self.trops_tags:
+            message += f" TROPS_TAGS={self.trops_tags}"
+        result = self._commit_file(rel_path, git_msg, message)
+        if result is not None and result.commit:
+            self._add_file_log(message.replace(HASH, result.commit, 1))
+        return result
 
     def _generate_git_msg_and_log_note(self, file_path: str) -> Tuple[str, str]:
         """Generate the git commit message and log note"""
-        import subprocess
         rel_path = os.path.relpath(os.path.realpath(absolute_path(file_path)), start=os.path.realpath(self.work_tree))
-        result = subprocess.run(self.git_cmd + ['ls-files', rel_path], capture_output=True)
-        is_tracked = bool(result.stdout.decode('utf-8'))
+        try:
+            is_tracked = self.git_session.is_tracked(rel_path)
+        except RuntimeError:
+            # same as an empty ls-files answer: let add/commit report the problem
+            is_tracked = False
         git_msg = f"{'Update' if is_tracked else 'Add'} {rel_path}"
         log_note = 'UPDATE' if is_tracked else 'ADD'
         if self.trops_tags:
@@ -264,16 +326,12 @@ class TropsCapCmd(TropsBase):
         return git_msg, log_note
 
     def _track_editor_files(self, executed_cmd: List[str]) -> None:
-        """Detect common editors and add the edited file(s) to the repo if present."""
+        """Detect editors (also behind sudo/doas/env, or sudoedit) and add the edited file(s) to the repo if present."""
 
-        # Remove sudo from executed_cmd (basic case)
-        executed_cmd = self._sanitize_for_sudo(executed_cmd)
-
-        # Check if editor is launched
-        editors = ['vim', 'vi', 'nvim', 'emacs', 'nano']
-        if executed_cmd[0] in editors:
+        targets = editor_targets(executed_cmd)
+        if targets:
             # Add the edited file in trops git
-            self._add_file_in_git_repo(executed_cmd, 1)
+            self._add_file_in_git_repo(targets, 0)
 
     def _add_tee_output_file(self, executed_cmd: List[str]) -> bool:
         """Detect tee/ttee after one or more pipes and add the target file(s).
@@ -327,11 +385,54 @@ class TropsCapCmd(TropsBase):
         self._add_file_in_git_repo(normalized, tee_index + 1, first_line_comment=comment)
         return True
 
+    def _add_redirect_output_files(self, executed_cmd: List[str]) -> bool:
+        """Detect files written by redirection or in-place tools and add them.
+
+        Covers ``cmd > file``, ``cmd >> file``, ``&>``/``2>`` forms and
+        here-documents (``cat <<EOF > file``), ``sed -i`` and ``perl -pi``.
+        Destinations of ``cp``/``mv``/``install`` are only added when they
+        land in a directory that already holds tracked files. ``| tee`` stages
+        are left to _add_tee_output_file. Targets outside the work tree are
+        ignored. Returns True if any target was handed over for commit.
+        """
+        # Fast skip: nothing is written without a redirection or a known writer
+        if not any('>' in tok for tok in executed_cmd) and WRITER_NAMES.isdisjoint(executed_cmd):
+            return False
+        if not hasattr(self, 'git_cmd'):
+            return False
+
+        targets = write_targets(executed_cmd)
+        paths = [p for p in targets.files if self._is_in_work_tree(p)]
+        if targets.copies:
+            paths.extend(self._filter_tracked_dirs(
+                [p for p in targets.copies if self._is_in_work_tree(p)]))
+        paths = [p for p in dict.fromkeys(absolute_path(p) for p in paths) if os.path.isfile(p)]
+        if not paths:
+            return False
+        self._add_file_in_git_repo(paths, 0)
+        return True
+
+    def _is_in_work_tree(self, file_path: str) -> bool:
+        rel_path = os.path.relpath(os.path.realpath(absolute_path(file_path)), start=os.path.realpath(self.work_tree))
+        return not rel_path.startswith('..')
+
+    def _filter_tracked_dirs(self, paths: List[str]) -> List[str]:
+        """Keep paths that are tracked or sit next to tracked files (one ls-files call)."""
+        if not paths:
+            return []
+        real_work_tree = os.path.realpath(self.work_tree)
+        rel_paths = {p: os.path.relpath(os.path.realpath(absolute_path(p)), start=real_work_tree) for p in paths}
+        rel_dirs = sorted({os.path.dirname(r) or '.' for r in rel_paths.values()})
+        result = gitcmd.run(self.git_cmd + ['ls-files', '--'] + rel_dirs, capture_output=True)
+        if result.returncode != 0:
+            return []
+        tracked = set(result.stdout.decode('utf-8').splitlines())
+        tracked_dirs = {os.path.dirname(t) or '.' for t in tracked}
+        return [p for p, r in rel_paths.items() if r in tracked or (os.path.dirname(r) or '.') in tracked_dirs]
+
     def _sanitize_for_sudo(self, executed_cmd: List[str]) -> List[str]:
-        """Remove leading sudo if present. TODO: handle sudo options."""
-        if executed_cmd and executed_cmd[0] == 'sudo':
-            return executed_cmd[1:]
-        return executed_cmd
+        """Remove leading wrappers (sudo and its options, doas, env, command, ...)."""
+        return unwrap(executed_cmd)[0]
 
     def _push_if_remote_set(self) -> None:
         """Push current branch if a git remote is configured.
@@ -351,9 +452,8 @@ class TropsCapCmd(TropsBase):
         if not os.path.isfile(git_config_path):
             return
 
-        import subprocess
         # Determine current branch
-        result = subprocess.run(self.git_cmd + ['branch', '--show-current'], capture_output=True)
+        result = gitcmd.run(self.git_cmd + ['branch', '--show-current'], capture_output=True)
         current_branch = result.stdout.decode('utf-8').strip() if result.returncode == 0 else ''
         if not current_branch:
             return
@@ -363,19 +463,26 @@ class TropsCapCmd(TropsBase):
 
         # Ensure origin exists
         if not git_conf.has_option('remote "origin"', 'url'):
-            subprocess.call(self.git_cmd + ['remote', 'add', 'origin', self.git_remote])
+            gitcmd.call(self.git_cmd + ['remote', 'add', 'origin', self.git_remote])
 
         # Set upstream if missing, else regular push
         if not git_conf.has_option(f'branch "{current_branch}"', 'remote'):
             cmd = self.git_cmd + ['push', '--set-upstream', 'origin', current_branch]
         else:
             cmd = self.git_cmd + ['push']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
 def capture_cmd(args, other_args):
 
+    if os.environ.get('TROPS_TRACE') not in (None, '', '0'):
+        trace.start(' '.join(other_args))
     tc = TropsCapCmd(args, other_args)
-    tc.capture_cmd()
+    if not trace.active() and tc.trops_env and strtobool(tc.get_config_value('trace', default='False')):
+        trace.start(' '.join(other_args))
+    try:
+        tc.capture_cmd()
+    finally:
+        trace.finish(tc.trops_dir, args.return_code)
 
 def add_capture_cmd_subparsers(subparsers):
 
@@ -386,8 +493,9 @@ def add_capture_cmd_subparsers(subparsers):
     parser_capture_cmd.set_defaults(handler=capture_cmd)
 
 def file_is_in_a_git_repo(file_path: str) -> bool:
-    import subprocess
-    parent_dir = os.path.dirname(file_path) or '.'
-    # Use git -C to avoid changing global working directory
-    result = subprocess.run(['git', '-C', parent_dir, 'rev-parse', '--is-inside-work-tree'], capture_output=True)
-    return result.returncode == 0
\ No newline at end of file
+    """Return True if file_path is inside another git work tree.
+
+    Resolved in-process by walking parent directories (see
+    ``utils.find_git_work_tree``) instead of forking ``git rev-parse``.
+    """
+    return is_in_git_work_tree(file_path)
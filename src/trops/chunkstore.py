@@ -0,0 +1,254 @@
+"""Local content-addressed store for large tracked files.
+
+Files over the env's ``large_file_threshold`` are not stored in the env git
+repo. Their content is split into fixed-size chunks kept under
+``$TROPS_DIR/chunks``, named by SHA-256, so versions that share chunks
+(a dump that only grew at the end, an unchanged head) store them once.
+git holds a small pointer blob instead::
+
+    trops-chunks v1
+    oid sha256:<hash of the whole content>
+    size <bytes>
+    mode 0644
+
+The pointer is produced by a git clean filter (``trops-chunks``) enabled for
+the large paths through ``$GIT_DIR/info/attributes``, so ``git add`` and
+``git commit <path>`` work unchanged and ``git checkout`` (``trops file put``)
+gets the content back through the matching smudge filter. ``trops show`` and
+``trops view`` resolve pointers in-process.
+
+Layout under the store root:
+  - ``objects/ab/cdef...``: chunk content
+  - ``manifests/ab/cdef...``: ``<chunk hash> <size>`` lines of a file
+"""
+
+import hashlib
+import os
+import shlex
+import sys
+import tempfile
+
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import gitcmd
+
+# Bytes per chunk
+CHUNK_BYTES = 4 << 20
+# Blobs larger than this are never pointers
+POINTER_MAX = 512
+MAGIC = b'trops-chunks v1\n'
+FILTER = 'trops-chunks'
+
+
+class ChunkStoreError(Exception):
+    pass
+
+
+class Pointer(NamedTuple):
+    oid: str
+    size: int
+    mode: Optional[str] = None
+
+
+def format_pointer(pointer: Pointer) -> bytes:
+    text = f'oid sha256:{ pointer.oid }\nsize { pointer.size }\n'
+    if pointer.mode:
+        text += f'mode { pointer.mode }\n'
+    return MAGIC + text.encode('ascii')
+
+
+def parse_pointer(data: bytes) -> Optional[Pointer]:
+    """The pointer in data, or None if data is not one."""
+    if not data.startswith(MAGIC) or len(data) > POINTER_MAX:
+        return None
+    fields = {}
+    try:
+        for line in data[len(MAGIC):].decode('ascii').splitlines():
+            key, _, value = line.partition(' ')
+            fields[key] = value
+        oid = fields['oid']
+        if not oid.startswith('sha256:') or len(oid) != 71:
+            return None
+        return Pointer(oid[7:], int(fields['size']), fields.get('mode'))
+    except (KeyError, ValueError):
+        return None
+
+
+class ChunkStore:
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, kind: str, digest: str) -> str:
+        return os.path.join(self.root, kind, digest[:2], digest[2:])
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def put(self, f: BinaryIO, head: bytes = b'', mode: Optional[str] = None) -> Pointer:
+        """Store head plus the rest of f; chunks already present are not rewritten."""
+        whole = hashlib.sha256()
+        chunks: List[Tuple[str, int]] = []
+        size = 0
+        while True:
+            data = head + f.read(CHUNK_BYTES - len(head))
+            head = b''
+            # pipes return short reads; fill the chunk so boundaries stay fixed
+            while 0 < len(data) < CHUNK_BYTES:
+                more = f.read(CHUNK_BYTES - len(data))
+                if not more:
+                    break
+                data += more
+            if not data:
+                break
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._path('objects', digest)
+            if not os.path.exists(path):
+                self._write(path, data)
+            whole.update(data)
+            chunks.append((digest, len(data)))
+            size += len(data)
+        oid = whole.hexdigest()
+        manifest = self._path('manifests', oid)
+        if not os.path.exists(manifest):
+            self._write(manifest, ''.join(f'{ d } { n }\n' for d, n in chunks).encode('ascii'))
+        return Pointer(oid, size, mode)
+
+    def manifest(self, oid: str) -> List[Tuple[str, int]]:
+        try:
+            with open(self._path('manifests', oid)) as f:
+                return [(d, int(n)) for d, n in (line.split() for line in f)]
+        except (OSError, ValueError) as e:
+            raise ChunkStoreError(f'chunks of sha256:{ oid } are not in { self.root }: { e }')
+
+    def has(self, pointer: Pointer) -> bool:
+        try:
+            return all(os.path.exists(self._path('objects', d)) for d, _ in self.manifest(pointer.oid))
+        except ChunkStoreError:
+            return False
+
+    def iter_range(self, pointer: Pointer, start: int = 0, length: Optional[int] = None,
+                   block: int = 1 << 16) -> Iterator[bytes]:
+        """Yield the content behind pointer from byte start, block bytes at a time."""
+        remaining = pointer.size - start if length is None else min(length, pointer.size - start)
+        for digest, size in self.manifest(pointer.oid):
+            if remaining <= 0:
+                return
+            if start >= size:
+                start -= size
+                continue
+            try:
+                f = open(self._path('objects', digest), 'rb')
+            except OSError as e:
+                raise ChunkStoreError(f'missing chunk { digest }: { e }')
+            with f:
+                f.seek(start)
+                start = 0
+                while remaining > 0:
+                    data = f.read(min(block, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+    def copy_to(self, pointer: Pointer, out: BinaryIO) -> None:
+        for data in self.iter_range(pointer, block=1 << 20):
+            out.write(data)
+
+
+def _attributes_line(rel_path: str) -> Optional[str]:
+    """gitattributes line routing rel_path through the filter, or None
+    for paths a pattern cannot name exactly."""
+    if any(c.isspace() for c in rel_path) or rel_path.startswith(('"', '#', '!')):
+        return None
+    escaped = ''.join('\\' + c if c in '*?[]\\' else c for c in rel_path)
+    return f'/{ escaped } filter={ FILTER }'
+
+
+def track_path(git_dir: str, git_cmd: List[str], rel_path: str, store_root: str) -> bool:
+    """Store rel_path through the chunk filter from its next git add on.
+
+    The filter commands are written to the repo config together with the
+    first attributes line. Returns False if rel_path cannot be routed.
+    """
+    line = _attributes_line(rel_path)
+    if line is None:
+        return False
+    attributes = os.path.join(git_dir, 'info', 'attributes')
+    try:
+        with open(attributes) as f:
+            if line in f.read().splitlines():
+                return True
+    except FileNotFoundError:
+        pass
+    command = f'{ shlex.quote(sys.executable) } -m trops.chunkstore'
+    root = shlex.quote(store_root)
+    for key, value in (('clean', f'{ command } clean { root } %f'), ('smudge', f'{ command } smudge { root }')):
+        if gitcmd.run(git_cmd + ['config', f'filter.{ FILTER }.{ key }', value], capture_output=True).returncode:
+            return False
+    os.makedirs(os.path.dirname(attributes), exist_ok=True)
+    with open(attributes, 'a') as f:
+        f.write(line + '\n')
+    return True
+
+
+def clean(store: ChunkStore, src: BinaryIO, out: BinaryIO, path: Optional[str] = None) -> None:
+    """git clean filter: content on src, pointer on out."""
+    head = src.read(POINTER_MAX + 1)
+    if parse_pointer(head) is not None:
+        # already a pointer (e.g. a checkout without the smudge filter)
+        out.write(head)
+        return
+    mode = None
+    if path:
+        try:
+            mode = oct(os.stat(path).st_mode)[-4:]
+        except OSError:
+            pass
+    out.write(format_pointer(store.put(src, head, mode)))
+
+
+def smudge(store: ChunkStore, src: BinaryIO, out: BinaryIO) -> None:
+    """git smudge filter: pointer on src, content on out."""
+    head = src.read(POINTER_MAX + 1)
+    pointer = parse_pointer(head)
+    if pointer is None:
+        out.write(head)
+        while True:
+            data = src.read(1 << 20)
+            if not data:
+                return
+            out.write(data)
+    store.copy_to(pointer, out)
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('clean', 'smudge'):
+        print('usage: python -m trops.chunkstore clean|smudge <store> [<path>]', file=sys.stderr)
+        return 2
+    store = ChunkStore(argv[1])
+    try:
+        if argv[0] == 'clean':
+            clean(store, sys.stdin.buffer, sys.stdout.buffer, argv[2] if len(argv) > 2 else None)
+        else:
+            smudge(store, sys.stdin.buffer, sys.stdout.buffer)
+    except (ChunkStoreError, OSError) as e:
+        print(f'trops-chunks: { e }', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
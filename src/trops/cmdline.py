@@ -0,0 +1,546 @@
+"""Command-line classification for the capture-cmd hot path.
+
+``capture-cmd`` receives the executed command as whitespace-split words. The
+helpers here peel off privilege and exec wrappers (``sudo``, ``doas``, ``env``,
+``command``, ``exec``, ...) and work out which files an editor invocation
+targets, as well as the files a command line writes through shell redirection
+or in-place tools (``sed -i``, ``cp``, ...). Everything is driven by the
+grammar tables below, which are built once at import time, so classification
+is a single pass over the tokens.
+"""
+
+import os
+
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+
+class Grammar(NamedTuple):
+    """Option grammar of a wrapper or editor command."""
+
+    # Short options taking a value, e.g. 'u' for ``sudo -u root``
+    short_value: FrozenSet[str] = frozenset()
+    # Long options (or single-dash words when not clustered) taking a value
+    long_value: FrozenSet[str] = frozenset()
+    # Whether single-dash options may be clustered (``-Eu root``)
+    clustered: bool = True
+    # Skip leading NAME=VALUE assignments before the wrapped command
+    assignments: bool = False
+    # Options that turn the wrapper into an editor (``sudo -e``)
+    edit_flags: FrozenSet[str] = frozenset()
+    # Options after which no command is executed (``command -v``)
+    noexec_flags: FrozenSet[str] = frozenset()
+    # Positional arguments preceding the wrapped command (``timeout 5 cmd``)
+    positional: int = 0
+
+
+_SUDO = Grammar(
+    short_value=frozenset('CDghprRtTUu'),
+    long_value=frozenset({
+        '--chdir', '--close-from', '--group', '--host', '--prompt', '--chroot',
+        '--role', '--type', '--command-timeout', '--other-user', '--user',
+    }),
+    assignments=True,
+    edit_flags=frozenset({'e', '--edit'}),
+    noexec_flags=frozenset({'l', 'v', 'k', 'K', 'V', '--list', '--validate',
+                            '--reset-timestamp', '--remove-timestamp', '--version', '--help'}),
+)
+
+# Commands that run another command given as their trailing arguments.
+WRAPPERS: Dict[str, Grammar] = {
+    'sudo': _SUDO,
+    'sudoedit': _SUDO._replace(edit_flags=frozenset(), noexec_flags=frozenset()),
+    'doas': Grammar(short_value=frozenset('Cu')),
+    'env': Grammar(
+        short_value=frozenset('uCS'),
+        long_value=frozenset({'--unset', '--chdir', '--split-string'}),
+        assignments=True,
+    ),
+    'command': Grammar(noexec_flags=frozenset({'v', 'V'})),
+    'builtin': Grammar(),
+    'exec': Grammar(short_value=frozenset('a')),
+    'nice': Grammar(short_value=frozenset('n'), long_value=frozenset({'--adjustment'})),
+    'nohup': Grammar(),
+    'time': Grammar(short_value=frozenset('fo'), long_value=frozenset({'--format', '--output'})),
+    'timeout': Grammar(short_value=frozenset('ks'), long_value=frozenset({'--kill-after', '--signal'}),
+                       positional=1),
+}
+
+_VIM = Grammar(
+    short_value=frozenset('cSuUiTtqwWs'),
+    long_value=frozenset({'--cmd', '--servername', '--startuptime', '--remote', '--log'}),
+)
+
+# Editors whose non-option arguments are the files being edited.
+EDITORS: Dict[str, Grammar] = {
+    'vi': _VIM,
+    'vim': _VIM,
+    'nvim': _VIM._replace(long_value=_VIM.long_value | {'--listen'}),
+    'vimdiff': _VIM,
+    'nano': Grammar(
+        short_value=frozenset('YTrosQXCf'),
+        long_value=frozenset({'--syntax', '--tabsize', '--fill', '--operatingdir', '--speller',
+                              '--quotestr', '--wordchars', '--backupdir', '--rcfile'}),
+    ),
+    'emacs': Grammar(
+        long_value=frozenset({'-l', '--load', '-f', '--funcall', '--eval', '-eval', '-L',
+                              '--directory', '-t', '--terminal', '-d', '--display', '--chdir',
+                              '-T', '--title', '-bg', '-fg', '-fn', '--font'}),
+        clustered=False,
+    ),
+}
+
+
+class Classified(NamedTuple):
+    """Result of classify()."""
+
+    # Inner command after wrappers were removed (may be empty)
+    argv: List[str]
+    # Files the command edits (editors, sudoedit, sudo -e)
+    edit_targets: List[str]
+
+
+def _is_assignment(token: str) -> bool:
+    eq = token.find('=')
+    return eq > 0 and (token[0].isalpha() or token[0] == '_') and token[:eq].replace('_', 'a').isalnum()
+
+
+def _skip_options(tokens: List[str], i: int, grammar: Grammar) -> Tuple[int, bool, bool]:
+    """Advance past the options of ``grammar`` starting at tokens[i].
+
+    Returns (index of the first operand, edit mode seen, no-exec flag seen).
+    """
+    n = len(tokens)
+    edit = False
+    noexec = False
+    while i < n:
+        tok = tokens[i]
+        if tok == '--':
+            return i + 1, edit, noexec
+        if len(tok) < 2 or tok[0] != '-':
+            break
+        if tok.startswith('--') or not grammar.clustered:
+            name, has_eq, _ = tok.partition('=')
+            if name in grammar.edit_flags:
+                edit = True
+            if name in grammar.noexec_flags:
+                noexec = True
+            i += 2 if (name in grammar.long_value and not has_eq) else 1
+            continue
+        # Clustered short options: -Eu root, -uroot
+        consumed_next = False
+        for pos in range(1, len(tok)):
+            ch = tok[pos]
+            if ch in grammar.edit_flags:
+                edit = True
+            if ch in grammar.noexec_flags:
+                noexec = True
+            if ch in grammar.short_value:
+                consumed_next = pos == len(tok) - 1
+                break
+        i += 2 if consumed_next else 1
+    return i, edit, noexec
+
+
+def _operands(tokens: List[str], i: int, grammar: Grammar) -> List[str]:
+    """Return the non-option operands of an editor invocation."""
+    operands: List[str] = []
+    n = len(tokens)
+    while i < n:
+        tok = tokens[i]
+        if tok == '--':
+            operands.extend(tokens[i + 1:])
+            break
+        if tok.startswith('+'):
+            i += 1
+            continue
+        if len(tok) > 1 and tok[0] == '-':
+            i = _skip_options(tokens, i, grammar)[0]
+            if i < n and tokens[i - 1] == '--':
+                operands.extend(tokens[i:])
+                break
+            continue
+        operands.append(tok)
+        i += 1
+    return operands
+
+
+def unwrap(tokens: List[str]) -> Tuple[List[str], Optional[List[str]]]:
+    """Strip wrapper commands from tokens.
+
+    Returns (inner command, sudoedit targets). The second item is a list of
+    files when a wrapper itself edits files (``sudoedit``/``sudo -e``),
+    otherwise None.
+    """
+    i = 0
+    n = len(tokens)
+    while i < n:
+        name = tokens[i]
+        grammar = WRAPPERS.get(name)
+        if grammar is None:
+            break
+        i, edit, noexec = _skip_options(tokens, i + 1, grammar)
+        if name == 'sudoedit' or edit:
+            return [], _operands(tokens, i, Grammar())
+        if noexec:
+            return [], None
+        if grammar.assignments:
+            while i < n and _is_assignment(tokens[i]):
+                i += 1
+        i += grammar.positional
+    return tokens[i:], None
+
+
+def classify(tokens: List[str]) -> Classified:
+    """Classify a command line into its inner command and edited files."""
+    argv, edited = unwrap(tokens)
+    if edited is not None:
+        return Classified(argv, edited)
+    if argv:
+        grammar = EDITORS.get(argv[0].rsplit('/', 1)[-1])
+        if grammar is not None:
+            return Classified(argv, _operands(argv, 1, grammar))
+    return Classified(argv, [])
+
+
+def editor_targets(tokens: List[str]) -> List[str]:
+    """Return the files edited by the command line (empty if not an editor)."""
+    return classify(tokens).edit_targets
+
+
+# ===== shell tokenization and write targets =====
+
+class Token(NamedTuple):
+    """A shell token; ``op`` is True for operators (``|``, ``>``, ``2>&``, ...)."""
+
+    text: str
+    op: bool
+
+
+# Longest operators first so that greedy matching picks ``>>`` over ``>``
+_OPERATORS = ('&>>', '<<<', '<<-', '&>', '>>', '>|', '>&', '<<', '<>', '<&',
+              '||', '&&', '|&', ';;', '|', '&', ';', '<', '>', '(', ')')
+_OPERATOR_START = frozenset(op[0] for op in _OPERATORS)
+_WORD_END = frozenset(' \t\n') | _OPERATOR_START
+
+# Operators separating simple commands
+SEPARATORS = frozenset({'|', '||', '&&', '|&', ';', ';;', '&', '(', ')'})
+# Redirections opening their target for writing (fd prefix stripped)
+WRITE_REDIRECTS = frozenset({'>', '>>', '>|', '&>', '&>>', '>&'})
+# Redirections whose operand is not a written file
+READ_REDIRECTS = frozenset({'<', '<<', '<<-', '<<<', '<>', '<&'})
+# Pseudo filesystems never worth tracking
+_SKIP_PREFIXES = ('/dev/', '/proc/', '/sys/')
+
+
+def _read_word(line: str, i: int) -> Tuple[str, int]:
+    """Read one shell word starting at i, removing quotes; return (word, next index)."""
+    n = len(line)
+    out: List[str] = []
+    while i < n:
+        c = line[i]
+        if c in _WORD_END:
+            break
+        if c == '\\':
+            if i + 1 < n:
+                out.append(line[i + 1])
+            i += 2
+        elif c == "'":
+            end = line.find("'", i + 1)
+            end = n if end == -1 else end
+            out.append(line[i + 1:end])
+            i = end + 1
+        elif c == '"':
+            j = i + 1
+            while j < n and line[j] != '"':
+                if line[j] == '\\' and j + 1 < n:
+                    j += 1
+                out.append(line[j])
+                j += 1
+            i = j + 1
+        elif c == '$' and line.startswith('$(', i):
+            # Command substitution: copy verbatim up to the matching paren
+            depth = 0
+            j = i + 1
+            while j < n:
+                if line[j] == '(':
+                    depth += 1
+                elif line[j] == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            out.append(line[i:j + 1])
+            i = j + 1
+        elif c == '`':
+            end = line.find('`', i + 1)
+            end = n if end == -1 else end
+            out.append(line[i:end + 1])
+            i = end + 1
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out), i
+
+
+def tokenize(line: str) -> List[Token]:
+    """Split a shell command line into words and operators.
+
+    Handles single/double quotes, backslash escapes, command substitution,
+    comments, and fd-prefixed redirections such as ``2>``, ``2>>`` and
+    ``2>&1`` (returned as the operator ``2>&`` followed by the word ``1``).
+    """
+    tokens: List[Token] = []
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c in ' \t\n':
+            i += 1
+            continue
+        if c == '#':
+            break
+        # fd-prefixed redirection: 2>, 10>>, 2>&
+        j = i
+        while j < n and line[j].isdigit():
+            j += 1
+        if j < n and j > i and line[j] in '<>':
+            start = i
+            i = j
+            c = line[i]
+        else:
+            start = i
+        if c in _OPERATOR_START:
+            for op in _OPERATORS:
+                if line.startswith(op, i):
+                    tokens.append(Token(line[start:i] + op, True))
+                    i += len(op)
+                    break
+            continue
+        word, i = _read_word(line, start)
+        tokens.append(Token(word, False))
+    return tokens
+
+
+def _sed_targets(argv: List[str]) -> List[str]:
+    """Files edited by ``sed -i``/``--in-place`` (none without in-place)."""
+    in_place = False
+    script_given = False
+    operands: List[str] = []
+    i = 1
+    n = len(argv)
+    while i < n:
+        tok = argv[i]
+        if tok == '--':
+            operands.extend(argv[i + 1:])
+            break
+        if tok.startswith('--'):
+            name, has_eq, _ = tok.partition('=')
+            if name == '--in-place':
+                in_place = True
+            elif name in ('--expression', '--file', '--line-length'):
+                script_given = script_given or name != '--line-length'
+                i += 1 if has_eq else 2
+                continue
+            i += 1
+            continue
+        if len(tok) > 1 and tok[0] == '-':
+            for pos in range(1, len(tok)):
+                ch = tok[pos]
+                if ch == 'i':
+                    in_place = True
+                    # BSD form: -i '' (empty suffix as a separate word)
+                    if pos == len(tok) - 1 and i + 1 < n and argv[i + 1] == '':
+                        i += 1
+                    break
+                if ch in 'efl':
+                    script_given = script_given or ch != 'l'
+                    if pos == len(tok) - 1:
+                        i += 1
+                    break
+            i += 1
+            continue
+        operands.append(tok)
+        i += 1
+    if not in_place:
+        return []
+    return operands if script_given else operands[1:]
+
+
+def _perl_targets(argv: List[str]) -> List[str]:
+    """Files edited by ``perl -i``/``perl -pi -e ...`` (none without -i)."""
+    in_place = False
+    script_given = False
+    operands: List[str] = []
+    i = 1
+    n = len(argv)
+    while i < n:
+        tok = argv[i]
+        if tok == '--':
+            operands.extend(argv[i + 1:])
+            break
+        if len(tok) > 1 and tok[0] == '-':
+            for pos in range(1, len(tok)):
+                ch = tok[pos]
+                if ch == 'i':
+                    # The rest of the cluster is the backup extension
+                    in_place = True
+                    break
+                if ch in 'eEIMm':
+                    script_given = script_given or ch in 'eE'
+                    if pos == len(tok) - 1:
+                        i += 1
+                    break
+                if ch in 'xdDC0l':
+                    # Optional attached argument
+                    break
+            i += 1
+            continue
+        operands.append(tok)
+        i += 1
+    if not in_place:
+        return []
+    return operands if script_given else operands[1:]
+
+
+def _copy_targets(argv: List[str], grammar: Grammar) -> List[str]:
+    """Destination files of cp/mv/install (``SRC... DEST`` or ``-t DIR SRC...``)."""
+    target_dir: Optional[str] = None
+    operands: List[str] = []
+    i = 1
+    n = len(argv)
+    while i < n:
+        tok = argv[i]
+        if tok == '--':
+            operands.extend(argv[i + 1:])
+            break
+        if tok.startswith('--'):
+            name, has_eq, value = tok.partition('=')
+            if name in grammar.noexec_flags:
+                return []
+            if name == '--target-directory':
+                if has_eq:
+                    target_dir = value
+                elif i + 1 < n:
+                    target_dir = argv[i + 1]
+                    i += 1
+            elif name in grammar.long_value and not has_eq:
+                i += 1
+            i += 1
+            continue
+        if len(tok) > 1 and tok[0] == '-':
+            for pos in range(1, len(tok)):
+                ch = tok[pos]
+                if ch in grammar.noexec_flags:
+                    return []
+                if ch in grammar.short_value:
+                    value = tok[pos + 1:]
+                    if not value and i + 1 < n:
+                        value = argv[i + 1]
+                        i += 1
+                    if ch == 't':
+                        target_dir = value
+                    break
+            i += 1
+            continue
+        operands.append(tok)
+        i += 1
+
+    if target_dir is not None:
+        return [os.path.join(target_dir, os.path.basename(src.rstrip('/'))) for src in operands]
+    if len(operands) < 2:
+        return []
+    dest = operands[-1]
+    if os.path.isdir(dest):
+        return [os.path.join(dest, os.path.basename(src.rstrip('/'))) for src in operands[:-1]]
+    return [dest]
+
+
+_CP = Grammar(short_value=frozenset('St'), long_value=frozenset({'--suffix', '--target-directory'}))
+_INSTALL = Grammar(
+    short_value=frozenset('mogtS'),
+    long_value=frozenset({'--mode', '--owner', '--group', '--target-directory', '--suffix',
+                          '--strip-program'}),
+    noexec_flags=frozenset({'d', '--directory'}),
+)
+
+# Commands rewriting files in place: name -> extractor of written files
+IN_PLACE_WRITERS: Dict[str, Callable[[List[str]], List[str]]] = {
+    'sed': _sed_targets,
+    'perl': _perl_targets,
+}
+
+# Commands copying files to a destination: name -> extractor of destinations
+COPY_WRITERS: Dict[str, Callable[[List[str]], List[str]]] = {
+    'cp': lambda argv: _copy_targets(argv, _CP),
+    'mv': lambda argv: _copy_targets(argv, _CP),
+    'install': lambda argv: _copy_targets(argv, _INSTALL),
+}
+
+WRITER_NAMES = frozenset(IN_PLACE_WRITERS) | frozenset(COPY_WRITERS)
+
+
+class WriteTargets(NamedTuple):
+    """Files a command line writes, as returned by write_targets()."""
+
+    # Redirection targets and files edited in place
+    files: List[str]
+    # Destinations of cp/mv/install
+    copies: List[str]
+
+
+def _keep_target(path: str) -> bool:
+    if not path or path == '-' or path.startswith(_SKIP_PREFIXES):
+        return False
+    # Unexpanded globs or substitutions cannot be resolved reliably
+    return not any(c in path for c in '*?[`') and '$(' not in path
+
+
+def write_targets(executed_cmd: List[str]) -> WriteTargets:
+    """Return the files written by a command line.
+
+    ``executed_cmd`` is the whitespace-split command as received by
+    capture-cmd; it is re-joined and tokenized so quoting and redirection
+    forms like ``2>&1`` or ``&>file`` are understood. ``tee``/``ttee`` stages
+    are skipped because capture-cmd handles them separately.
+    """
+    files: List[str] = []
+    copies: List[str] = []
+    tokens = tokenize(' '.join(executed_cmd))
+    n = len(tokens)
+    i = 0
+    while i < n:
+        # Collect one simple command: its words and its write redirections
+        words: List[str] = []
+        redirects: List[str] = []
+        while i < n:
+            tok = tokens[i]
+            if tok.op:
+                op = tok.text.lstrip('0123456789')
+                if op in SEPARATORS:
+                    i += 1
+                    break
+                target = tokens[i + 1].text if i + 1 < n and not tokens[i + 1].op else None
+                if target is not None:
+                    i += 1
+                    # >&N and 2>&1 duplicate descriptors rather than open files
+                    if op in WRITE_REDIRECTS and not (op == '>&' and (target.isdigit() or target == '-')):
+                        redirects.append(target)
+                i += 1
+                continue
+            words.append(tok.text)
+            i += 1
+
+        argv = unwrap(words)[0]
+        name = os.path.basename(argv[0]) if argv else ''
+        if name in ('tee', 'ttee'):
+            continue
+        files.extend(redirects)
+        if name in IN_PLACE_WRITERS:
+            files.extend(IN_PLACE_WRITERS[name](argv))
+        elif name in COPY_WRITERS:
+            copies.extend(COPY_WRITERS[name](argv))
+
+    return WriteTargets(
+        [p for p in dict.fromkeys(files) if _keep_target(p)],
+        [p for p in dict.fromkeys(copies) if _keep_target(p)],
+    )
@@ -0,0 +1,183 @@
+"""Serialized commits of tracked files, one queue per git dir.
+
+Shells sharing an env commit to the same repository, and concurrent
+``git add``/``git commit`` runs fail on ``index.lock``. Instead of running
+git directly, a process drops a commit request into the git dir's spool
+(``$GIT_DIR/trops-spool``) and tries to take ``$GIT_DIR/trops-commit.lock``
+without waiting:
+
+  - if it gets the lock, it commits every spooled request, its own and
+    those of processes that came in meanwhile, with one ``git add`` and
+    one ``git commit``, and writes their FL log lines;
+  - if another process holds the lock, it returns at once: the holder
+    checks the spool again after releasing the lock, so the request is
+    committed by whoever drains next.
+
+FL lines are prepared by the requesting process with ``HASH`` in place of
+the commit; lines of the calling process's own request are handed back to
+it (so capture-cmd can log them after its CM line), the others are
+appended to the requester's log file.
+"""
+
+import fcntl
+import json
+import os
+import time
+
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from . import gitcmd
+
+SPOOL_DIR = 'trops-spool'
+LOCK_FILE = 'trops-commit.lock'
+# Placeholder for the commit hash in FL log lines
+HASH = '<commit>'
+
+
+class CommitResult(NamedTuple):
+    # Short hash of the commit holding the file, None if it did not change
+    commit: Optional[str]
+    # First line of git commit's output, e.g. "[main 1a2b3c4] Update etc/hosts"
+    summary: str = ''
+
+
+class CommitQueue:
+
+    def __init__(self, git_dir: str, git_cmd: List[str], work_tree: str):
+        self.git_dir = git_dir
+        self.git_cmd = git_cmd
+        self.work_tree = work_tree
+        self.spool = os.path.join(git_dir, SPOOL_DIR)
+
+    def _spool_entry(self, entry: Dict) -> str:
+        os.makedirs(self.spool, exist_ok=True)
+        name = f'{time.time_ns():020d}-{ os.getpid() }-{ os.urandom(4).hex() }'
+        tmp_path = os.path.join(self.spool, f'.{ name }')
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        # Readers only see complete entries
+        os.replace(tmp_path, os.path.join(self.spool, name))
+        return name
+
+    def _pending(self) -> List[str]:
+        try:
+            return sorted(n for n in os.listdir(self.spool) if not n.startswith('.'))
+        except FileNotFoundError:
+            return []
+
+    def _take(self) -> List[tuple]:
+        """Read and remove the spooled entries, oldest first."""
+        entries = []
+        for name in self._pending():
+            path = os.path.join(self.spool, name)
+            try:
+                with open(path) as f:
+                    entries.append((name, json.load(f)))
+            except (OSError, ValueError):
+                pass
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def submit(self, rel_path: str, message: str, log_line: str, logfile: str, log_prefix: str) -> Optional[CommitResult]:
+        """Queue rel_path for commit and drain the queue if nobody else does.
+
+        Returns this request's result when this process committed it, or
+        None when another process holds the lock and will commit it.
+        """
+        results = self.submit_many([(rel_path, message, log_line)], logfile, log_prefix)
+        return None if results is None else results[0]
+
+    def submit_many(self, requests: List[Tuple[str, str, str]], logfile: str,
+                    log_prefix: str) -> Optional[List[CommitResult]]:
+        """submit() for several (rel_path, message, log_line) requests at once;
+        they end up in the same commit when this process drains."""
+        entries = [{'path': rel_path, 'message': message, 'log': log_line, 'logfile': logfile, 'prefix': log_prefix}
+                   for rel_path, message, log_line in requests]
+        try:
+            own = [self._spool_entry(entry) for entry in entries]
+        except OSError:
+            # The git dir is not writable for us (e.g. owned by root with
+            # sudo = True): commit directly, as before the queue
+            direct = [(str(i), entry) for i, entry in enumerate(entries)]
+            results = self._commit(direct, {name for name, _ in direct})
+            return [results[name] for name, _ in direct]
+        results = self.drain(set(own))
+        if results is None:
+            return None
+        return [results.get(name, CommitResult(None)) for name in own]
+
+    def drain(self, own: Set[str] = frozenset()) -> Optional[Dict[str, CommitResult]]:
+        """Commit the spooled entries while the lock can be taken.
+
+        Returns results by entry name, or None if the lock was held. FL
+        lines of the entries in own are left to the caller.
+        """
+        lock_fd = os.open(os.path.join(self.git_dir, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            results: Dict[str, CommitResult] = {}
+            locked = False
+            while True:
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # the holder drains what was spooled before it unlocks
+                    return results if locked else None
+                locked = True
+                try:
+                    entries = self._take()
+                    if entries:
+                        results.update(self._commit(entries, own))
+                finally:
+                    fcntl.flock(lock_fd, fcntl.LOCK_UN)
+                # Entries spooled while we committed found the lock taken
+                if not self._pending():
+                    return results
+        finally:
+            os.close(lock_fd)
+
+    def _commit(self, entries: List[tuple], own: Set[str]) -> Dict[str, CommitResult]:
+        paths = list(dict.fromkeys(entry['path'] for _, entry in entries))
+        paths = [p for p in paths if os.path.lexists(os.path.join(self.work_tree, p))]
+        none = {name: CommitResult(None) for name, _ in entries}
+        if not paths:
+            return none
+        gitcmd.run(self.git_cmd + ['add', '--'] + paths, capture_output=True)
+        messages = list(dict.fromkeys(entry['message'] for _, entry in entries))
+        if len(messages) == 1:
+            message = messages[0]
+        else:
+            message = f'Update { len(paths) } files\n\n' + '\n'.join(messages)
+        result = gitcmd.run(self.git_cmd + ['commit', '-m', message, '--'] + paths, capture_output=True)
+        if result.returncode != 0:
+            return none
+        summary = result.stdout.decode('utf-8', errors='replace').splitlines()[0]
+        out = gitcmd.run(self.git_cmd + ['show', '--name-only', '-z', '--format=%h', 'HEAD'],
+                         capture_output=True).stdout.decode('utf-8', errors='replace')
+        # "<hash>\0\n<path>\0<path>\0"
+        commit, _, names = out.partition('\0')
+        changed = set(n for n in names.lstrip('\n').split('\0') if n)
+        results = {}
+        for name, entry in entries:
+            if entry['path'] not in changed:
+                results[name] = CommitResult(None)
+                continue
+            results[name] = CommitResult(commit, summary)
+        self._log_others(entries, results, own)
+        return results
+
+    def _log_others(self, entries: List[tuple], results: Dict[str, CommitResult], own: Set[str]) -> None:
+        """Append the FL lines of the committed entries, except own, to their logs."""
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        for name, entry in entries:
+            commit = results[name].commit
+            if commit is None or name in own or not entry.get('logfile'):
+                continue
+            line = entry['log'].replace(HASH, commit, 1)
+            try:
+                with open(entry['logfile'], 'a') as f:
+                    f.write(f"{ stamp } { entry['prefix'] } INFO { line }\n")
+            except OSError:
+                pass
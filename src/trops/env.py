@@ -1,10 +1,10 @@
 import os
-import subprocess
 
 from configparser import ConfigParser
 from shutil import rmtree
 from textwrap import dedent
 
+from . import gitcmd
 from .utils import absolute_path, yes_or_no
 from .trops import TropsError
 
@@ -115,17 +115,17 @@ class TropsEnv:
         if not git_conf.has_option('status', 'showUntrackedFiles'):
             cmd = git_cmd + ['config', '--local',
                              'status.showUntrackedFiles', 'no']
-            subprocess.call(cmd)
+            gitcmd.call(cmd)
         # Set $USER as user.name
         if not git_conf.has_option('user', 'name'):
             username = os.environ['USER']
             cmd = git_cmd + ['config', '--local', 'user.name', username]
-            subprocess.call(cmd)
+            gitcmd.call(cmd)
         # Set $USER@$HOSTNAME as user.email
         if not git_conf.has_option('user', 'email'):
             useremail = username + '@' + os.uname().nodename
             cmd = git_cmd + ['config', '--local', 'user.email', useremail]
-            subprocess.call(cmd)
+            gitcmd.call(cmd)
 
     def _setup_bare_git_repo(self):
 
@@ -133,7 +133,7 @@ class TropsEnv:
         # Create trops's bare git directory
         if not os.path.isdir(self.trops_git_dir):
             cmd = ['git', 'init', '--bare', self.trops_git_dir]
-            result = subprocess.run(cmd, capture_output=True)
+            result = gitcmd.run(cmd, capture_output=True)
             if result.returncode == 0:
                 print(result.stdout.decode('utf-8'))
             else:
@@ -143,13 +143,13 @@ class TropsEnv:
         self.setup_git_config(self.trops_git_dir)
 
         cmd = git_cmd + ['branch', '--show-current']
-        branch_name = subprocess.check_output(cmd).decode("utf-8").strip()
+        branch_name = gitcmd.check_output(cmd).decode("utf-8").strip()
         new_branch_name = self.trops_git_branch
         print(f'new_branch_name = {new_branch_name}')
         if new_branch_name not in branch_name:
             cmd = git_cmd + ['--work-tree=/',
                              'checkout', '-b', new_branch_name]
-            subprocess.call(cmd)
+            gitcmd.call(cmd)
 
     def create(self):
 
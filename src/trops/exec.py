@@ -51,6 +51,16 @@ def _lazy_view_subparsers(subparsers):
     add_view_subparsers(subparsers)
 
 
+def _lazy_stats_subparsers(subparsers):
+    from .stats import add_stats_subparsers
+    add_stats_subparsers(subparsers)
+
+
+def _lazy_watch_subparsers(subparsers):
+    from .watch import add_watch_subparsers
+    add_watch_subparsers(subparsers)
+
+
 def _lazy_tablog_subparsers(subparsers):
     from .tablog import add_tablog_subparsers
     add_tablog_subparsers(subparsers)
@@ -161,7 +171,9 @@ _SUBCOMMAND_REGISTRARS = {
     'repo': _lazy_repo_subparsers,
     'view': _lazy_view_subparsers,
     'show': add_show_subparsers,
+    'stats': _lazy_stats_subparsers,
     'touch': add_touch_subparsers,
+    'watch': _lazy_watch_subparsers,
 }
 
 
@@ -189,6 +201,8 @@ def main():
     subparsers = parser.add_subparsers()
     parser.add_argument('-v', '--version', action='version',
                         version=f'%(prog)s {__version__}')
+    parser.add_argument('--profile', action='store_true',
+                        help='print a summary of the git calls made at exit (to stderr)')
 
     cmd = _detect_subcommand(sys.argv)
     if cmd is not None:
@@ -211,3 +225,7 @@ def main():
     except TropsError as e:
         print(str(e), file=sys.stderr)
         raise SystemExit(1)
+    finally:
+        if args.profile:
+            from . import gitcmd
+            print(gitcmd.summary(), file=sys.stderr)
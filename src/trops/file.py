@@ -1,8 +1,8 @@
 import os
-import subprocess
 
 from textwrap import dedent
 
+from . import gitcmd
 from .trops import TropsBase, TropsError
 from .utils import absolute_path, strtobool
 
@@ -40,12 +40,12 @@ class TropsFile(TropsBase):
 
         os.chdir(self.work_tree)
         cmd = self.git_cmd + ['ls-files']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def put(self):
 
         cmd = self.git_cmd + ['checkout', self.path]
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
 
 def file_list(args, other_args):
@@ -0,0 +1,225 @@
+"""git fsmonitor hook for ``trops check``.
+
+The work tree of an env is often ``/``, and ``git status`` lstat()s every
+tracked path one after the other, which takes long on network filesystems.
+``trops check`` runs ``git status`` with ``core.fsmonitor`` pointing at this
+module (``python -m trops.fsmonitor <git_dir> <work_tree> <jobs>``), which
+answers git's hook protocol (version 2): git passes the token of its last
+query and gets a new token followed by the paths that may have changed
+since, and only lstat()s those. The answer comes from:
+
+  - the journal of a running ``trops watch`` (``$GIT_DIR/trops-fsmonitor.journal``,
+    ``<time_ns> <path>`` lines of the tracked paths it saw change), when the
+    watcher has been running since before the token was issued: no lstat()
+    at all;
+  - otherwise a scan that lstat()s the tracked paths over a thread pool and
+    compares them with the stat cache of the previous answer
+    (``$GIT_DIR/trops-statcache.json``).
+
+When neither can tell, the answer is ``/`` (everything may have changed),
+and git checks every path itself as without the hook.
+"""
+
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from . import gitcmd
+
+JOURNAL = 'trops-fsmonitor.journal'
+WATCH_PID = 'trops-watch.pid'
+STAT_CACHE = 'trops-statcache.json'
+TOKEN_PREFIX = 'trops:'
+# Files modified this close to a scan are reported again by the next one,
+# as a change within the timestamp granularity could go unnoticed
+RACY_NS = 2 * 10**9
+# Journal lines recorded this long before a token still count: the watcher
+# stamps an event when it reads it, not when the write happened
+JOURNAL_SLACK_NS = 5 * 10**9
+# Below this many paths a thread pool costs more than it saves
+PARALLEL_MIN = 256
+
+
+def default_jobs() -> int:
+    # lstat() mostly waits on the filesystem; same default as ThreadPoolExecutor
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _stat(path: str) -> Optional[list]:
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode, st.st_uid, st.st_gid]
+
+
+def lstat_many(root: str, rel_paths: List[str], jobs: int) -> List[Optional[list]]:
+    """Stat tuples of rel_paths under root (None for missing ones), in order."""
+    paths = [os.path.join(root, rel_path) for rel_path in rel_paths]
+    if jobs <= 1 or len(paths) < PARALLEL_MIN:
+        return [_stat(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_stat, paths, chunksize=64))
+
+
+def new_token() -> str:
+    return f'{ TOKEN_PREFIX }{ time.time_ns() }'
+
+
+def _token_ns(token: str) -> Optional[int]:
+    if not token.startswith(TOKEN_PREFIX):
+        return None
+    try:
+        return int(token[len(TOKEN_PREFIX):])
+    except ValueError:
+        return None
+
+
+def tracked_paths(git_dir: str, work_tree: str) -> List[str]:
+    out = gitcmd.check_output(['git', f'--git-dir={ git_dir }', f'--work-tree={ work_tree }', 'ls-files', '-z'])
+    return [p for p in os.fsdecode(out).split('\0') if p]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def start_journal(git_dir: str) -> None:
+    """Called by trops watch when it starts: a fresh journal, valid from now."""
+    with open(os.path.join(git_dir, JOURNAL), 'w'):
+        pass
+    tmp_path = os.path.join(git_dir, f'.{ WATCH_PID }')
+    with open(tmp_path, 'w') as f:
+        f.write(f'{ os.getpid() } { time.time_ns() }\n')
+    os.replace(tmp_path, os.path.join(git_dir, WATCH_PID))
+
+
+def stop_journal(git_dir: str) -> None:
+    try:
+        with open(os.path.join(git_dir, WATCH_PID)) as f:
+            pid = int(f.read().split()[0])
+        if pid == os.getpid():
+            os.unlink(os.path.join(git_dir, WATCH_PID))
+    except (OSError, ValueError, IndexError):
+        pass
+
+
+def journal_paths(git_dir: str, rel_paths: Iterable[str], max_bytes: int = 1 << 20) -> None:
+    """Record rel_paths as changed now; restarts the journal beyond max_bytes."""
+    path = os.path.join(git_dir, JOURNAL)
+    now = time.time_ns()
+    try:
+        if os.path.getsize(path) > max_bytes:
+            # Tokens from before the restart fall back to a scan
+            start_journal(git_dir)
+        with open(path, 'a') as f:
+            f.write(''.join(f'{ now } { rel_path }\n' for rel_path in rel_paths))
+    except OSError:
+        pass
+
+
+def _from_journal(git_dir: str, since_ns: int) -> Optional[List[str]]:
+    """Paths journaled by a live watcher since since_ns, or None if no
+    watcher has been watching all along."""
+    try:
+        with open(os.path.join(git_dir, WATCH_PID)) as f:
+            pid, started = (int(v) for v in f.read().split())
+    except (OSError, ValueError):
+        return None
+    if started >= since_ns or not _pid_alive(pid):
+        return None
+    changed: Dict[str, None] = {}
+    try:
+        with open(os.path.join(git_dir, JOURNAL)) as f:
+            for line in f:
+                stamp, _, rel_path = line.rstrip('\n').partition(' ')
+                if rel_path and int(stamp) > since_ns - JOURNAL_SLACK_NS:
+                    changed[rel_path] = None
+    except (OSError, ValueError):
+        return None
+    return list(changed)
+
+
+def _load_cache(git_dir: str) -> dict:
+    try:
+        with open(os.path.join(git_dir, STAT_CACHE)) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(git_dir: str, token: str, files: Dict[str, Optional[list]]) -> None:
+    path = os.path.join(git_dir, STAT_CACHE)
+    tmp_path = f'{ path }.{ os.getpid() }'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({'token': token, 'files': files}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def scan(git_dir: str, work_tree: str, token: str, new: str, jobs: int) -> Optional[List[str]]:
+    """Tracked paths whose lstat() differs from the cache saved with token,
+    None if that cache is gone. The current stats are saved with new."""
+    cache = _load_cache(git_dir)
+    rel_paths = tracked_paths(git_dir, work_tree)
+    stats = lstat_many(work_tree, rel_paths, jobs)
+    now = int(new[len(TOKEN_PREFIX):])
+    files = {}
+    for rel_path, st in zip(rel_paths, stats):
+        # A racy entry never matches, so it is reported again next time
+        files[rel_path] = None if st is not None and st[0] > now - RACY_NS else st
+    _save_cache(git_dir, new, files)
+    if cache.get('token') != token:
+        return None
+    old = cache.get('files', {})
+    return [rel_path for rel_path, st in zip(rel_paths, stats)
+            if rel_path not in old or old[rel_path] is None or old[rel_path] != st]
+
+
+def query(git_dir: str, work_tree: str, token: str, jobs: int) -> List[str]:
+    """Answer a version 2 query: the new token followed by the paths
+    changed since token ('/' for all of them)."""
+    new = new_token()
+    since = _token_ns(token)
+    changed = _from_journal(git_dir, since) if since is not None else None
+    if changed is None:
+        changed = scan(git_dir, work_tree, token, new, jobs)
+    return [new] + (['/'] if changed is None else changed)
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    # git appends <version> <token> to the configured command line
+    if len(argv) != 5:
+        print('usage: python -m trops.fsmonitor <git_dir> <work_tree> <jobs> <version> <token>', file=sys.stderr)
+        return 2
+    git_dir, work_tree, jobs, version, token = argv
+    if version != '2':
+        return 1
+    try:
+        answer = query(git_dir, work_tree, token, int(jobs))
+    except (OSError, ValueError) as e:
+        print(f'trops fsmonitor: { e }', file=sys.stderr)
+        return 1
+    sys.stdout.buffer.write(b''.join(os.fsencode(item) + b'\0' for item in answer))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
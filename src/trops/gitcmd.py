@@ -0,0 +1,239 @@
+"""Single entry point for the git subprocesses trops runs.
+
+Every module calls ``gitcmd.run/call/check_output/popen`` instead of the
+``subprocess`` functions for git commands. Each call is recorded with its
+argv, wall time, bytes of stdout, exit status and the chain of trops
+functions that issued it, so ``trops --profile <command>`` can show where
+the forks go. This is also the place for batching, retries and timeouts.
+
+``GitSession`` keeps ``git cat-file --batch-check``/``--batch`` running for
+the lifetime of a trops run, so per-path and per-object questions ("is this
+tracked?", "give me blob X") cost a pipe round trip instead of a fork.
+
+The ``subprocess`` functions are looked up at call time, so tests that
+monkeypatch ``subprocess.run`` keep working.
+"""
+
+import atexit
+import subprocess
+import sys
+import threading
+import time
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Frames of these modules are not part of a call's stack
+_SKIP_MODULES = ('trops.gitcmd',)
+MAX_STACK = 8
+
+
+class GitCall(NamedTuple):
+    argv: List[str]
+    seconds: float
+    stdout_bytes: int
+    returncode: Optional[int]
+    stack: Tuple[str, ...]
+
+
+calls: List[GitCall] = []
+
+
+def _stack() -> Tuple[str, ...]:
+    """Qualified names of the trops functions on the stack, outermost first."""
+    names = []
+    frame = sys._getframe(2)
+    while frame is not None and len(names) < MAX_STACK:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('trops.') and module not in _SKIP_MODULES:
+            code = frame.f_code
+            names.append(getattr(code, 'co_qualname', code.co_name))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+def _record(argv, started, stdout, returncode) -> None:
+    calls.append(GitCall(list(argv), time.monotonic() - started,
+                         len(stdout) if isinstance(stdout, (bytes, str)) else 0,
+                         returncode, _stack()))
+
+
+def run(cmd, **kwargs):
+    """subprocess.run(cmd, **kwargs), recorded."""
+    started = time.monotonic()
+    result = subprocess.run(cmd, **kwargs)
+    _record(cmd, started, getattr(result, 'stdout', None), getattr(result, 'returncode', None))
+    return result
+
+
+def call(cmd, **kwargs) -> int:
+    """subprocess.call(cmd, **kwargs), recorded."""
+    started = time.monotonic()
+    returncode = subprocess.call(cmd, **kwargs)
+    _record(cmd, started, None, returncode)
+    return returncode
+
+
+def check_output(cmd, **kwargs):
+    """subprocess.check_output(cmd, **kwargs), recorded (also when it raises)."""
+    started = time.monotonic()
+    try:
+        output = subprocess.check_output(cmd, **kwargs)
+    except subprocess.CalledProcessError as e:
+        _record(cmd, started, e.output, e.returncode)
+        raise
+    _record(cmd, started, output, 0)
+    return output
+
+
+def popen(cmd, **kwargs):
+    """subprocess.Popen(cmd, **kwargs); recorded when started (stdout is streamed)."""
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, **kwargs)
+    _record(cmd, started, None, None)
+    return proc
+
+
+class GitObject(NamedTuple):
+    oid: str
+    type: str
+    size: int
+    data: Optional[bytes] = None
+
+
+class GitSession:
+    """Long-lived ``git cat-file`` processes answering queries over pipes.
+
+    The processes are started on first use and stopped by close() (or at
+    exit). ``cat-file`` reads the index once, so callers that change the
+    index record it with set_tracked() to keep is_tracked() answers right.
+    """
+
+    def __init__(self, git_cmd: List[str]):
+        self.git_cmd = list(git_cmd)
+        self._procs: Dict[str, subprocess.Popen] = {}
+        self._tracked: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _proc(self, mode: str) -> subprocess.Popen:
+        proc = self._procs.get(mode)
+        if proc is None or proc.poll() is not None:
+            proc = self._procs[mode] = popen(self.git_cmd + ['cat-file', mode],
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL)
+        return proc
+
+    def _query(self, mode: str, spec: str) -> Optional[GitObject]:
+        if not spec or '\n' in spec:
+            return None
+        started = time.monotonic()
+        with self._lock:
+            proc = self._proc(mode)
+            try:
+                proc.stdin.write(spec.encode('utf-8') + b'\n')
+                proc.stdin.flush()
+                header = proc.stdout.readline()
+            except (BrokenPipeError, OSError):
+                header = b''
+            if not header:
+                raise RuntimeError(f"git cat-file {mode} exited (status {proc.poll()})")
+            fields = header.split()
+            # '<oid> <type> <size>', or '<spec> missing' / '<spec> ambiguous'
+            if len(fields) != 3 or fields[1] in (b'missing', b'ambiguous'):
+                obj = None
+            else:
+                obj = GitObject(fields[0].decode(), fields[1].decode(), int(fields[2]))
+                if mode == '--batch':
+                    data = proc.stdout.read(obj.size)
+                    proc.stdout.read(1)  # trailing newline
+                    obj = obj._replace(data=data)
+        _record(self.git_cmd + ['cat-file', mode, spec], started,
+                obj.data if obj is not None else None, 0)
+        return obj
+
+    def info(self, spec: str) -> Optional[GitObject]:
+        """(oid, type, size) of spec, e.g. 'HEAD:etc/hosts', or None if missing."""
+        return self._query('--batch-check', spec)
+
+    def read(self, spec: str) -> Optional[GitObject]:
+        """Like info() but with the object's content in .data."""
+        return self._query('--batch', spec)
+
+    def is_tracked(self, rel_path: str) -> bool:
+        """True if rel_path (relative to the work tree) is in the index."""
+        if rel_path == '..' or rel_path.startswith(('../', '/')):
+            # cat-file dies on paths outside the repository
+            return False
+        tracked = self._tracked.get(rel_path)
+        if tracked is None:
+            tracked = self.info(':' + rel_path) is not None
+        return tracked
+
+    def set_tracked(self, rel_path: str, tracked: bool = True) -> None:
+        self._tracked[rel_path] = tracked
+
+    def close(self) -> None:
+        procs, self._procs = self._procs, {}
+        for proc in procs.values():
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+
+def subcommand(argv) -> str:
+    """'git ls-files' for ['sudo', 'git', '-C', wt, '--git-dir=..', 'ls-files', ...]."""
+    argv = list(argv)
+    try:
+        i = argv.index('git') + 1
+    except ValueError:
+        return ' '.join(argv[:2])
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ('-C', '-c'):
+            i += 2
+        elif arg.startswith('-'):
+            i += 1
+        else:
+            return f'git {arg}'
+    return 'git'
+
+
+def reset() -> None:
+    del calls[:]
+
+
+def summary(records: Optional[List[GitCall]] = None, width: int = 30) -> str:
+    """Flamegraph-style text tree: trops call stacks down to git subcommands."""
+    records = calls if records is None else records
+    if not records:
+        return 'trops profile: no git calls'
+    total = sum(r.seconds for r in records) or 1e-9
+    out_bytes = sum(r.stdout_bytes for r in records)
+    lines = [f'trops profile: {len(records)} git calls, {total * 1000:.1f} ms, {out_bytes} bytes of stdout']
+
+    # node: name -> [seconds, count, children]
+    root = {}
+    for r in records:
+        level = root
+        for name in r.stack + (subcommand(r.argv),):
+            node = level.setdefault(name, [0.0, 0, {}])
+            node[0] += r.seconds
+            node[1] += 1
+            level = node[2]
+
+    def walk(level, depth):
+        for name, (seconds, count, children) in sorted(level.items(), key=lambda kv: -kv[1][0]):
+            bar = '#' * max(1, round(width * seconds / total))
+            label = f"{'  ' * depth}{name}"
+            lines.append(f'{label:<48} {count:>4}x {seconds * 1000:>9.1f} ms  {bar}')
+            walk(children, depth + 1)
+
+    walk(root, 0)
+    return '\n'.join(lines)
@@ -0,0 +1,563 @@
+"""Read-only, in-process access to the objects of a trops git repository.
+
+Supports what trops reads back: loose objects, pack files with v2 ``.idx``
+indexes (memory-mapped, binary searched), OFS/REF deltas with a small cache
+of delta bases, abbreviated object names, loose and packed refs, ``~N``/``^N``
+revision suffixes, commit/tag peeling and tree walks for ``<rev>:<path>``.
+
+Anything else (SHA-256 or reftable repositories, replace refs, ``:path``
+index lookups, ``^{...}`` peeling, ...) raises ``GitObjectError``, and
+callers fall back to running git.
+"""
+
+import mmap
+import os
+import re
+import struct
+import zlib
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+TYPE_NAMES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+OFS_DELTA = 6
+REF_DELTA = 7
+IDX_MAGIC = b'\xfftOc'
+# Delta bases and recently read packed objects kept in memory
+CACHE_BYTES = 32 << 20
+# Larger blobs are streamed by git instead of being read into memory
+INLINE_MAX = 1 << 20
+INFLATE_STEP = 1 << 16
+
+_HEX = re.compile(r'^[0-9a-fA-F]{4,40}$')
+_SUFFIX = re.compile(r'(~\d*|\^\d*)$')
+
+
+class GitObjectError(Exception):
+    """The object or revision cannot be read in-process."""
+    pass
+
+
+def _inflate(buf, pos: int, size: int) -> bytes:
+    d = zlib.decompressobj()
+    parts = []
+    while not d.eof:
+        chunk = buf[pos:pos + INFLATE_STEP]
+        if not chunk:
+            raise GitObjectError('truncated object data')
+        try:
+            parts.append(d.decompress(chunk))
+        except zlib.error as e:
+            raise GitObjectError(f'corrupt object data: {e}')
+        pos += INFLATE_STEP
+    data = b''.join(parts)
+    if len(data) != size:
+        raise GitObjectError('object size mismatch')
+    return data
+
+
+def _inflate_head(chunks, n: int) -> bytes:
+    """First n bytes (or fewer, at the end) of a zlib stream given as chunks."""
+    d = zlib.decompressobj()
+    out = b''
+    try:
+        for chunk in chunks:
+            out += d.decompress(chunk, n - len(out))
+            if len(out) >= n or d.eof:
+                break
+    except zlib.error as e:
+        raise GitObjectError(f'corrupt object data: {e}')
+    return out
+
+
+def _delta_size(delta: bytes, pos: int) -> Tuple[int, int]:
+    size = shift = 0
+    while True:
+        c = delta[pos]
+        pos += 1
+        size |= (c & 0x7f) << shift
+        shift += 7
+        if not c & 0x80:
+            return size, pos
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Apply a git pack delta to base."""
+    src_size, pos = _delta_size(delta, 0)
+    dst_size, pos = _delta_size(delta, pos)
+    if src_size != len(base):
+        raise GitObjectError('delta base size mismatch')
+    out = bytearray()
+    end = len(delta)
+    while pos < end:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset:offset + (size or 0x10000)]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise GitObjectError('invalid delta opcode')
+    if len(out) != dst_size:
+        raise GitObjectError('delta result size mismatch')
+    return bytes(out)
+
+
+class PackIndex:
+    """A v2 pack index and its pack, both memory-mapped on first use."""
+
+    def __init__(self, idx_path: str):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-4] + '.pack'
+        with open(idx_path, 'rb') as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.idx[:4] != IDX_MAGIC or struct.unpack_from('>I', self.idx, 4)[0] != 2:
+            raise GitObjectError(f'unsupported pack index: {idx_path}')
+        self.fanout = struct.unpack_from('>256I', self.idx, 8)
+        self.count = self.fanout[255]
+        self._sha_base = 8 + 1024
+        self._off_base = self._sha_base + 24 * self.count  # oids, then crc32s
+        self._large_base = self._off_base + 4 * self.count
+        self._pack = None
+
+    @property
+    def pack(self):
+        if self._pack is None:
+            with open(self.pack_path, 'rb') as f:
+                self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._pack
+
+    def _oid(self, i: int) -> bytes:
+        start = self._sha_base + 20 * i
+        return self.idx[start:start + 20]
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo = self.fanout[key[0] - 1] if key[0] else 0
+        hi = self.fanout[key[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._oid(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, oid: bytes) -> Optional[int]:
+        """Pack offset of the object with binary name oid, or None."""
+        i = self._lower_bound(oid)
+        if i < self.count and self._oid(i) == oid:
+            return self._offset(i)
+        return None
+
+    def _offset(self, i: int) -> int:
+        offset = struct.unpack_from('>I', self.idx, self._off_base + 4 * i)[0]
+        if offset & 0x80000000:
+            offset = struct.unpack_from('>Q', self.idx, self._large_base + 8 * (offset & 0x7fffffff))[0]
+        return offset
+
+    def with_prefix(self, prefix: str, limit: int = 2) -> List[str]:
+        """Hex names starting with prefix (at most limit of them)."""
+        i = self._lower_bound(bytes.fromhex(prefix.ljust(40, '0')))
+        found = []
+        while i < self.count and len(found) < limit:
+            oid = self._oid(i).hex()
+            if not oid.startswith(prefix):
+                break
+            found.append(oid)
+            i += 1
+        return found
+
+    def close(self) -> None:
+        self.idx.close()
+        if self._pack is not None:
+            self._pack.close()
+
+
+class ObjectStore:
+    """Objects, refs and trees of one git directory."""
+
+    def __init__(self, git_dir: str, cache_bytes: int = CACHE_BYTES):
+        self.git_dir = git_dir
+        self._check_supported()
+        self.object_dirs = self._object_dirs(os.path.join(git_dir, 'objects'))
+        self._packs = None
+        self._cache: 'OrderedDict[Tuple[str, int], Tuple[str, bytes]]' = OrderedDict()
+        self._cache_size = 0
+        self.cache_bytes = cache_bytes
+
+    def _check_supported(self) -> None:
+        if not os.path.isdir(os.path.join(self.git_dir, 'objects')):
+            raise GitObjectError(f'not a git directory: {self.git_dir}')
+        config = os.path.join(self.git_dir, 'config')
+        try:
+            with open(config, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read().lower()
+        except OSError:
+            text = ''
+        if re.search(r'objectformat\s*=\s*sha256|refstorage\s*=\s*reftable', text):
+            raise GitObjectError('SHA-256 and reftable repositories are read through git')
+        if not os.environ.get('GIT_NO_REPLACE_OBJECTS') and self._has_replace_refs():
+            raise GitObjectError('replace refs are applied by git')
+
+    def _has_replace_refs(self) -> bool:
+        for _, _, files in os.walk(os.path.join(self.git_dir, 'refs', 'replace')):
+            if files:
+                return True
+        return any(name.startswith('refs/replace/') for name in self._packed_refs())
+
+    @staticmethod
+    def _object_dirs(objects: str) -> List[str]:
+        dirs = [objects]
+        try:
+            with open(os.path.join(objects, 'info', 'alternates'), 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        dirs.append(os.path.normpath(os.path.join(objects, line)))
+        except OSError:
+            pass
+        return dirs
+
+    @property
+    def packs(self) -> List[PackIndex]:
+        if self._packs is None:
+            packs = []
+            for objects in self.object_dirs:
+                pack_dir = os.path.join(objects, 'pack')
+                try:
+                    names = sorted(os.listdir(pack_dir))
+                except OSError:
+                    continue
+                for name in names:
+                    if name.endswith('.idx') and os.path.isfile(os.path.join(pack_dir, name[:-4] + '.pack')):
+                        packs.append(PackIndex(os.path.join(pack_dir, name)))
+            self._packs = packs
+        return self._packs
+
+    def close(self) -> None:
+        for pack in self._packs or ():
+            pack.close()
+        self._packs = None
+        self._cache.clear()
+        self._cache_size = 0
+
+    # -- objects ----------------------------------------------------------
+
+    def read(self, oid: str) -> Tuple[str, bytes]:
+        """Return (type, content) of the object with full hex name oid."""
+        for objects in self.object_dirs:
+            path = os.path.join(objects, oid[:2], oid[2:])
+            try:
+                with open(path, 'rb') as f:
+                    raw = zlib.decompress(f.read())
+            except FileNotFoundError:
+                continue
+            except (OSError, zlib.error) as e:
+                raise GitObjectError(f'cannot read object {oid}: {e}')
+            header, _, data = raw.partition(b'\0')
+            obj_type, _, size = header.decode('ascii', errors='replace').partition(' ')
+            if not size.isdigit() or int(size) != len(data):
+                raise GitObjectError(f'corrupt loose object {oid}')
+            return obj_type, data
+        binary = bytes.fromhex(oid)
+        for pack in self.packs:
+            offset = pack.find(binary)
+            if offset is not None:
+                return self._read_packed(pack, offset)
+        raise GitObjectError(f'object not found: {oid}')
+
+    def _cache_get(self, key):
+        hit = self._cache.get(key)
+        if hit is not None:
+            self._cache.move_to_end(key)
+        return hit
+
+    def _cache_put(self, key, value) -> None:
+        size = len(value[1])
+        if size > self.cache_bytes // 4:
+            return
+        self._cache[key] = value
+        self._cache_size += size
+        while self._cache_size > self.cache_bytes:
+            _, (_, data) = self._cache.popitem(last=False)
+            self._cache_size -= len(data)
+
+    @staticmethod
+    def _entry(buf, offset: int):
+        """(type number, size, data position, delta base) of a pack entry.
+
+        The delta base is an offset for OFS deltas, a hex name for REF deltas
+        and None otherwise.
+        """
+        pos = offset
+        c = buf[pos]
+        pos += 1
+        type_num = (c >> 4) & 7
+        size = c & 15
+        shift = 4
+        while c & 0x80:
+            c = buf[pos]
+            pos += 1
+            size |= (c & 0x7f) << shift
+            shift += 7
+        base = None
+        if type_num == OFS_DELTA:
+            c = buf[pos]
+            pos += 1
+            distance = c & 0x7f
+            while c & 0x80:
+                c = buf[pos]
+                pos += 1
+                distance = ((distance + 1) << 7) | (c & 0x7f)
+            base = offset - distance
+        elif type_num == REF_DELTA:
+            base = buf[pos:pos + 20].hex()
+            pos += 20
+        elif type_num not in TYPE_NAMES:
+            raise GitObjectError(f'unknown pack object type {type_num}')
+        return type_num, size, pos, base
+
+    def _read_packed(self, pack: PackIndex, offset: int) -> Tuple[str, bytes]:
+        # Walk the delta chain down to a base (or a cached object), then
+        # apply the deltas back up; long chains must not recurse.
+        chain = []
+        while True:
+            key = (pack.pack_path, offset)
+            hit = self._cache_get(key)
+            if hit is not None:
+                obj_type, data = hit
+                break
+            type_num, size, pos, base = self._entry(pack.pack, offset)
+            if type_num == OFS_DELTA:
+                chain.append((key, _inflate(pack.pack, pos, size)))
+                offset = base
+            elif type_num == REF_DELTA:
+                delta = _inflate(pack.pack, pos, size)
+                obj_type, data = self.read(base)
+                data = apply_delta(data, delta)
+                self._cache_put(key, (obj_type, data))
+                break
+            else:
+                obj_type, data = TYPE_NAMES[type_num], _inflate(pack.pack, pos, size)
+                self._cache_put(key, (obj_type, data))
+                break
+        for key, delta in reversed(chain):
+            data = apply_delta(data, delta)
+            self._cache_put(key, (obj_type, data))
+        return obj_type, data
+
+    def info(self, oid: str) -> Tuple[str, int]:
+        """(type, size) of an object without reading its content."""
+        for objects in self.object_dirs:
+            path = os.path.join(objects, oid[:2], oid[2:])
+            try:
+                with open(path, 'rb') as f:
+                    header = _inflate_head(iter(lambda: f.read(256), b''), 64)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                raise GitObjectError(f'cannot read object {oid}: {e}')
+            obj_type, _, size = header.partition(b'\0')[0].decode('ascii', errors='replace').partition(' ')
+            if not size.isdigit():
+                raise GitObjectError(f'corrupt loose object {oid}')
+            return obj_type, int(size)
+        binary = bytes.fromhex(oid)
+        for pack in self.packs:
+            offset = pack.find(binary)
+            if offset is not None:
+                return self._packed_info(pack, offset)
+        raise GitObjectError(f'object not found: {oid}')
+
+    def _packed_info(self, pack: PackIndex, offset: int) -> Tuple[str, int]:
+        hit = self._cache_get((pack.pack_path, offset))
+        if hit is not None:
+            return hit[0], len(hit[1])
+        type_num, size, pos, base = self._entry(pack.pack, offset)
+        if base is None:
+            return TYPE_NAMES[type_num], size
+        # the result size is in the delta's header, the type is the base's
+        buf = pack.pack
+        head = _inflate_head((buf[p:p + 256] for p in range(pos, len(buf), 256)), 20)
+        _, header_end = _delta_size(head, 0)
+        result_size, _ = _delta_size(head, header_end)
+        while isinstance(base, int):
+            type_num, _, _, base = self._entry(pack.pack, base)
+        obj_type = self.info(base)[0] if base is not None else TYPE_NAMES[type_num]
+        return obj_type, result_size
+
+    def expand(self, prefix: str) -> str:
+        """Full hex name for an abbreviated one; errors if missing or ambiguous."""
+        prefix = prefix.lower()
+        if len(prefix) == 40:
+            return prefix
+        found = set()
+        for objects in self.object_dirs:
+            try:
+                names = os.listdir(os.path.join(objects, prefix[:2]))
+            except OSError:
+                continue
+            found.update(prefix[:2] + n for n in names if len(n) == 38 and (prefix[:2] + n).startswith(prefix))
+        for pack in self.packs:
+            found.update(pack.with_prefix(prefix))
+            if len(found) > 1:
+                break
+        if not found:
+            raise GitObjectError(f'unknown revision: {prefix}')
+        if len(found) > 1:
+            raise GitObjectError(f'ambiguous object name: {prefix}')
+        return found.pop()
+
+    # -- refs and revisions -----------------------------------------------
+
+    def _packed_refs(self) -> Dict[str, str]:
+        refs = {}
+        try:
+            with open(os.path.join(self.git_dir, 'packed-refs'), 'r') as f:
+                for line in f:
+                    if line.startswith(('#', '^')):
+                        continue
+                    oid, _, name = line.strip().partition(' ')
+                    if name:
+                        refs[name] = oid
+        except OSError:
+            pass
+        return refs
+
+    def _read_ref(self, name: str, depth: int = 0) -> Optional[str]:
+        if depth > 5:
+            raise GitObjectError(f'symbolic ref loop: {name}')
+        path = os.path.join(self.git_dir, name)
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                value = f.read().strip()
+            if value.startswith('ref: '):
+                return self._read_ref(value[5:], depth + 1)
+            return value if len(value) == 40 and _HEX.match(value) else None
+        return self._packed_refs().get(name)
+
+    def resolve_ref(self, name: str) -> Optional[str]:
+        """Resolve a ref name the way git's rev-parse dwims it."""
+        if '..' in name or name.startswith('/'):
+            return None
+        for candidate in (name, f'refs/{name}', f'refs/tags/{name}', f'refs/heads/{name}',
+                          f'refs/remotes/{name}', f'refs/remotes/{name}/HEAD'):
+            oid = self._read_ref(candidate)
+            if oid:
+                return oid
+        return None
+
+    def peel(self, oid: str, want: str) -> str:
+        """Follow tags (and commit -> tree) until an object of type want."""
+        for _ in range(16):
+            obj_type, data = self.read(oid)
+            if obj_type == want:
+                return oid
+            if obj_type == 'tag':
+                oid = _header(data, b'object')
+            elif obj_type == 'commit' and want == 'tree':
+                oid = _header(data, b'tree')
+            else:
+                raise GitObjectError(f'{oid} is a {obj_type}, not a {want}')
+        raise GitObjectError(f'tag chain too long at {oid}')
+
+    def resolve_rev(self, rev: str) -> str:
+        """Object name for a revision: ref, (abbreviated) hex, with ~N/^N suffixes."""
+        m = _SUFFIX.search(rev)
+        if m and m.start() > 0:
+            oid = self.peel(self.resolve_rev(rev[:m.start()]), 'commit')
+            suffix = m.group()
+            count = int(suffix[1:]) if suffix[1:] else 1
+            if suffix[0] == '~':
+                for _ in range(count):
+                    oid = self._parent(oid, 1)
+                return oid
+            return self._parent(oid, count) if count else oid
+        if not rev or any(c in rev for c in '^{}@:'):
+            raise GitObjectError(f'unsupported revision: {rev}')
+        if len(rev) == 40 and _HEX.match(rev):
+            return rev.lower()
+        oid = self.resolve_ref(rev)
+        if oid:
+            return oid
+        if _HEX.match(rev):
+            return self.expand(rev)
+        raise GitObjectError(f'unknown revision: {rev}')
+
+    def _parent(self, oid: str, n: int) -> str:
+        _, data = self.read(self.peel(oid, 'commit'))
+        parents = _headers(data, b'parent')
+        if n > len(parents):
+            raise GitObjectError(f'{oid} has no parent {n}')
+        return parents[n - 1]
+
+    def resolve(self, spec: str) -> str:
+        """Object name for '<rev>' or '<rev>:<path>'."""
+        rev, sep, path = spec.partition(':')
+        if not rev:
+            raise GitObjectError(f'unsupported object name: {spec}')
+        oid = self.resolve_rev(rev)
+        if not sep:
+            return oid
+        oid = self.peel(oid, 'tree')
+        for part in path.split('/'):
+            if not part or part == '.':
+                continue
+            mode, oid = self.tree_entry(oid, part)
+            if mode == '160000':
+                raise GitObjectError(f'{path} is a submodule')
+        return oid
+
+    def tree_entry(self, tree_oid: str, name: str) -> Tuple[str, str]:
+        """(mode, oid) of name in a tree."""
+        for mode, entry, oid in self.tree_entries(tree_oid):
+            if entry == name:
+                return mode, oid
+        raise GitObjectError(f'path not found: {name}')
+
+    def tree_entries(self, tree_oid: str):
+        """Yield (mode, name, hex oid) of a tree's entries."""
+        obj_type, data = self.read(tree_oid)
+        if obj_type != 'tree':
+            raise GitObjectError(f'{tree_oid} is a {obj_type}, not a tree')
+        pos = 0
+        end = len(data)
+        while pos < end:
+            space = data.index(b' ', pos)
+            nul = data.index(b'\0', space)
+            yield (data[pos:space].decode('ascii'), data[space + 1:nul].decode('utf-8', errors='surrogateescape'),
+                   data[nul + 1:nul + 21].hex())
+            pos = nul + 21
+
+    def read_spec(self, spec: str) -> Tuple[str, str, bytes]:
+        """(oid, type, content) for a revision or '<rev>:<path>'."""
+        oid = self.resolve(spec)
+        obj_type, data = self.read(oid)
+        return oid, obj_type, data
+
+
+def _headers(data: bytes, key: bytes) -> List[str]:
+    values = []
+    for line in data.split(b'\n'):
+        if not line:
+            break
+        name, _, value = line.partition(b' ')
+        if name == key:
+            values.append(value.decode('ascii'))
+    return values
+
+
+def _header(data: bytes, key: bytes) -> str:
+    values = _headers(data, key)
+    if not values:
+        raise GitObjectError(f'missing {key.decode()} header')
+    return values[0]
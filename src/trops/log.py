@@ -1,9 +1,14 @@
 import os
+import re
 import time
 
 from configparser import ConfigParser
 from textwrap import dedent
 
+from . import savemark
+from .logarchive import iter_segment_lines, list_segments, read_index, segment_may_match
+from .logparse import parse_time_bound
+from .logseek import filter_window, read_window
 from .trops import TropsCLI, TropsError
 from .utils import pick_out_repo_name_from_git_remote
 
@@ -20,14 +25,26 @@ class TropsLog(TropsCLI):
 
         # If --tags is specified, override environment/config tags
         if hasattr(self.args, 'tags') and self.args.tags:
-            self.trops_tags = self.args.tags.replace(' ', '')
-            # Recompute primary tag
-            if ',' in self.trops_tags:
-                self.trops_prim_tag = self.trops_tags.split(',')[0]
-            elif ';' in self.trops_tags:
-                self.trops_prim_tag = self.trops_tags.split(';')[0]
+            if TagFilter.is_expression(self.args.tags):
+                # Boolean expression such as "#123 AND NOT test"
+                self.trops_tags = ' '.join(self.args.tags.split())
+                self.trops_prim_tag = TagFilter(self.trops_tags).tags[0]
             else:
-                self.trops_prim_tag = self.trops_tags
+                self.trops_tags = self.args.tags.replace(' ', '')
+                # Recompute primary tag
+                if ',' in self.trops_tags:
+                    self.trops_prim_tag = self.trops_tags.split(',')[0]
+                elif ';' in self.trops_tags:
+                    self.trops_prim_tag = self.trops_tags.split(';')[0]
+                else:
+                    self.trops_prim_tag = self.trops_tags
+
+        # Time window (--since/--until), read by binary search over the log
+        try:
+            self.since = parse_time_bound(args.since) if getattr(args, 'since', None) else None
+            self.until = parse_time_bound(args.until, end=True) if getattr(args, 'until', None) else None
+        except ValueError as e:
+            raise TropsError(f'ERROR: {e}')
 
         # Defer strict enforcement; allow reading log even outside env when possible
 
@@ -37,10 +54,91 @@ class TropsLog(TropsCLI):
         while True:
             line = file.readline()
             if not line:
+                # After a rotation, continue with the new live log
+                try:
+                    rotated = os.stat(file.name).st_ino != os.fstat(file.fileno()).st_ino
+                except OSError:
+                    rotated = False
+                if rotated:
+                    file.close()
+                    file = open(file.name, 'r')
+                    continue
                 time.sleep(0.1)
                 continue
             yield line
 
+    def _scan_filter(self, log_file):
+        """Return the (kind, value) filter for logscan, or None to read the log in-process.
+
+        The parallel scan is used for SID/tag filters without --tail when the
+        log is at least log_scan_threshold bytes, or when --jobs > 1 is given.
+        """
+        jobs = getattr(self.args, 'jobs', None)
+        if self.args.tail or getattr(self.args, 'all', False) or jobs == 1:
+            return None
+        if getattr(self, 'trops_tags', None):
+            # compile here so a bad expression fails before workers start
+            TagFilter(self.trops_tags)
+            scan_filter = ('tags', self.trops_tags)
+        elif getattr(self, 'trops_sid', None):
+            scan_filter = ('sid', self.trops_sid)
+        else:
+            return None
+        if jobs is None:
+            from .logscan import DEFAULT_THRESHOLD
+            threshold = int(self.get_config_value('log_scan_threshold', default=str(DEFAULT_THRESHOLD)))
+            if os.path.getsize(log_file) < threshold:
+                return None
+        return scan_filter
+
+    def _filter_lines(self, lines):
+        """Apply --all / tag / SID filtering to stripped lines."""
+        # Default to all lines when no filters are provided
+        if getattr(self.args, 'all', False):
+            return lines
+        elif getattr(self, 'trops_tags', None):
+            # Match self.trops_tags (any of a tag list, or an expression) against TROPS_TAGS in line
+            tag_filter = TagFilter(self.trops_tags)
+            return [line for line in lines if tag_filter(line)]
+        elif getattr(self, 'trops_sid', None):
+            # Only filter by SID when it's truthy
+            keyword = f'TROPS_SID={self.trops_sid}'
+            return [line for line in lines if keyword in line]
+        return lines
+
+    def _archived_lines(self, segments, tail=None):
+        """Stripped lines of rotated segments, oldest first.
+
+        With tail, only the last tail lines, reading the newest segments
+        first. Otherwise segments whose index rules out the tag/SID filter
+        are not decompressed.
+        """
+        if tail:
+            lines = []
+            for segment in reversed(segments):
+                seg_lines = [l.decode('utf-8', errors='replace').strip() for l in iter_segment_lines(segment)]
+                lines = seg_lines[-(tail - len(lines)):] + lines
+                if len(lines) >= tail:
+                    break
+            return lines
+
+        sid = tag_filter = None
+        if not getattr(self.args, 'all', False):
+            if getattr(self, 'trops_tags', None):
+                tag_filter = TagFilter(self.trops_tags)
+            elif getattr(self, 'trops_sid', None):
+                sid = self.trops_sid
+        windowed = self.since is not None or self.until is not None
+        lines = []
+        for segment in segments:
+            if segment_may_match(read_index(segment), sid=sid, tag_filter=tag_filter,
+                                 since=self.since, until=self.until):
+                seg_lines = iter_segment_lines(segment)
+                if windowed:
+                    seg_lines = filter_window(seg_lines, self.since, self.until)
+                lines.extend(l.decode('utf-8', errors='replace').strip() for l in seg_lines)
+        return lines
+
     def log(self):
         """Print trops log"""
 
@@ -51,26 +149,38 @@ class TropsLog(TropsCLI):
             os.makedirs(os.path.dirname(input_log_file), exist_ok=True)
             open(input_log_file, 'a').close()
 
-        with open(input_log_file) as ff:
+        segments = list_segments(input_log_file)
+        windowed = self.since is not None or self.until is not None
+        scan_filter = None if windowed else self._scan_filter(input_log_file)
+        if scan_filter:
+            # Large log and a SID/tag filter: scan chunks in worker processes
+            from .logscan import scan
+            target_lines = self._filter_lines(self._archived_lines(segments))
+            target_lines += scan(input_log_file, *scan_filter, jobs=getattr(self.args, 'jobs', None))
+        elif windowed:
+            # Only the window of the live log is read, found by binary search
+            lines = self._archived_lines(segments)
+            lines += [l.decode('utf-8', errors='replace').strip()
+                      for l in read_window(input_log_file, self.since, self.until)]
             if self.args.tail:
-                lines = ff.readlines()[-self.args.tail:]
-            else:
-                lines = ff.readlines()
-            # strip \n in items
-            lines = list(map(lambda x:x.strip(),lines))
-
-            # Default to all lines when no filters are provided
-            if getattr(self.args, 'all', False):
-                target_lines = lines
-            elif getattr(self, 'trops_tags', None):
-                # Match any tag element in self.trops_tags against TROPS_TAGS in line
-                target_lines = [line for line in lines if check_tags(self.trops_tags, line)]
-            elif getattr(self, 'trops_sid', None):
-                # Only filter by SID when it's truthy
-                keyword = f'TROPS_SID={self.trops_sid}'
-                target_lines = [line for line in lines if keyword in line]
-            else:
-                target_lines = lines
+                lines = lines[-self.args.tail:]
+            target_lines = self._filter_lines(lines)
+        else:
+            with open(input_log_file) as ff:
+                if self.args.tail:
+                    lines = ff.readlines()[-self.args.tail:]
+                else:
+                    lines = ff.readlines()
+                # strip \n in items
+                lines = list(map(lambda x:x.strip(),lines))
+
+            if segments:
+                if not self.args.tail:
+                    lines = self._archived_lines(segments) + lines
+                elif len(lines) < self.args.tail:
+                    lines = self._archived_lines(segments, tail=self.args.tail - len(lines)) + lines
+
+            target_lines = self._filter_lines(lines)
 
         if self.args.save:
             self._save_log(target_lines)
@@ -79,13 +189,14 @@ class TropsLog(TropsCLI):
 
         if self.args.follow:
             ff = open(input_log_file, "r")
+            tag_filter = TagFilter(self.trops_tags) if getattr(self, 'trops_tags', None) else None
             try:
                 lines = self._follow(ff)
                 for line in lines:
                     if getattr(self.args, 'all', False):
                         print(line, end='')
-                    elif getattr(self, 'trops_tags', None):
-                        if check_tags(self.trops_tags, line):
+                    elif tag_filter:
+                        if tag_filter(line):
                             print(line, end='')
                     elif getattr(self, 'trops_sid', None):
                         keyword = f'TROPS_SID={self.trops_sid}'
@@ -115,7 +226,9 @@ class TropsLog(TropsCLI):
         elif not self.trops_tags:
             raise TropsError("You don't have a tag. Please set a tag or add --name <name> option")
         else:
-            if ',' in self.trops_tags:
+            if getattr(self, 'trops_prim_tag', None):
+                primary_tag = self.trops_prim_tag
+            elif ',' in self.trops_tags:
                 primary_tag = self.trops_tags.split(',')[0]
             elif ';' in self.trops_tags:
                 primary_tag = self.trops_tags.split(';')[0]
@@ -132,45 +245,172 @@ class TropsLog(TropsCLI):
 
         file_path = log_dir + '/' + file_name
 
-        with open(file_path, mode='w') as f:
-            f.writelines(s + '\n' for s in target_lines)
+        content = ''.join(s + '\n' for s in target_lines)
+        # Appends only the lines added since the last save
+        if savemark.save(self.trops_dir, file_path, content):
+            self._touch_file(file_path)
+
+class TagFilter:
+    """Compiled matcher for the TROPS_TAGS field of log lines.
+
+    The expression is parsed once; calling the filter with a line only
+    extracts the TROPS_TAGS value and tests it, without building sets for
+    plain tag lists. Syntax, loosest binding first:
+
+        expr  := and { OR and }
+        and   := not { [AND] not }
+        not   := NOT not | atom
+        atom  := tag { (,|;) tag } | ( expr )
+
+    so "#123,TEST" matches either tag and "#123,#124 AND NOT test" means
+    (#123 or #124) and not test. The operators are case-sensitive.
+    """
+
+    _TOKEN = re.compile(r'\s*(\(|\)|[,;]|[^\s(),;]+)')
+    _OPERATORS = ('AND', 'OR', 'NOT')
+    _FIELD = 'TROPS_TAGS='
+    _VALUE = re.compile(r'\s*(\S*)')
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tags = []
+        self._tokens = self._TOKEN.findall(expression or '')
+        self._pos = 0
+        if all(t in ',;' for t in self._tokens):
+            # empty tag list never matches
+            self._test = None
+            return
+        tree = self._tree = self._parse_or()
+        if self._pos != len(self._tokens):
+            self._error(f"unexpected '{self._tokens[self._pos]}'")
+        if tree[0] == 'any':
+            # Plain tag list: one regex search over the field value
+            alternatives = '|'.join(re.escape(t) for t in tree[1])
+            pattern = re.compile(rf'(?:^|[,;])\s*(?:{alternatives})\s*(?=[,;]|$)')
+            self._test = lambda value: pattern.search(value) is not None
+        else:
+            evaluate = self._compile(tree)
+            self._test = lambda value: evaluate(frozenset(t.strip() for t in re.split(r'[,;]', value)))
+
+    @classmethod
+    def is_expression(cls, text: str) -> bool:
+        """True if text uses operators or parentheses rather than a plain tag list."""
+        return any(t in cls._OPERATORS or t in '()' for t in cls._TOKEN.findall(text or ''))
+
+    def __call__(self, line: str) -> bool:
+        if self._test is None:
+            return False
+        idx = line.find(self._FIELD)
+        if idx == -1:
+            return False
+        return self.match_value(self._VALUE.match(line, idx + len(self._FIELD)).group(1))
+
+    def match_value(self, value: str) -> bool:
+        """Test an already extracted TROPS_TAGS value such as "#123,prod"."""
+        if not value or self._test is None:
+            return False
+        return self._test(value)
+
+    def could_match(self, tags) -> bool:
+        """False if no line whose tags are a subset of tags can match.
+
+        Used to skip archived log segments by their tag index.
+        """
+        if self._test is None:
+            return False
+        present = frozenset(tags)
+
+        def possible(node):
+            kind, arg = node
+            if kind == 'any':
+                return not present.isdisjoint(arg)
+            if kind == 'not':
+                return True
+            if kind == 'and':
+                return all(possible(n) for n in arg)
+            return any(possible(n) for n in arg)
+
+        return possible(self._tree)
+
+    def _error(self, reason):
+        raise TropsError(f"ERROR: invalid tag expression '{self.expression}': {reason}")
+
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _parse_or(self):
+        nodes = [self._parse_and()]
+        while self._peek() == 'OR':
+            self._pos += 1
+            nodes.append(self._parse_and())
+        if len(nodes) == 1:
+            return nodes[0]
+        if all(n[0] == 'any' for n in nodes):
+            return ('any', tuple(t for n in nodes for t in n[1]))
+        return ('or', nodes)
+
+    def _parse_and(self):
+        nodes = [self._parse_not()]
+        while self._peek() not in (None, ')', 'OR'):
+            if self._peek() == 'AND':
+                self._pos += 1
+            nodes.append(self._parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def _parse_not(self):
+        if self._peek() == 'NOT':
+            self._pos += 1
+            return ('not', self._parse_not())
+        return self._parse_atom()
+
+    def _parse_atom(self):
+        token = self._peek()
+        if token is None:
+            self._error('unexpected end')
+        if token == '(':
+            self._pos += 1
+            node = self._parse_or()
+            if self._peek() != ')':
+                self._error("missing ')'")
+            self._pos += 1
+            return node
+        tags = []
+        while True:
+            token = self._peek()
+            if token in (None, ')', '(') or token in self._OPERATORS:
+                break
+            self._pos += 1
+            if token not in ',;':
+                tags.append(token)
+        if not tags:
+            self._error(f"expected a tag before '{token}'" if token else 'unexpected end')
+        self.tags.extend(t for t in tags if t not in self.tags)
+        return ('any', tuple(tags))
+
+    def _compile(self, node):
+        kind, arg = node
+        if kind == 'any':
+            wanted = frozenset(arg)
+            return lambda tags: not wanted.isdisjoint(tags)
+        if kind == 'not':
+            inner = self._compile(arg)
+            return lambda tags: not inner(tags)
+        parts = [self._compile(n) for n in arg]
+        if kind == 'and':
+            return lambda tags: all(p(tags) for p in parts)
+        return lambda tags: any(p(tags) for p in parts)
 
-        self._touch_file(file_path)
 
 def check_tags(tag_string, line):
-    """Return True if any element in tag_string appears in the log line's TROPS_TAGS field.
+    """Return True if the log line's TROPS_TAGS field matches tag_string.
 
-    tag_string: comma/semicolon separated tags (e.g. "#123,TEST" or "#123;TEST")
+    tag_string: comma/semicolon separated tags (e.g. "#123,TEST" or "#123;TEST"),
+    or a boolean expression (e.g. "#123 AND NOT TEST"); see TagFilter.
     line: log line potentially containing "TROPS_TAGS=..."
+
+    Compiles tag_string on every call; build a TagFilter once to filter many lines.
     """
-    if not tag_string:
-        return False
-
-    # Split the desired tags on comma/semicolon, strip whitespace
-    desired_tags = {t.strip() for sep in [',', ';'] for t in tag_string.split(sep)}
-    desired_tags = {t for t in desired_tags if t}
-    if not desired_tags:
-        return False
-
-    # Locate TROPS_TAGS token in the line and parse its value
-    token = 'TROPS_TAGS='
-    idx = line.find(token)
-    if idx == -1:
-        return False
-    # Extract the remainder and take the first whitespace-delimited token
-    remainder = line[idx + len(token):]
-    # Stop at next space if present
-    value = remainder.split()[0] if remainder else ''
-    if not value:
-        return False
-    # Split by comma/semicolon into set
-    line_tags = {t.strip() for sep in [',', ';'] for t in value.split(sep)}
-    line_tags = {t for t in line_tags if t}
-    if not line_tags:
-        return False
-
-    # Match if any desired tag is present in line tags
-    return any(t in line_tags for t in desired_tags)
+    return TagFilter(tag_string)(line)
 
 def trops_log(args, other_args):
 
@@ -178,6 +418,59 @@ def trops_log(args, other_args):
     trlog.log()
 
 
+def trops_log_export(args, other_args):
+
+    from .logexport import TropsLogExport
+    te = TropsLogExport(args, other_args)
+    te.export()
+
+
+class TropsLogRotate(TropsCLI):
+
+    def __init__(self, args, other_args):
+        super().__init__(args, other_args)
+
+        if other_args:
+            msg = f"""\
+                Unsupported argments: { ', '.join(other_args)}
+                > trops log rotate --help"""
+            raise TropsError(dedent(msg))
+
+    def rotate(self):
+        """Compress the live log into a segment now, or with --if-due when a limit is reached"""
+        from .logarchive import rotate
+
+        codec, max_bytes, max_age = self.log_rotation_settings()
+        if self.args.codec:
+            codec = self.args.codec
+        try:
+            segment = rotate(self.trops_logfile, codec, max_bytes, max_age, force=not self.args.if_due)
+        except RuntimeError as e:
+            raise TropsError(f'ERROR: {e}')
+        if segment:
+            print(f'Rotated { self.trops_logfile } to { segment }')
+
+
+def trops_log_rotate(args, other_args):
+
+    tr = TropsLogRotate(args, other_args)
+    tr.rotate()
+
+
+def trops_log_merge(args, other_args):
+
+    from .logmerge import TropsLogMerge
+    tm = TropsLogMerge(args, other_args)
+    tm.merge()
+
+
+def trops_log_query(args, other_args):
+
+    from .logquery import TropsLogQuery
+    tq = TropsLogQuery(args, other_args)
+    tq.query()
+
+
 def add_log_subparsers(subparsers):
 
     parser_log = subparsers.add_parser('log', help='show log')
@@ -192,5 +485,83 @@ def add_log_subparsers(subparsers):
     parser_log.add_argument(
         '-a', '--all', action='store_true', help='show all log')
     parser_log.add_argument(
-        '--tags', help='comma/semicolon separated tags to filter (overrides TROPS_TAGS)')
+        '--tags', help='comma/semicolon separated tags to filter, or an expression '
+        'such as "#123 AND NOT test" (overrides TROPS_TAGS)')
+    parser_log.add_argument(
+        '--since', help='show lines from this time on (YYYY-mm-dd[ HH:MM[:SS]] or HH:MM[:SS] for today)')
+    parser_log.add_argument(
+        '--until', help='show lines up to this time, inclusive (same formats as --since)')
+    parser_log.add_argument(
+        '-j', '--jobs', type=int,
+        help='worker processes for filtering large logs (default: CPU count above log_scan_threshold; 1 disables)')
     parser_log.set_defaults(handler=trops_log)
+
+    log_subparsers = parser_log.add_subparsers()
+    # trops log export
+    parser_export = log_subparsers.add_parser(
+        'export', help='export CM/FL records into typed columns (incremental)')
+    parser_export.add_argument(
+        '--format', choices=['sqlite', 'parquet', 'arrow'], default='sqlite',
+        help='output format (default: %(default)s; parquet/arrow need pyarrow)')
+    parser_export.add_argument(
+        '-o', '--output', required=True,
+        help='output database file (sqlite) or directory (parquet/arrow)')
+    parser_export.set_defaults(handler=trops_log_export)
+    # trops log query
+    parser_query = log_subparsers.add_parser(
+        'query', help='filter the log through an indexed SQLite store')
+    parser_query.add_argument(
+        '--since', help='only lines at or after this time (YYYY-mm-dd[ HH:MM[:SS]] or HH:MM)')
+    parser_query.add_argument(
+        '--until', help='only lines at or before this time (inclusive)')
+    parser_query.add_argument(
+        '--exit', help="exit code expression: 0, '!=0', '>0', ... (also --exit!=0)")
+    parser_query.add_argument(
+        '--cmd', help="glob matched against the command, e.g. 'systemctl*'")
+    parser_query.add_argument(
+        '--pwd', help='working directory, including its subdirectories')
+    parser_query.add_argument(
+        '--sid', help='TROPS_SID')
+    parser_query.add_argument(
+        '--env', help='TROPS_ENV')
+    parser_query.add_argument(
+        '--tag', action='append',
+        help='tag to match; comma separated alternatives, repeat to require several')
+    parser_query.add_argument(
+        '--user', help='user or user@host')
+    parser_query.add_argument(
+        '--type', choices=['CM', 'FL'], help='record type')
+    parser_query.add_argument(
+        '-t', '--tail', type=int, help='show only the last N matching lines')
+    parser_query.add_argument(
+        '--sync-only', action='store_true', help='update the store without printing')
+    parser_query.set_defaults(handler=trops_log_query)
+    # trops log rotate
+    parser_rotate = log_subparsers.add_parser(
+        'rotate', help='compress the log into an indexed segment')
+    parser_rotate.add_argument(
+        '--codec', choices=['gzip', 'zstd'],
+        help='compression (default: log_compress config, else gzip; zstd needs Python 3.14 or zstandard)')
+    parser_rotate.add_argument(
+        '--if-due', action='store_true',
+        help='only rotate when log_rotate_size or log_rotate_age is reached')
+    parser_rotate.set_defaults(handler=trops_log_rotate)
+    # trops log merge
+    parser_merge = log_subparsers.add_parser(
+        'merge', help='merge several logs into one time-ordered stream')
+    parser_merge.add_argument(
+        'inputs', nargs='+',
+        help='log files, rotated segments (.gz/.zst) or git:<ref>:<path> blobs of the env repo')
+    parser_merge.add_argument(
+        '-e', '--env', help='env whose git repo git: inputs are read from')
+    parser_merge.add_argument(
+        '--skew', type=float, default=2.0,
+        help='seconds lines may be out of order or duplicated across inputs (default: %(default)s)')
+    parser_merge.add_argument(
+        '--keep-duplicates', action='store_true', help='do not drop records repeated across inputs')
+    parser_merge.add_argument(
+        '--format', choices=['raw', 'sqlite', 'parquet', 'arrow'], default='raw',
+        help='raw log lines (default, e.g. for tldr) or an export format')
+    parser_merge.add_argument(
+        '-o', '--output', help='output file or directory (default for raw: stdout)')
+    parser_merge.set_defaults(handler=trops_log_merge)
@@ -0,0 +1,283 @@
+"""Rotation of trops.log into compressed, indexed segments.
+
+``rotate()`` renames the live log, recreates it empty and compresses the old
+content into ``trops.log.<YYYYmmddHHMMSS>.gz`` (or ``.zst``) next to it.
+Each segment gets a small JSON index, ``<segment>.idx``, with the time range,
+SIDs and tags it contains and the inode of the file it came from::
+
+    {"codec": "gzip", "first": "2024-01-01 00:00:00", "last": "...",
+     "lines": 1234, "bytes": 567890, "sids": [...], "tags": [...],
+     "source_inode": 42}
+
+Readers go through ``list_segments()``/``iter_lines()`` and use the index to
+skip segments that cannot contain what they look for.
+"""
+
+import fcntl
+import glob
+import gzip
+import io
+import json
+import os
+import re
+
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+from .logparse import TIME_FORMAT, parse_timestamp, split_tags
+
+CODECS = {'gzip': '.gz', 'zstd': '.zst'}
+INDEX_SUFFIX = '.idx'
+
+_TIME = re.compile(rb'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d')
+_SID = re.compile(rb'TROPS_SID=([^\s,]+)')
+_TAGS = re.compile(rb'TROPS_TAGS=[ \t]*(\S+)')
+_SIZE = re.compile(r'^\s*(\d+)\s*([kmgt]?)i?b?\s*$', re.IGNORECASE)
+_AGE = re.compile(r'^\s*(\d+)\s*([smhdw]?)\s*$', re.IGNORECASE)
+
+
+def parse_size(value: str) -> int:
+    """'100M' -> bytes. Accepts k/m/g/t suffixes (powers of 1024)."""
+    m = _SIZE.match(str(value))
+    if not m:
+        raise ValueError(f'invalid size: {value!r} (e.g. 500M, 2G)')
+    return int(m.group(1)) << (10 * ' kmgt'.index(m.group(2).lower() or ' '))
+
+
+def parse_age(value: str) -> timedelta:
+    """'30d' -> timedelta. Accepts s/m/h/d/w suffixes; a bare number is days."""
+    m = _AGE.match(str(value))
+    if not m:
+        raise ValueError(f'invalid age: {value!r} (e.g. 12h, 30d, 4w)')
+    unit = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks', '': 'days'}
+    return timedelta(**{unit[m.group(2).lower()]: int(m.group(1))})
+
+
+def _zstd():
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def zstd_available() -> bool:
+    return _zstd() is not None
+
+
+def _open_write(path: str, codec: str):
+    if codec == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError('zstd compression requires Python 3.14 or the zstandard package')
+    if hasattr(zstd, 'ZstdCompressor') and hasattr(zstd.ZstdCompressor, 'stream_writer'):
+        return zstd.ZstdCompressor(level=10).stream_writer(open(path, 'wb'), closefd=True)
+    return zstd.open(path, 'wb')
+
+
+def open_segment(path: str):
+    """Open a segment for streaming reads of its uncompressed bytes."""
+    if path.endswith(CODECS['gzip']):
+        return gzip.open(path, 'rb')
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError(f'reading {path} requires Python 3.14 or the zstandard package')
+    if hasattr(zstd, 'ZstdDecompressor') and hasattr(zstd.ZstdDecompressor, 'stream_reader'):
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return zstd.open(path, 'rb')
+
+
+def index_path(segment: str) -> str:
+    return segment + INDEX_SUFFIX
+
+
+def read_index(segment: str) -> Optional[dict]:
+    try:
+        with open(index_path(segment), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_segments(logfile: str) -> List[str]:
+    """Segments of logfile, oldest first (their names sort by rotation time)."""
+    segments = []
+    for suffix in CODECS.values():
+        segments.extend(glob.glob(glob.escape(logfile) + '.[0-9]*' + suffix))
+    return sorted(segments)
+
+
+def find_segment(logfile: str, source_inode: int) -> Optional[str]:
+    """Return the segment made from the file with source_inode, if any."""
+    for segment in reversed(list_segments(logfile)):
+        index = read_index(segment)
+        if index and index.get('source_inode') == source_inode:
+            return segment
+    return None
+
+
+def iter_segment_lines(segment: str, offset: int = 0) -> Iterator[bytes]:
+    """Yield the lines of a segment (with newlines), skipping offset bytes."""
+    with open_segment(segment) as f:
+        while offset > 0:
+            skipped = len(f.read(min(offset, 1 << 20)))
+            if not skipped:
+                return
+            offset -= skipped
+        yield from f
+
+
+def segment_may_match(index: Optional[dict], sid: Optional[str] = None, tag_filter=None,
+                      since: Optional[datetime] = None, until: Optional[datetime] = None) -> bool:
+    """False only when the index rules out any line matching the filters."""
+    if not index:
+        return True
+    if sid and not any(s.startswith(sid) for s in index.get('sids', ())):
+        # 'TROPS_SID=<sid>' is matched as a substring, so compare prefixes
+        return False
+    if tag_filter is not None and not tag_filter.could_match(index.get('tags', ())):
+        return False
+    if since and index.get('last') and index['last'] < since.strftime(TIME_FORMAT):
+        return False
+    if until and index.get('first') and index['first'] > until.strftime(TIME_FORMAT):
+        return False
+    return True
+
+
+def rotation_due(logfile: str, max_bytes: Optional[int] = None,
+                 max_age: Optional[timedelta] = None) -> bool:
+    """True if logfile reached max_bytes or its first line is older than max_age."""
+    try:
+        size = os.path.getsize(logfile)
+    except OSError:
+        return False
+    if size == 0:
+        return False
+    if max_bytes and size >= max_bytes:
+        return True
+    if max_age:
+        with open(logfile, 'rb') as f:
+            first = parse_timestamp(f.read(32))
+        if first and datetime.now() - first >= max_age:
+            return True
+    return False
+
+
+def _write_index(segment: str, index: dict) -> None:
+    tmp_path = index_path(segment) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, sort_keys=True)
+    os.replace(tmp_path, index_path(segment))
+
+
+def compress_segment(raw_path: str, segment: str, codec: str, source_inode: int) -> dict:
+    """Compress raw_path into segment, write its index and return it."""
+    sids, tags = set(), set()
+    first = last = None
+    lines = size = 0
+    tmp_segment = segment + '.tmp'
+    with open(raw_path, 'rb') as src, _open_write(tmp_segment, codec) as dst:
+        for line in src:
+            dst.write(line)
+            lines += 1
+            size += len(line)
+            m = _TIME.match(line)
+            if m:
+                ts = m.group().decode('ascii')
+                if first is None or ts < first:
+                    first = ts
+                if last is None or ts > last:
+                    last = ts
+            m = _SID.search(line)
+            if m:
+                sids.add(m.group(1).decode('utf-8', errors='replace'))
+            m = _TAGS.search(line)
+            if m:
+                tags.update(split_tags(m.group(1).decode('utf-8', errors='replace')))
+    os.replace(tmp_segment, segment)
+    index = {
+        'codec': codec,
+        'first': first,
+        'last': last,
+        'lines': lines,
+        'bytes': size,
+        'sids': sorted(sids),
+        'tags': sorted(tags),
+        'source_inode': source_inode,
+    }
+    _write_index(segment, index)
+    return index
+
+
+def rotate(logfile: str, codec: str = 'gzip', max_bytes: Optional[int] = None,
+           max_age: Optional[timedelta] = None, force: bool = False) -> Optional[str]:
+    """Rotate logfile into a compressed segment; return its path.
+
+    Without force, only rotates when rotation_due() says so. Returns None
+    when nothing was rotated, including when another process holds the
+    rotation lock.
+    """
+    if codec not in CODECS:
+        raise ValueError(f'unknown codec: {codec}')
+    if codec == 'zstd' and not zstd_available():
+        raise RuntimeError('zstd compression requires Python 3.14 or the zstandard package')
+
+    lock_fd = os.open(logfile + '.rotate.lock', os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return None
+        # leftovers of an interrupted rotation are finished first
+        for raw_path in sorted(glob.glob(glob.escape(logfile) + '.[0-9]*[0-9]')):
+            _finish(raw_path, codec)
+
+        if not os.path.isfile(logfile) or os.path.getsize(logfile) == 0:
+            return None
+        if not force and not rotation_due(logfile, max_bytes, max_age):
+            return None
+
+        st = os.stat(logfile)
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        raw_path = f'{logfile}.{stamp}'
+        while any(os.path.exists(raw_path + suffix) for suffix in ('',) + tuple(CODECS.values())):
+            stamp = str(int(stamp) + 1)
+            raw_path = f'{logfile}.{stamp}'
+        os.rename(logfile, raw_path)
+        # recreate the live log so writers keep the same mode and owner
+        fd = os.open(logfile, os.O_CREAT | os.O_WRONLY | os.O_APPEND, st.st_mode & 0o7777)
+        os.close(fd)
+        try:
+            os.chown(logfile, st.st_uid, st.st_gid)
+        except OSError:
+            pass
+        return _finish(raw_path, codec)
+    finally:
+        os.close(lock_fd)
+
+
+def _finish(raw_path: str, codec: str) -> str:
+    # rename keeps the inode, so this is the inode the live log had
+    source_inode = os.stat(raw_path).st_ino
+    segment = raw_path + CODECS[codec]
+    compress_segment(raw_path, segment, codec, source_inode)
+    os.unlink(raw_path)
+    return segment
+
+
+def iter_lines(logfile: str, sid: Optional[str] = None, tag_filter=None) -> Iterator[str]:
+    """Yield the lines of all segments that may match, then of the live log."""
+    for segment in list_segments(logfile):
+        if not segment_may_match(read_index(segment), sid=sid, tag_filter=tag_filter):
+            continue
+        for line in iter_segment_lines(segment):
+            yield line.decode('utf-8', errors='replace')
+    if os.path.isfile(logfile):
+        with open(logfile) as f:
+            yield from f
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+
+from textwrap import dedent
+
+from .logparse import LOG_COLUMNS, file_identity, iter_lines_from, parse_record
+from .trops import TropsCLI, TropsError
+from .utils import absolute_path
+
+# Rows per parquet/arrow part file
+PART_ROWS = 500000
+STATE_FILE = '_trops_export_state.json'
+
+
+class TropsLogExport(TropsCLI):
+    """Export trops.log CM/FL records into typed columns.
+
+    Exports are incremental: the byte offset of the last exported line is
+    stored with the output, so repeated exports only parse new lines.
+      - sqlite: one database file, table ``records``
+      - parquet/arrow: a directory of ``part-NNNNN`` files (requires pyarrow)
+    """
+
+    def __init__(self, args, other_args):
+        super().__init__(args, other_args)
+
+        if other_args:
+            msg = f"""\
+                Unsupported argments: { ', '.join(other_args)}
+                > trops log export --help"""
+            raise TropsError(dedent(msg))
+
+        self.format = args.format
+        self.output = absolute_path(args.output)
+
+    def _start_offset(self, state) -> int:
+        """Offset to resume from, or 0 if the log was rotated or truncated."""
+        inode, size = file_identity(self.trops_logfile)
+        if not state or state.get('inode') != inode or state.get('offset', 0) > size:
+            return 0
+        return state['offset']
+
+    def _records(self, offset):
+        """Yield (parsed records, new offset) batches from offset."""
+        for lines, new_offset in iter_lines_from(self.trops_logfile, offset):
+            records = []
+            for raw in lines:
+                record = parse_record(raw.decode('utf-8', errors='replace'))
+                if record is not None:
+                    records.append(record)
+            yield records, new_offset
+
+    def export(self) -> None:
+        if not os.path.isfile(self.trops_logfile):
+            raise TropsError(f"ERROR: log file not found: { self.trops_logfile }")
+        if self.format == 'sqlite':
+            count = self._export_sqlite()
+        else:
+            count = self._export_arrow()
+        print(f'Exported { count } records to { self.output }')
+
+    def _export_sqlite(self) -> int:
+        out_dir = os.path.dirname(self.output)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        conn = sqlite3.connect(self.output)
+        try:
+            create_export_schema(conn)
+            row = conn.execute('SELECT inode, offset FROM export_state WHERE logfile = ?',
+                               (self.trops_logfile,)).fetchone()
+            state = {'inode': row[0], 'offset': row[1]} if row else None
+            offset = self._start_offset(state)
+            inode = file_identity(self.trops_logfile)[0]
+            count = 0
+            for records, offset in self._records(offset):
+                with conn:
+                    insert_records(conn, records)
+                    conn.execute('INSERT OR REPLACE INTO export_state (logfile, inode, offset) VALUES (?, ?, ?)',
+                                 (self.trops_logfile, inode, offset))
+                count += len(records)
+            return count
+        finally:
+            conn.close()
+
+    def _export_arrow(self) -> int:
+        pyarrow = import_pyarrow(self.format)
+
+        os.makedirs(self.output, exist_ok=True)
+        state_path = os.path.join(self.output, STATE_FILE)
+        state = None
+        if os.path.isfile(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+        offset = self._start_offset(state)
+        inode = file_identity(self.trops_logfile)[0]
+        next_part = (state or {}).get('next_part', 0)
+
+        count = 0
+        pending = []
+        for records, offset in self._records(offset):
+            pending.extend(records)
+            if len(pending) >= PART_ROWS:
+                self._write_part(pyarrow, pending, next_part)
+                count += len(pending)
+                next_part += 1
+                pending = []
+                _write_state(state_path, inode, offset, next_part)
+        if pending:
+            self._write_part(pyarrow, pending, next_part)
+            count += len(pending)
+            next_part += 1
+        _write_state(state_path, inode, offset, next_part)
+        return count
+
+    def _write_part(self, pyarrow, records, part_no) -> None:
+        write_part(pyarrow, self.format, self.output, records, part_no)
+
+
+def import_pyarrow(fmt):
+    try:
+        import pyarrow
+    except ImportError:
+        raise TropsError(f'ERROR: --format { fmt } requires pyarrow (pip install pyarrow)')
+    return pyarrow
+
+
+def write_part(pyarrow, fmt, output, records, part_no) -> None:
+    """Write records as output/part-NNNNN.parquet (or .arrow)."""
+    table = pyarrow.table(
+        [list(col) for col in zip(*records)],
+        schema=arrow_schema(pyarrow),
+    )
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, os.path.join(output, f'part-{ part_no:05d}.parquet'))
+    else:
+        path = os.path.join(output, f'part-{ part_no:05d}.arrow')
+        with pyarrow.OSFile(path, 'wb') as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def insert_records(conn, records) -> None:
+    """Append LogRecords to the records table of an export database."""
+    placeholders = ', '.join('?' * len(LOG_COLUMNS))
+    conn.executemany(
+        f"INSERT INTO records ({ ', '.join(LOG_COLUMNS) }) VALUES ({ placeholders })",
+        (_sqlite_row(r) for r in records))
+
+
+def create_export_schema(conn) -> None:
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS records (
+            timestamp TEXT NOT NULL,
+            user TEXT,
+            host TEXT,
+            level TEXT,
+            type TEXT,
+            command TEXT,
+            pwd TEXT,
+            exit INTEGER,
+            sid TEXT,
+            env TEXT,
+            tags TEXT,
+            meta TEXT
+        );
+        CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp);
+        CREATE TABLE IF NOT EXISTS export_state (
+            logfile TEXT PRIMARY KEY,
+            inode INTEGER,
+            offset INTEGER
+        );
+    ''')
+
+
+def _sqlite_row(record):
+    return (record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),) + tuple(record[1:])
+
+
+def arrow_schema(pyarrow):
+    return pyarrow.schema([
+        ('timestamp', pyarrow.timestamp('s')),
+        ('user', pyarrow.string()),
+        ('host', pyarrow.string()),
+        ('level', pyarrow.string()),
+        ('type', pyarrow.string()),
+        ('command', pyarrow.string()),
+        ('pwd', pyarrow.string()),
+        ('exit', pyarrow.int32()),
+        ('sid', pyarrow.string()),
+        ('env', pyarrow.string()),
+        ('tags', pyarrow.string()),
+        ('meta', pyarrow.string()),
+    ])
+
+
+def _write_state(state_path, inode, offset, next_part) -> None:
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'inode': inode, 'offset': offset, 'next_part': next_part}, f)
+    os.replace(tmp_path, state_path)
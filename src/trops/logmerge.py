@@ -0,0 +1,230 @@
+"""Time-ordered merge of several trops logs.
+
+Inputs are read as streams and combined with heapq.merge on the timestamp
+prefix, so memory grows with the number of inputs (plus the small reorder
+and de-duplication windows), not with the number of lines:
+
+- each input passes through a reorder buffer that holds lines for up to
+  ``skew`` seconds, so lines written slightly out of order (concurrent
+  shells, small clock steps) still come out sorted;
+- a record seen in one input is dropped from the other inputs when the same
+  text (ignoring the timestamp) appears there within ``skew`` seconds, e.g.
+  the same host's log fetched from two branches.
+
+Lines without a timestamp prefix keep the position of the line before them.
+"""
+
+import heapq
+import os
+import subprocess
+import sys
+
+from collections import deque
+from datetime import datetime
+from textwrap import dedent
+from typing import Iterable, Iterator, List, Tuple
+
+from . import gitcmd
+from .logarchive import CODECS, iter_segment_lines
+from .logparse import TIME_FORMAT, TIME_PREFIX_LEN, parse_record
+from .trops import TropsCLI, TropsError
+from .utils import absolute_path
+
+GIT_PREFIX = 'git:'
+BATCH_ROWS = 10000
+
+
+def _epoch(ts: str):
+    try:
+        return datetime.strptime(ts, TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def timestamped(lines: Iterable[str], source: int) -> Iterator[Tuple[float, int, str]]:
+    """Yield (epoch, source, stripped line); untimed lines inherit the previous epoch."""
+    epoch = 0.0
+    last_ts = None
+    for line in lines:
+        line = line.strip()
+        ts = line[:TIME_PREFIX_LEN]
+        if ts != last_ts:
+            parsed = _epoch(ts)
+            if parsed is not None:
+                epoch, last_ts = parsed, ts
+        yield epoch, source, line
+
+
+def reorder(items: Iterator[Tuple[float, int, str]], skew: float) -> Iterator[Tuple[float, int, str]]:
+    """Sort items that are at most skew seconds out of order, buffering only that window."""
+    if skew <= 0:
+        yield from items
+        return
+    heap = []
+    seq = 0
+    newest = None
+    for item in items:
+        heapq.heappush(heap, (item[0], seq, item))
+        seq += 1
+        if newest is None or item[0] > newest:
+            newest = item[0]
+        while heap and heap[0][0] <= newest - skew:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def dedupe(items: Iterator[Tuple[float, int, str]], skew: float) -> Iterator[Tuple[float, int, str]]:
+    """Drop records repeated from another input within skew seconds."""
+    seen = {}
+    order = deque()
+    for item in items:
+        epoch, source, line = item
+        while order and order[0][0] < epoch - skew:
+            old_epoch, old_body = order.popleft()
+            if seen.get(old_body, (None,))[0] == old_epoch:
+                del seen[old_body]
+        body = line[TIME_PREFIX_LEN:]
+        if body.strip():
+            previous = seen.get(body)
+            if previous is not None and previous[1] != source:
+                continue
+            seen[body] = (epoch, source)
+            order.append((epoch, body))
+        yield item
+
+
+def merge_lines(inputs: List[Iterable[str]], skew: float = 0, unique: bool = True) -> Iterator[str]:
+    """Merge line streams by timestamp and yield the stripped lines."""
+    streams = [reorder(timestamped(lines, i), skew) for i, lines in enumerate(inputs)]
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    if unique:
+        merged = dedupe(merged, skew)
+    for _, _, line in merged:
+        yield line
+
+
+class TropsLogMerge(TropsCLI):
+    """Merge local logs, rotated segments and git blobs into one log stream."""
+
+    def __init__(self, args, other_args):
+        super().__init__(args, other_args)
+
+        if other_args:
+            msg = f"""\
+                Unsupported argments: { ', '.join(other_args)}
+                > trops log merge --help"""
+            raise TropsError(dedent(msg))
+        if args.format != 'raw' and not args.output:
+            raise TropsError(f'ERROR: --format { args.format } requires -o/--output')
+        if args.skew < 0:
+            raise TropsError('ERROR: --skew must not be negative')
+        self.inputs = args.inputs
+        self._procs = []
+
+    def _open_input(self, spec: str) -> Iterator[str]:
+        if spec.startswith(GIT_PREFIX):
+            return self._git_blob_lines(spec[len(GIT_PREFIX):])
+        path = absolute_path(spec)
+        if not os.path.isfile(path):
+            raise TropsError(f'ERROR: log file not found: { spec }')
+        if path.endswith(tuple(CODECS.values())):
+            return (line.decode('utf-8', errors='replace') for line in iter_segment_lines(path))
+        return _file_lines(path)
+
+    def _git_blob_lines(self, object_spec: str) -> Iterator[str]:
+        if not hasattr(self, 'git_cmd'):
+            raise TropsError(f'ERROR: { GIT_PREFIX }{ object_spec } needs an active trops env (TROPS_ENV or -e)')
+        proc = gitcmd.popen(self.git_cmd + ['cat-file', '-p', object_spec],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._procs.append((object_spec, proc))
+        return _pipe_lines(proc)
+
+    def merge(self) -> None:
+        inputs = [self._open_input(spec) for spec in self.inputs]
+        lines = merge_lines(inputs, skew=self.args.skew, unique=not self.args.keep_duplicates)
+        if self.args.format == 'raw':
+            count = self._write_raw(lines)
+        elif self.args.format == 'sqlite':
+            count = self._write_sqlite(lines)
+        else:
+            count = self._write_arrow(lines)
+        for object_spec, proc in self._procs:
+            if proc.wait() != 0:
+                err = proc.stderr.read().decode('utf-8', errors='replace').strip()
+                raise TropsError(f'ERROR: git cat-file { object_spec } failed: { err }')
+        if self.args.format != 'raw':
+            print(f'Merged { count } records into { self.args.output }')
+
+    def _write_raw(self, lines) -> int:
+        count = 0
+        out = open(absolute_path(self.args.output), 'w') if self.args.output else sys.stdout
+        try:
+            for line in lines:
+                out.write(line + '\n')
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return count
+
+    def _records(self, lines):
+        batch = []
+        for line in lines:
+            record = parse_record(line)
+            if record is not None:
+                batch.append(record)
+                if len(batch) >= BATCH_ROWS:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _write_sqlite(self, lines) -> int:
+        import sqlite3
+        from .logexport import create_export_schema, insert_records
+
+        output = absolute_path(self.args.output)
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        conn = sqlite3.connect(output)
+        count = 0
+        try:
+            create_export_schema(conn)
+            for batch in self._records(lines):
+                with conn:
+                    insert_records(conn, batch)
+                count += len(batch)
+        finally:
+            conn.close()
+        return count
+
+    def _write_arrow(self, lines) -> int:
+        from .logexport import PART_ROWS, import_pyarrow, write_part
+
+        pyarrow = import_pyarrow(self.args.format)
+        output = absolute_path(self.args.output)
+        os.makedirs(output, exist_ok=True)
+        part_no = len([f for f in os.listdir(output) if f.startswith('part-')])
+        count = 0
+        pending = []
+        for batch in self._records(lines):
+            pending.extend(batch)
+            if len(pending) >= PART_ROWS:
+                write_part(pyarrow, self.args.format, output, pending, part_no)
+                count += len(pending)
+                part_no += 1
+                pending = []
+        if pending:
+            write_part(pyarrow, self.args.format, output, pending, part_no)
+            count += len(pending)
+        return count
+
+
+def _file_lines(path: str) -> Iterator[str]:
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        yield from f
+
+
+def _pipe_lines(proc) -> Iterator[str]:
+    for line in proc.stdout:
+        yield line.decode('utf-8', errors='replace')
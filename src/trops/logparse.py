@@ -0,0 +1,159 @@
+"""Parsing of trops.log records.
+
+A record is one line written by ``TropsBase.setup_logging``::
+
+    2024-01-01 00:00:00 user@host INFO CM vi /etc/hosts #> PWD=/etc, EXIT=0, TROPS_SID=abc1234, TROPS_ENV=env1, TROPS_TAGS=#123
+    2024-01-01 00:00:01 user@host INFO FL trops show 1a2b3c4:etc/hosts  #> UPDATE O=root,G=root,M=0644 TROPS_SID=abc1234 TROPS_ENV=env1
+
+parse_record() turns such a line into a LogRecord with typed fields; lines
+that are not CM/FL records return None.
+"""
+
+import os
+import re
+
+from datetime import datetime
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# Timestamp prefix format, matching the datefmt of TropsBase.setup_logging
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIME_PREFIX_LEN = 19
+
+RECORD_TYPES = ('CM', 'FL')
+
+# Keys of the trailer after '#>'; values run until the next key
+_TRAILER_KEY = re.compile(r'(?:^|(?<=[ ,]))(PWD|EXIT|TROPS_SID|TROPS_ENV|TROPS_TAGS)=')
+_TRAILER_FIELDS = {
+    'PWD': 'pwd',
+    'EXIT': 'exit',
+    'TROPS_SID': 'sid',
+    'TROPS_ENV': 'env',
+    'TROPS_TAGS': 'tags',
+}
+
+
+class LogRecord(NamedTuple):
+    """A parsed CM (command) or FL (file) record of trops.log."""
+
+    timestamp: datetime
+    user: str
+    host: str
+    level: str
+    type: str
+    command: str
+    pwd: Optional[str]
+    exit: Optional[int]
+    sid: Optional[str]
+    env: Optional[str]
+    tags: Optional[str]
+    # FL note and ownership, e.g. "UPDATE O=root,G=root,M=0644"
+    meta: Optional[str]
+
+
+LOG_COLUMNS = LogRecord._fields
+
+
+def parse_timestamp(line) -> Optional[datetime]:
+    """Return the timestamp prefix of a log line (str or bytes), or None."""
+    prefix = line[:TIME_PREFIX_LEN]
+    if isinstance(prefix, bytes):
+        prefix = prefix.decode('ascii', errors='replace')
+    try:
+        return datetime.strptime(prefix, TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def parse_time_bound(value: str, end: bool = False) -> datetime:
+    """Parse a --since/--until value.
+
+    Accepts ``YYYY-mm-dd``, ``YYYY-mm-dd HH:MM``, ``YYYY-mm-dd HH:MM:SS``
+    (also with a ``T`` separator) and ``HH:MM[:SS]`` for today. With end=True
+    the omitted parts are filled up so that the bound is inclusive, e.g.
+    ``2024-01-02`` becomes ``2024-01-02 23:59:59``.
+    """
+    value = value.strip().replace('T', ' ')
+    today = datetime.now().strftime('%Y-%m-%d')
+    formats = (
+        ('%Y-%m-%d %H:%M:%S', value, {}),
+        ('%Y-%m-%d %H:%M', value, {'second': 59}),
+        ('%Y-%m-%d', value, {'hour': 23, 'minute': 59, 'second': 59}),
+        ('%Y-%m-%d %H:%M:%S', f'{today} {value}', {}),
+        ('%Y-%m-%d %H:%M', f'{today} {value}', {'second': 59}),
+    )
+    for fmt, text, fill in formats:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.replace(**fill) if end else parsed
+    raise ValueError(f'invalid time: {value!r} (expected YYYY-mm-dd[ HH:MM[:SS]] or HH:MM[:SS])')
+
+
+def split_tags(value: Optional[str]) -> List[str]:
+    """Split a comma/semicolon separated tag string into tags."""
+    if not value:
+        return []
+    return [t.strip() for t in re.split(r'[,;]', value) if t.strip()]
+
+
+def parse_record(line: str) -> Optional[LogRecord]:
+    """Parse one trops.log line; return None if it is not a CM/FL record."""
+    parts = line.rstrip('\n').split(' ', 5)
+    if len(parts) < 6 or parts[4] not in RECORD_TYPES:
+        return None
+    date, time, user_host, level, rtype, body = parts
+    try:
+        timestamp = datetime.strptime(f'{date} {time}', TIME_FORMAT)
+    except ValueError:
+        return None
+    user, _, host = user_host.partition('@')
+
+    command, sep, trailer = body.rpartition(' #> ')
+    if not sep:
+        command, trailer = body, ''
+    command = command.strip()
+
+    fields = dict.fromkeys(_TRAILER_FIELDS.values())
+    matches = list(_TRAILER_KEY.finditer(trailer))
+    meta = trailer[:matches[0].start()] if matches else trailer
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(trailer)
+        fields[_TRAILER_FIELDS[m.group(1)]] = trailer[m.end():end].rstrip(', ')
+    meta = meta.strip().rstrip(',').replace(', ', ' ') or None
+
+    exit_code = fields.pop('exit')
+    try:
+        exit_code = int(exit_code) if exit_code is not None else None
+    except ValueError:
+        exit_code = None
+
+    return LogRecord(timestamp, user, host, level, rtype, command,
+                     exit=exit_code, meta=meta, **fields)
+
+
+def iter_lines_from(path: str, offset: int = 0, batch_bytes: int = 1 << 20) -> Iterator[Tuple[List[bytes], int]]:
+    """Yield (complete lines, offset after them) batches starting at offset.
+
+    A trailing line without its newline (a write in progress) is left for
+    the next call, so the returned offset always sits on a line boundary.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        pending = b''
+        while True:
+            chunk = f.read(batch_bytes)
+            if not chunk:
+                break
+            data = pending + chunk
+            cut = data.rfind(b'\n') + 1
+            pending = data[cut:]
+            if cut:
+                offset += cut
+                yield data[:cut].splitlines(), offset
+
+
+def file_identity(path: str) -> Tuple[int, int]:
+    """Return (inode, size) of path, used to detect rotation or truncation."""
+    st = os.stat(path)
+    return st.st_ino, st.st_size
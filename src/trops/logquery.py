@@ -0,0 +1,263 @@
+import hashlib
+import os
+import re
+import sqlite3
+
+from textwrap import dedent
+
+from .logarchive import find_segment, iter_segment_lines, list_segments
+from .logparse import (file_identity, iter_lines_from, parse_record,
+                       parse_time_bound, parse_timestamp, split_tags)
+from .trops import TropsCLI, TropsError
+
+# --exit expressions: "0", "!=0", ">0", "<=2", ...
+_EXIT_EXPR = re.compile(r'^\s*(==|=|!=|<>|>=|<=|>|<)?\s*(-?\d+)\s*$')
+# "--exit!=0" written without a space or '=' is not split by argparse
+_EXIT_OPTION = re.compile(r'^--exit((?:!=|<>|>=|<=|==|>|<)-?\d+)$')
+
+
+class LogStore:
+    """SQLite index of one trops.log, synced incrementally.
+
+    Every line is stored with its stripped text in ``raw`` (what ``trops log``
+    prints); CM/FL records additionally get their parsed columns and one row
+    per tag in ``tags``. The byte offset and inode of the log are kept in
+    ``sync_state`` so a sync only parses lines appended since the last one.
+    """
+
+    def __init__(self, logfile: str, db_path: str) -> None:
+        self.logfile = logfile
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        create_store_schema(self.conn)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def sync(self) -> int:
+        """Index lines appended since the last sync; return how many were added.
+
+        Rotated segments (see logarchive) are indexed as well: a new store
+        starts with all of them, and after a rotation the rest of the segment
+        made from the previously indexed file is read before the new live log.
+        """
+        if not os.path.isfile(self.logfile):
+            return 0
+        conn = self.conn
+        # IMMEDIATE: concurrent queries wait here instead of indexing the same lines twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT inode, offset FROM sync_state WHERE id = 0').fetchone()
+            inode, size = file_identity(self.logfile)
+            offset = row[1] if row else 0
+            count = 0
+            if not row or row[0] != inode or offset > size:
+                segments = list_segments(self.logfile)
+                resume = find_segment(self.logfile, row[0]) if row and row[0] != inode else None
+                if resume:
+                    # rotated since the last sync: finish the old file, then newer segments
+                    count += self._ingest(iter_segment_lines(resume, offset))
+                    segments = segments[segments.index(resume) + 1:]
+                elif row:
+                    # truncated, or rotated without a segment: rebuild from the top
+                    conn.execute('DELETE FROM tags')
+                    conn.execute('DELETE FROM records')
+                for segment in segments:
+                    count += self._ingest(iter_segment_lines(segment))
+                offset = 0
+            if offset < size:
+                for lines, offset in iter_lines_from(self.logfile, offset):
+                    count += self._ingest(lines)
+            conn.execute('INSERT OR REPLACE INTO sync_state (id, inode, offset) VALUES (0, ?, ?)',
+                         (inode, offset))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return count
+
+    def _ingest(self, lines, batch: int = 10000) -> int:
+        """Insert raw (bytes) lines after the last record; return how many."""
+        conn = self.conn
+        next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM records').fetchone()[0]
+        count = 0
+        rows, tag_rows = [], []
+        for raw in lines:
+            text = raw.decode('utf-8', errors='replace')
+            rows.append(_store_row(next_id + count, text, parse_record(text), tag_rows))
+            count += 1
+            if len(rows) >= batch:
+                self._insert(rows, tag_rows)
+                rows, tag_rows = [], []
+        self._insert(rows, tag_rows)
+        return count
+
+    def _insert(self, rows, tag_rows) -> None:
+        self.conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.executemany('INSERT INTO tags VALUES (?, ?)', tag_rows)
+
+    def query(self, since=None, until=None, exit_expr=None, cmd=None, pwd=None,
+              sid=None, env=None, tags=None, user=None, rtype=None, tail=None):
+        """Return the raw lines matching all given filters, in log order."""
+        where, params = [], []
+        if since is not None:
+            where.append('ts >= ?')
+            params.append(since.strftime('%Y-%m-%d %H:%M:%S'))
+        if until is not None:
+            where.append('ts <= ?')
+            params.append(until.strftime('%Y-%m-%d %H:%M:%S'))
+        if exit_expr is not None:
+            op, value = parse_exit_expr(exit_expr)
+            where.append(f'exit {op} ?')
+            params.append(value)
+        if cmd:
+            where.append('command GLOB ?')
+            params.append(cmd)
+        if pwd:
+            pwd = pwd.rstrip('/') or '/'
+            where.append('(pwd = ? OR pwd GLOB ?)')
+            params.extend([pwd, _glob_escape(pwd.rstrip('/')) + '/*'])
+        if sid:
+            where.append('sid = ?')
+            params.append(sid)
+        if env:
+            where.append('env = ?')
+            params.append(env)
+        for tag in tags or ():
+            # each --tag may list alternatives (#1,#2); repeated --tag options must all match
+            alternatives = split_tags(tag)
+            where.append('id IN (SELECT record_id FROM tags WHERE tag IN '
+                         f"({ ', '.join('?' * len(alternatives)) }))")
+            params.extend(alternatives)
+        if user:
+            if '@' in user:
+                where.append('user_host = ?')
+                params.append(user)
+            else:
+                where.append('user_host GLOB ?')
+                params.append(_glob_escape(user) + '@*')
+        if rtype:
+            where.append('type = ?')
+            params.append(rtype)
+
+        clause = f"WHERE { ' AND '.join(where) }" if where else ''
+        if tail:
+            sql = (f'SELECT raw FROM (SELECT id, raw FROM records { clause } '
+                   'ORDER BY id DESC LIMIT ?) ORDER BY id')
+            params.append(tail)
+        else:
+            sql = f'SELECT raw FROM records { clause } ORDER BY id'
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+
+def create_store_schema(conn) -> None:
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            ts TEXT,
+            user_host TEXT,
+            type TEXT,
+            command TEXT,
+            pwd TEXT,
+            exit INTEGER,
+            sid TEXT,
+            env TEXT,
+            raw TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS records_ts ON records (ts);
+        CREATE INDEX IF NOT EXISTS records_sid ON records (sid);
+        CREATE INDEX IF NOT EXISTS records_env ON records (env);
+        CREATE INDEX IF NOT EXISTS records_exit ON records (exit);
+        CREATE INDEX IF NOT EXISTS records_user_host ON records (user_host);
+        CREATE INDEX IF NOT EXISTS records_command ON records (command);
+        CREATE INDEX IF NOT EXISTS records_pwd ON records (pwd);
+        CREATE TABLE IF NOT EXISTS tags (
+            record_id INTEGER NOT NULL,
+            tag TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag, record_id);
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            inode INTEGER,
+            offset INTEGER
+        );
+    ''')
+
+
+def _store_row(record_id, text, record, tag_rows):
+    raw = text.strip()
+    if record is None:
+        # keep the time of other timestamped lines so --since/--until see them
+        ts = parse_timestamp(raw)
+        ts = ts.strftime('%Y-%m-%d %H:%M:%S') if ts else None
+        return (record_id, ts, None, None, None, None, None, None, None, raw)
+    for tag in split_tags(record.tags):
+        tag_rows.append((record_id, tag))
+    return (record_id, record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            f'{record.user}@{record.host}', record.type, record.command,
+            record.pwd, record.exit, record.sid, record.env, raw)
+
+
+def parse_exit_expr(expr: str):
+    """Turn an --exit expression into (sql operator, int)."""
+    m = _EXIT_EXPR.match(str(expr))
+    if not m:
+        raise TropsError(f"ERROR: invalid --exit expression: { expr } (e.g. 0, !=0, >1)")
+    op = {None: '=', '==': '=', '<>': '!='}.get(m.group(1), m.group(1))
+    return op, int(m.group(2))
+
+
+def _glob_escape(value: str) -> str:
+    return re.sub(r'([*?\[])', r'[\1]', value)
+
+
+def store_path(trops_dir: str, logfile: str) -> str:
+    """Location of the query store for logfile under $TROPS_DIR/tmp."""
+    digest = hashlib.sha1(os.path.abspath(logfile).encode()).hexdigest()[:12]
+    return os.path.join(trops_dir, 'tmp', f'logstore-{ digest }.sqlite')
+
+
+class TropsLogQuery(TropsCLI):
+    """Filter trops.log through the indexed query store."""
+
+    def __init__(self, args, other_args):
+        super().__init__(args, other_args)
+
+        unknown = []
+        for arg in other_args:
+            m = _EXIT_OPTION.match(arg)
+            if m:
+                args.exit = m.group(1)
+            else:
+                unknown.append(arg)
+        if unknown:
+            msg = f"""\
+                Unsupported argments: { ', '.join(unknown)}
+                > trops log query --help"""
+            raise TropsError(dedent(msg))
+
+        try:
+            self.since = parse_time_bound(args.since) if args.since else None
+            self.until = parse_time_bound(args.until, end=True) if args.until else None
+        except ValueError as e:
+            raise TropsError(f'ERROR: {e}')
+        if args.exit is not None:
+            parse_exit_expr(args.exit)
+
+    def query(self) -> None:
+        store = LogStore(self.trops_logfile, store_path(self.trops_dir, self.trops_logfile))
+        try:
+            store.sync()
+            if self.args.sync_only:
+                return
+            lines = store.query(
+                since=self.since, until=self.until, exit_expr=self.args.exit,
+                cmd=self.args.cmd, pwd=self.args.pwd, sid=self.args.sid,
+                env=self.args.env, tags=self.args.tag, user=self.args.user,
+                rtype=self.args.type, tail=self.args.tail)
+        finally:
+            store.close()
+        print(*lines, sep='\n')
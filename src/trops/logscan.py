@@ -0,0 +1,136 @@
+"""Parallel filtering of large trops.log files.
+
+The log is memory-mapped and cut into chunks at newline boundaries; each
+chunk is filtered in a worker process and the matches are concatenated in
+file order. Workers search the raw bytes for the ``TROPS_SID=``/``TROPS_TAGS=``
+needle and only look at (and decode) the lines containing it, so lines that
+cannot match are never turned into Python strings.
+
+Filters are passed as (kind, value) tuples so they can be sent to workers:
+``('sid', 'abc1234')`` matches ``TROPS_SID=abc1234`` anywhere in a line like
+``TropsLog.log`` does, ``('tags', '#123 AND prod')`` uses log.TagFilter.
+"""
+
+import mmap
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+# Below this size a plain sequential scan is faster than starting workers
+DEFAULT_THRESHOLD = 64 << 20
+MIN_CHUNK = 8 << 20
+# Chunks per worker, so a slow chunk does not hold up the whole pool
+CHUNKS_PER_JOB = 4
+
+# TROPS_TAGS value up to the next whitespace, as TagFilter reads it
+_TAGS_VALUE = re.compile(rb'TROPS_TAGS=[ \t\f\v\r]*(\S*)')
+
+_tag_filters = {}
+
+
+def chunk_bounds(mm, size: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """Split [0, size) into ranges that end right after a newline."""
+    bounds = []
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            nl = mm.find(b'\n', end)
+            end = size if nl == -1 else nl + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _line_at(mm, pos: int, start: int, end: int) -> Tuple[int, int]:
+    line_start = mm.rfind(b'\n', start, pos) + 1
+    if line_start == 0:
+        line_start = start
+    line_end = mm.find(b'\n', pos, end)
+    if line_end == -1:
+        line_end = end
+    return line_start, line_end
+
+
+def _tag_filter(expression):
+    tag_filter = _tag_filters.get(expression)
+    if tag_filter is None:
+        from .log import TagFilter
+        tag_filter = _tag_filters[expression] = TagFilter(expression)
+    return tag_filter
+
+
+def scan_range(path: str, start: int, end: int, kind: str, value: str) -> bytes:
+    """Return the lines in [start, end) of path matching the filter.
+
+    Matching lines are stripped like ``trops log`` output and joined with
+    newlines (each followed by one).
+    """
+    if kind not in ('sid', 'tags'):
+        raise ValueError(f'unknown filter: {kind}')
+
+    out = []
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return b''
+        with mm:
+            if kind == 'sid':
+                needle = f'TROPS_SID={value}'.encode()
+                pos = mm.find(needle, start, end)
+                while pos != -1:
+                    line_start, line_end = _line_at(mm, pos, start, end)
+                    out.append(mm[line_start:line_end].strip())
+                    out.append(b'\n')
+                    pos = mm.find(needle, line_end, end)
+            else:
+                tag_filter = _tag_filter(value)
+                # tag values repeat a lot, so remember each verdict
+                verdicts = {}
+                last_end = start
+                for m in _TAGS_VALUE.finditer(mm, start, end):
+                    tags = m.group(1)
+                    matched = verdicts.get(tags)
+                    if matched is None:
+                        matched = verdicts[tags] = tag_filter.match_value(tags.decode('utf-8', errors='replace'))
+                    if not matched or m.start() < last_end:
+                        continue
+                    line_start, line_end = _line_at(mm, m.start(), start, end)
+                    if mm.find(b'TROPS_TAGS=', line_start, m.start()) != -1:
+                        # only the first TROPS_TAGS= of a line counts
+                        continue
+                    out.append(mm[line_start:line_end].strip())
+                    out.append(b'\n')
+                    last_end = line_end
+    return b''.join(out)
+
+
+def scan(path: str, kind: str, value: str, jobs: Optional[int] = None,
+         chunk_size: Optional[int] = None) -> List[str]:
+    """Filter path with up to jobs worker processes; return matching lines in order."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    jobs = jobs or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(size // (jobs * CHUNKS_PER_JOB) + 1, MIN_CHUNK)
+
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = chunk_bounds(mm, size, chunk_size)
+
+    if jobs == 1 or len(bounds) == 1:
+        parts = [scan_range(path, start, end, kind, value) for start, end in bounds]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(bounds))) as pool:
+            parts = list(pool.map(scan_range, *zip(*[(path, s, e, kind, value) for s, e in bounds])))
+
+    data = b''.join(parts).decode('utf-8', errors='replace')
+    # every match ends with b'\n', so the last item is empty
+    return data.split('\n')[:-1]
@@ -0,0 +1,110 @@
+"""Time-bounded reads of trops.log without an index.
+
+Log lines start with a fixed-width ``%Y-%m-%d %H:%M:%S`` timestamp and are
+appended in time order, so the first line of a time window can be found by
+binary search over byte offsets: seek to the middle, skip to the next line
+and compare its timestamp prefix. Only the window is then read.
+
+Concurrent shells can append lines a little out of order, so the search
+starts ``slack`` seconds before the window and reading stops ``slack``
+seconds after it; each line is still checked against the exact bounds.
+Lines without a timestamp belong to the line before them.
+"""
+
+import os
+import re
+
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from .logparse import TIME_FORMAT, TIME_PREFIX_LEN
+
+# Out-of-order tolerance of the search, in seconds
+SLACK = 60
+# Below this many bytes the search scans lines instead of bisecting
+SCAN_BYTES = 64 << 10
+# Untimed lines read past a probe point before giving up on it
+MAX_PROBE_LINES = 64
+
+_TIME = re.compile(rb'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d')
+
+
+def time_key(dt: datetime) -> bytes:
+    """Timestamp prefix for dt; prefixes compare like the times they encode."""
+    return dt.strftime(TIME_FORMAT).encode('ascii')
+
+
+def line_time(line: bytes) -> Optional[bytes]:
+    """The timestamp prefix of line, or None."""
+    return line[:TIME_PREFIX_LEN] if _TIME.match(line) else None
+
+
+def _probe(f, pos: int) -> Optional[bytes]:
+    """Timestamp of the first timestamped line starting after pos."""
+    f.seek(pos)
+    if pos:
+        f.readline()
+    for _ in range(MAX_PROBE_LINES):
+        line = f.readline()
+        if not line:
+            return None
+        key = line_time(line)
+        if key is not None:
+            return key
+    return None
+
+
+def find_offset(f, size: int, target: bytes) -> int:
+    """Offset of the first line whose timestamp is >= target (size if none)."""
+    lo, hi = 0, size
+    while hi - lo > SCAN_BYTES:
+        mid = (lo + hi) // 2
+        key = _probe(f, mid)
+        if key is not None and key < target:
+            lo = mid
+        else:
+            hi = mid
+    f.seek(lo)
+    if lo:
+        f.readline()
+    offset = f.tell()
+    for line in iter(f.readline, b''):
+        key = line_time(line)
+        if key is not None and key >= target:
+            return offset
+        offset += len(line)
+    return offset
+
+
+def filter_window(lines: Iterable[bytes], since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  stop: Optional[bytes] = None) -> Iterator[bytes]:
+    """Yield the lines timestamped within [since, until].
+
+    Reading stops at the first timestamp after stop, if given.
+    """
+    lo = time_key(since) if since else None
+    hi = time_key(until) if until else None
+    current = None
+    for line in lines:
+        key = line_time(line)
+        if key is not None:
+            current = key
+            if stop is not None and key > stop:
+                return
+        if current is None:
+            if lo is None:
+                yield line
+        elif (lo is None or current >= lo) and (hi is None or current <= hi):
+            yield line
+
+
+def read_window(path: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                slack: float = SLACK) -> Iterator[bytes]:
+    """Yield the lines of path timestamped within [since, until]."""
+    with open(path, 'rb') as f:
+        start = 0
+        if since:
+            start = find_offset(f, os.fstat(f.fileno()).st_size, time_key(since - timedelta(seconds=slack)))
+        f.seek(start)
+        stop = time_key(until + timedelta(seconds=slack)) if until else None
+        yield from filter_window(iter(f.readline, b''), since, until, stop)
@@ -0,0 +1,181 @@
+"""Incremental package inventory snapshots.
+
+Package managers are expensive to ask for the installed set (``rpm -qa`` and
+``apt list --installed`` can take seconds). A snapshot is only refreshed when
+the package database file changed since the previous run; dpkg's status file
+is parsed directly, rpm is queried only in that case. The package list is
+written as sorted ``name version`` lines, replaced atomically and only when
+its content changes, so git sees small, stable diffs.
+"""
+
+import os
+import subprocess
+import tempfile
+
+from typing import Dict, List, Optional, Tuple
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+RPMDB_FILES = (
+    '/var/lib/rpm/rpmdb.sqlite',
+    '/var/lib/rpm/Packages',
+    '/usr/lib/sysimage/rpm/rpmdb.sqlite',
+)
+RPM_QUERY_FORMAT = '%{NAME}.%{ARCH} %{EPOCHNUM}:%{VERSION}-%{RELEASE}\\n'
+
+# Maximum number of package names listed in the summary
+SUMMARY_NAMES = 8
+
+
+def read_dpkg_status(path: str = DPKG_STATUS) -> Dict[str, str]:
+    """Return {name:arch: version} for packages installed according to dpkg."""
+    packages: Dict[str, str] = {}
+    fields: Dict[str, str] = {}
+
+    def flush():
+        if fields.get('Status', '').endswith(' installed') and 'Package' in fields:
+            name = fields['Package']
+            arch = fields.get('Architecture')
+            if arch:
+                name = f'{name}:{arch}'
+            packages[name] = fields.get('Version', '')
+        fields.clear()
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if line == '\n':
+                flush()
+            elif line[0] not in ' \t':
+                key, sep, value = line.partition(':')
+                if sep and key in ('Package', 'Status', 'Architecture', 'Version'):
+                    fields[key] = value.strip()
+    flush()
+    return packages
+
+
+def read_rpm_packages() -> Dict[str, str]:
+    """Return {name.arch: epoch:version-release} from the rpm database."""
+    result = subprocess.run(['rpm', '-qa', '--qf', RPM_QUERY_FORMAT], capture_output=True, check=True)
+    packages: Dict[str, str] = {}
+    for line in result.stdout.decode('utf-8', errors='replace').splitlines():
+        name, _, version = line.partition(' ')
+        if name:
+            packages[name] = version
+    return packages
+
+
+def read_package_list(path: str) -> Dict[str, str]:
+    """Read a package list written by write_package_list()."""
+    packages: Dict[str, str] = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                name, _, version = line.rstrip('\n').partition(' ')
+                if name:
+                    packages[name] = version
+    except FileNotFoundError:
+        pass
+    return packages
+
+
+def write_package_list(path: str, packages: Dict[str, str]) -> None:
+    """Write packages as sorted ``name version`` lines, replacing path atomically."""
+    dir_path = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.pkglist.', dir=dir_path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.writelines(f'{name} {packages[name]}\n' for name in sorted(packages))
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def diff_packages(old: Dict[str, str], new: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+    """Return (added, removed, changed) package names, each sorted."""
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    changed = sorted(name for name in new.keys() & old.keys() if new[name] != old[name])
+    return added, removed, changed
+
+
+def format_summary(added: List[str], removed: List[str], changed: List[str]) -> str:
+    """Compact, space-free summary such as ``+nginx,~openssl,-telnet``."""
+    items = [f'+{n}' for n in added] + [f'~{n}' for n in changed] + [f'-{n}' for n in removed]
+    if len(items) > SUMMARY_NAMES:
+        items = items[:SUMMARY_NAMES] + [f'...{len(items) - SUMMARY_NAMES}more']
+    return ','.join(items)
+
+
+class PackageSnapshot:
+    """Keep a package list file in sync with a package database.
+
+    kind is 'dpkg' or 'rpm'. state_file remembers the database stamp of the
+    last snapshot so unchanged databases are skipped with a few stat calls.
+    """
+
+    def __init__(self, kind: str, list_file: str, state_file: str) -> None:
+        if kind not in ('dpkg', 'rpm'):
+            raise ValueError(f'unsupported package database: {kind}')
+        self.kind = kind
+        self.list_file = list_file
+        self.state_file = state_file
+        self.dpkg_status = DPKG_STATUS
+        self.rpmdb_files = RPMDB_FILES
+
+    def _db_stamp(self) -> Optional[str]:
+        paths = [self.dpkg_status] if self.kind == 'dpkg' else self.rpmdb_files
+        stamps = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamps.append(f'{path}:{st.st_mtime_ns}:{st.st_size}')
+        return ' '.join(stamps) or None
+
+    def _read_state(self) -> str:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def _write_state(self, stamp: str) -> None:
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            f.write(stamp)
+
+    def _read_db(self) -> Dict[str, str]:
+        if self.kind == 'dpkg':
+            return read_dpkg_status(self.dpkg_status)
+        return read_rpm_packages()
+
+    def update(self) -> Optional[str]:
+        """Refresh the list file if the database changed.
+
+        Returns the change summary when the list file was rewritten, or None
+        when nothing changed (database untouched or same package set).
+        """
+        stamp = self._db_stamp()
+        if stamp is None:
+            return None
+        if stamp == self._read_state() and os.path.isfile(self.list_file):
+            return None
+
+        new = self._read_db()
+        old = read_package_list(self.list_file)
+        added, removed, changed = diff_packages(old, new)
+        changed_any = added or removed or changed or not os.path.isfile(self.list_file)
+        if changed_any:
+            write_package_list(self.list_file, new)
+        self._write_state(stamp)
+        if not changed_any:
+            return None
+        return format_summary(added, removed, changed)
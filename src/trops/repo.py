@@ -1,9 +1,9 @@
 import os
-import subprocess
 
 from configparser import ConfigParser
 from textwrap import dedent
 
+from . import gitcmd
 from .trops import TropsBase, TropsError
 
 
@@ -21,7 +21,7 @@ class TropsRepo(TropsBase):
     def _check_current_branch(self):
 
         cmd = self.git_cmd + ['branch', '--show-current']
-        result = subprocess.run(cmd, capture_output=True)
+        result = gitcmd.run(cmd, capture_output=True)
         if result.returncode != 0:
             stderr = result.stderr.decode('utf-8')
             raise TropsError(stderr or 'git branch --show-current failed')
@@ -35,13 +35,13 @@ class TropsRepo(TropsBase):
         if not git_conf.has_option('remote "origin"', 'url'):
             cmd = self.git_cmd + ['remote', 'add',
                                   'origin', self.git_remote]
-            subprocess.call(cmd)
+            gitcmd.call(cmd)
         if not git_conf.has_option(f'branch "{current_branch}"', 'remote'):
             cmd = self.git_cmd + \
                 ['push', '--set-upstream', 'origin', current_branch]
         else:
             cmd = self.git_cmd + ['push']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def pull(self):
         """trops repo pull"""
@@ -56,7 +56,7 @@ class TropsRepo(TropsBase):
 
         os.chdir(pull_work_tree)
         cmd = self.git_cmd + ['pull']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def clone(self):
 
@@ -69,11 +69,11 @@ class TropsRepo(TropsBase):
         # git clone --bare -b <git_remote> <git_dir>
         cmd = ['git', 'clone', '--bare', '-b', f'{ self.args.git_branch }',
                f'{self.git_remote}', self.git_dir]
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
         os.chdir(clone_work_tree)
         cmd = self.git_cmd + ['checkout']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
 
 def repo_push(args, other_args):
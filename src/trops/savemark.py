@@ -0,0 +1,95 @@
+"""Incremental writes of saved logs and tablogs.
+
+``trops log --save`` and ``trops tldr --save`` render a whole file from the
+current log every time they run, but between two saves of the same ticket
+usually only a few rows are added at the end. For each saved file a
+watermark is kept in ``$TROPS_DIR/tmp/savemarks.json``: the size, inode and
+mtime of the file as last written and the SHA-1 of its content. When the
+new content starts with the content behind the watermark and the file was
+not touched since, only the new tail is appended; when nothing was added,
+the file is left alone and the caller skips the commit.
+"""
+
+import hashlib
+import json
+import os
+
+MARKS_FILE = 'savemarks.json'
+
+
+def _marks_path(trops_dir: str) -> str:
+    return os.path.join(trops_dir, 'tmp', MARKS_FILE)
+
+
+def load_marks(trops_dir: str) -> dict:
+    try:
+        with open(_marks_path(trops_dir)) as f:
+            marks = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return marks if isinstance(marks, dict) else {}
+
+
+def _store_mark(trops_dir: str, file_path: str, mark: dict) -> None:
+    marks = load_marks(trops_dir)
+    marks[file_path] = mark
+    marks_path = _marks_path(trops_dir)
+    os.makedirs(os.path.dirname(marks_path), exist_ok=True)
+    tmp_path = f'{ marks_path }.{ os.getpid() }.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(marks, f)
+    os.replace(tmp_path, marks_path)
+
+
+def _unchanged_since(st: os.stat_result, mark: dict) -> bool:
+    """True if the file is still the one the mark was taken from."""
+    return (st.st_size == mark.get('size') and st.st_ino == mark.get('inode')
+            and st.st_mtime_ns == mark.get('mtime_ns'))
+
+
+def save(trops_dir: str, file_path: str, content: str) -> bool:
+    """Make file_path hold content, appending when possible.
+
+    Returns False when the file already held content, so there is
+    nothing to commit.
+    """
+    data = content.encode('utf-8')
+    file_path = os.path.abspath(file_path)
+    mark = load_marks(trops_dir).get(file_path)
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        st = None
+
+    # Bytes of data already in the file, or None to rewrite it
+    if st is not None and mark and _unchanged_since(st, mark):
+        done = mark['size']
+        if len(data) < done or hashlib.sha1(data[:done]).hexdigest() != mark.get('sha1'):
+            done = None
+    elif st is not None and st.st_size == len(data):
+        # No usable mark (first save after upgrading, or the file was
+        # edited): compare with what is there before rewriting it
+        with open(file_path, 'rb') as f:
+            done = len(data) if f.read() == data else None
+    else:
+        done = None
+
+    if done == len(data):
+        changed = False
+    elif done is None:
+        with open(file_path, mode='wb') as f:
+            f.write(data)
+        changed = True
+    else:
+        with open(file_path, mode='ab') as f:
+            f.write(data[done:])
+        changed = True
+
+    st = os.stat(file_path)
+    _store_mark(trops_dir, file_path, {
+        'size': st.st_size,
+        'inode': st.st_ino,
+        'mtime_ns': st.st_mtime_ns,
+        'sha1': hashlib.sha1(data).hexdigest(),
+    })
+    return changed
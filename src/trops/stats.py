@@ -0,0 +1,99 @@
+import os
+
+from datetime import datetime
+from textwrap import dedent
+
+from tabulate import tabulate
+
+from .trace import read_records, ring_path
+from .trops import TropsError
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class TropsStats:
+    """Summarize capture-cmd traces recorded with TROPS_TRACE=1"""
+
+    def __init__(self, args, other_args):
+
+        if other_args:
+            msg = f"""\
+                Unsupported argments: { ', '.join(other_args)}
+                > trops stats --help"""
+            raise TropsError(dedent(msg))
+
+        self.args = args
+        trops_dir = os.getenv('TROPS_DIR')
+        if not trops_dir:
+            raise TropsError('ERROR: The TROPS_DIR environment variable has not been set.')
+        self.ring_file = ring_path(trops_dir)
+
+    def stats(self):
+        records = read_records(self.ring_file)
+        if self.args.last:
+            records = records[-self.args.last:]
+        if not records:
+            print(f'No traces in { self.ring_file } (enable with TROPS_TRACE=1 or trace = True)')
+            return
+
+        phases = {}
+        for record in records:
+            phases.setdefault('total', []).append((record['ms'], record.get('sub', 0)))
+            for name, (ms, count) in record.get('p', {}).items():
+                phases.setdefault(name, []).append((ms, count))
+
+        rows = []
+        for name, samples in phases.items():
+            timings = sorted(ms for ms, _ in samples)
+            rows.append([
+                name,
+                len(samples),
+                percentile(timings, 50),
+                percentile(timings, 95),
+                percentile(timings, 99),
+                timings[-1],
+                sum(count for _, count in samples) / len(samples),
+            ])
+        # slowest phases first, total on top
+        rows.sort(key=lambda row: (row[0] != 'total', -row[3]))
+        print(f'{ len(records) } traced capture-cmd runs (ms)')
+        print(tabulate(rows, ['phase', 'runs', 'p50', 'p95', 'p99', 'max', 'subprocs/run'], floatfmt='.1f'))
+
+        print()
+        print(f'Slowest { min(self.args.top, len(records)) } runs')
+        slowest = sorted(records, key=lambda r: r['ms'], reverse=True)[:self.args.top]
+        rows = []
+        for record in slowest:
+            p = record.get('p', {})
+            worst = max(p, key=lambda name: p[name][0]) if p else ''
+            rows.append([
+                datetime.fromtimestamp(record['t']).strftime('%Y-%m-%d %H:%M:%S'),
+                record['ms'],
+                record.get('sub', 0),
+                f'{ worst } ({ p[worst][0]:.1f})' if worst else '',
+                record.get('cmd', ''),
+            ])
+        print(tabulate(rows, ['time', 'ms', 'subprocs', 'slowest phase', 'command'], floatfmt='.1f'))
+
+
+def trops_stats(args, other_args):
+
+    ts = TropsStats(args, other_args)
+    ts.stats()
+
+
+def add_stats_subparsers(subparsers):
+
+    parser_stats = subparsers.add_parser(
+        'stats', help='show capture-cmd latency traces (TROPS_TRACE=1)')
+    parser_stats.add_argument(
+        '-n', '--last', type=int, help='only use the last N traced runs')
+    parser_stats.add_argument(
+        '--top', type=int, default=10, help='number of slowest runs to list (default: %(default)s)')
+    parser_stats.set_defaults(handler=trops_stats)
@@ -7,6 +7,7 @@ from datetime import datetime
 import subprocess
 
 
+from . import gitcmd
 from .trops import TropsError
 from .utils import absolute_path
 
@@ -53,7 +54,7 @@ class TropsTablogGet:
 
     def _git_for_env(self, env_name, args_list):
         # Call git directly; do not depend on TropsMain/git_dir/work_tree
-        result = subprocess.run(['git'] + args_list)
+        result = gitcmd.run(['git'] + args_list)
         if result.returncode != 0:
             raise TropsError(f"git {' '.join(args_list[:2])} failed with code {result.returncode}")
 
@@ -5,6 +5,7 @@ import sys
 from tabulate import tabulate
 from textwrap import dedent
 
+from . import savemark
 from .trops import TropsCLI, TropsError
 from .utils import pick_out_repo_name_from_git_remote
 
@@ -238,9 +239,10 @@ class TropsTLDR(TropsCLI):
 
         file_path = tablog_dir + '/' + file_name
 
-        with open(file_path, mode='w') as f:
-            f.write(tablog_out)
-
+        # Appends only the rows added since the last save; nothing to
+        # commit or push when there are none
+        if not savemark.save(self.trops_dir, file_path, tablog_out):
+            return
         self._touch_file(file_path)
         # If saved, push to remote when configured
         if getattr(self, 'git_remote', False):
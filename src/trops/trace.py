@@ -0,0 +1,161 @@
+"""Opt-in latency tracing of ``trops capture-cmd``.
+
+Enabled with ``TROPS_TRACE=1`` (covers the whole run) or ``trace = True`` in
+the env's config (starts after the config was read). While a trace is
+active, ``mark(phase)`` attributes the time since the previous mark, and the
+subprocesses started in between, to ``phase``. ``finish()`` appends one
+compact JSON record to a fixed-size ring file, ``$TROPS_DIR/tmp/trace.ring``,
+that ``trops stats`` summarizes.
+
+When tracing is off, ``mark()`` is a global lookup and a return; nothing is
+timed, wrapped or written.
+"""
+
+import os
+import time
+
+RING_FILE = 'trace.ring'
+RING_MAGIC = b'TRR1'
+RING_SLOTS = 2048
+SLOT_SIZE = 512
+# magic, slot count (4 bytes), records written so far (8 bytes)
+HEADER_SIZE = 16
+
+_tracer = None
+
+
+class Tracer:
+    """Per-run phase timings and subprocess counts."""
+
+    def __init__(self, command: str = ''):
+        import subprocess
+
+        self.command = command
+        self.start = self.last = time.monotonic()
+        self.wall = time.time()
+        self.phases = {}
+        self.subprocesses = 0
+        self._last_subprocesses = 0
+        self._subprocess = subprocess
+        self._popen_init = subprocess.Popen.__init__
+        tracer = self
+        popen_init = self._popen_init
+
+        def counting_init(popen, *args, **kwargs):
+            tracer.subprocesses += 1
+            popen_init(popen, *args, **kwargs)
+
+        # subprocess.run/call/check_output all construct a Popen
+        subprocess.Popen.__init__ = counting_init
+
+    def mark(self, phase: str) -> None:
+        now = time.monotonic()
+        ms, count = self.phases.get(phase, (0.0, 0))
+        self.phases[phase] = (ms + (now - self.last) * 1000, count + self.subprocesses - self._last_subprocesses)
+        self.last = now
+        self._last_subprocesses = self.subprocesses
+
+    def stop(self) -> None:
+        self._subprocess.Popen.__init__ = self._popen_init
+
+    def record(self, status=None) -> dict:
+        return {
+            't': round(self.wall, 3),
+            'cmd': self.command[:80],
+            'ms': round((self.last - self.start) * 1000, 3),
+            'sub': self.subprocesses,
+            'rc': status,
+            'p': {name: [round(ms, 3), count] for name, (ms, count) in self.phases.items()},
+        }
+
+
+def start(command: str = '') -> Tracer:
+    """Start tracing this process (no-op if already started)."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(command)
+    return _tracer
+
+
+def active() -> bool:
+    return _tracer is not None
+
+
+def mark(phase: str) -> None:
+    if _tracer is not None:
+        _tracer.mark(phase)
+
+
+def finish(trops_dir: str, status=None) -> None:
+    """Stop tracing and append the record to the ring file."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    tracer.mark('exit')
+    tracer.stop()
+    try:
+        append_record(ring_path(trops_dir), tracer.record(status))
+    except OSError:
+        # tracing must never break the prompt
+        pass
+
+
+def ring_path(trops_dir: str) -> str:
+    return os.path.join(trops_dir, 'tmp', RING_FILE)
+
+
+def _encode(record: dict) -> bytes:
+    import json
+
+    data = json.dumps(record, separators=(',', ':')).encode()
+    while len(data) >= SLOT_SIZE and record['p']:
+        # keep the slowest phases if the record does not fit its slot
+        fastest = min(record['p'], key=lambda name: record['p'][name][0])
+        del record['p'][fastest]
+        data = json.dumps(record, separators=(',', ':')).encode()
+    return data[:SLOT_SIZE - 1].ljust(SLOT_SIZE - 1) + b'\n'
+
+
+def append_record(path: str, record: dict) -> None:
+    """Write record into the next slot of the ring file, creating it if needed."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        header = os.pread(fd, HEADER_SIZE, 0)
+        if len(header) == HEADER_SIZE and header[:4] == RING_MAGIC:
+            slots = int.from_bytes(header[4:8], 'little')
+            written = int.from_bytes(header[8:16], 'little')
+        else:
+            slots, written = RING_SLOTS, 0
+        os.pwrite(fd, _encode(record), HEADER_SIZE + (written % slots) * SLOT_SIZE)
+        os.pwrite(fd, RING_MAGIC + slots.to_bytes(4, 'little') + (written + 1).to_bytes(8, 'little'), 0)
+    finally:
+        os.close(fd)
+
+
+def read_records(path: str) -> list:
+    """Return the records in the ring file, oldest first."""
+    import json
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return []
+    if len(data) < HEADER_SIZE or data[:4] != RING_MAGIC:
+        return []
+    slots = int.from_bytes(data[4:8], 'little')
+    written = int.from_bytes(data[8:16], 'little')
+    first = written - min(written, slots)
+    records = []
+    for n in range(first, written):
+        offset = HEADER_SIZE + (n % slots) * SLOT_SIZE
+        try:
+            records.append(json.loads(data[offset:offset + SLOT_SIZE]))
+        except ValueError:
+            continue
+    return records
@@ -1,6 +1,7 @@
 import logging
 import os
 import subprocess
+import sys
 
 from configparser import ConfigParser
 from getpass import getuser
@@ -9,6 +10,7 @@ from socket import gethostname
 from textwrap import dedent
 from typing import Any, List
 
+from . import gitcmd, trace
 from .utils import absolute_path, strtobool
 
 
@@ -85,9 +87,11 @@ class TropsBase:
                 if self.trops_tags:
                     self.trops_tags = self.trops_tags.replace(' ', '')
 
+        trace.mark('config')
 
         if self.trops_logfile:
             self.setup_logging()
+            trace.mark('logger')
 
         # Primary tag extraction (first tag), e.g. "#123" from "#123,TEST"
         self.trops_prim_tag = None
@@ -107,6 +111,121 @@ class TropsBase:
                             level=logging.DEBUG)
         self.logger = logging.getLogger()
 
+    @property
+    def git_session(self) -> gitcmd.GitSession:
+        """Shared GitSession for this run's git_cmd, started on first use."""
+        session = self.__dict__.get('_git_session')
+        if session is None:
+            session = self._git_session = gitcmd.GitSession(self.git_cmd)
+        return session
+
+    @property
+    def object_store(self):
+        """trops.gitobj.ObjectStore of git_dir, or None if it cannot be used.
+
+        ``object_reader = git`` in the env's config turns the in-process
+        reader off.
+        """
+        if '_object_store' not in self.__dict__:
+            store = None
+            if hasattr(self, 'git_dir') and self.get_config_value('object_reader', default='python') == 'python':
+                from .gitobj import GitObjectError, ObjectStore
+                try:
+                    store = ObjectStore(self.git_dir)
+                except (GitObjectError, OSError):
+                    pass
+            self._object_store = store
+        return self._object_store
+
+    def read_blob(self, spec: str, max_size: int = None):
+        """Content of spec ('<rev>:<path>') read in-process, or None.
+
+        None means spec is not a blob, is larger than max_size, or cannot be
+        read without git (see trops.gitobj); callers then run git.
+        """
+        store = self.object_store
+        if store is None:
+            return None
+        from .gitobj import GitObjectError
+
+        try:
+            oid = store.resolve(spec)
+            obj_type, size = store.info(oid)
+            if obj_type != 'blob' or (max_size is not None and size > max_size):
+                return None
+            return store.read(oid)[1]
+        except (GitObjectError, OSError, ValueError, IndexError):
+            return None
+
+    @property
+    def chunk_store_dir(self) -> str:
+        """Root of the chunk store for large files (see trops.chunkstore)."""
+        return os.path.join(self.trops_dir, 'chunks')
+
+    def _apply_large_file_policy(self, file_path: str, rel_path: str) -> None:
+        """Route rel_path through the chunk store if file_path is over the
+        env's large_file_threshold; git then stores a pointer to it."""
+        value = self.get_config_value('large_file_threshold', default='')
+        if not value:
+            return
+        from .logarchive import parse_size
+        try:
+            threshold = parse_size(value)
+        except ValueError as e:
+            raise TropsError(f'ERROR: large_file_threshold: {e}')
+        try:
+            if os.path.getsize(file_path) < threshold:
+                return
+        except OSError:
+            return
+        from .chunkstore import track_path
+        track_path(self.git_dir, self.git_cmd, rel_path, self.chunk_store_dir)
+
+    def read_pointer(self, spec: str):
+        """The chunk store pointer (trops.chunkstore.Pointer) at spec, or None."""
+        if not hasattr(self, 'git_dir') or not os.path.isdir(self.chunk_store_dir):
+            # no env, or nothing was ever stored in chunks
+            return None
+        from .chunkstore import POINTER_MAX, parse_pointer
+
+        data = self.read_blob(spec, max_size=POINTER_MAX)
+        if data is None:
+            try:
+                obj = self.git_session.info(spec)
+                if obj is not None and obj.type == 'blob' and obj.size <= POINTER_MAX:
+                    obj = self.git_session.read(obj.oid)
+                    data = obj.data if obj is not None else None
+            except RuntimeError:
+                return None
+        return parse_pointer(data) if data else None
+
+    def write_chunked(self, pointer) -> None:
+        """Write the content behind pointer to stdout."""
+        from .chunkstore import ChunkStore, ChunkStoreError
+
+        sys.stdout.flush()
+        try:
+            ChunkStore(self.chunk_store_dir).copy_to(pointer, sys.stdout.buffer)
+        except ChunkStoreError as e:
+            raise TropsError(f'ERROR: {e}')
+        sys.stdout.buffer.flush()
+
+    def _commit_file(self, rel_path: str, git_msg: str, log_line: str):
+        """Commit rel_path through the git dir's commit queue (trops.commitq).
+
+        log_line is the FL log message with commitq.HASH in place of the
+        commit. Returns a CommitResult, or None if another process holds the
+        queue's lock and commits (and logs) the file instead.
+        """
+        from .commitq import CommitQueue
+
+        queue = CommitQueue(self.git_dir, self.git_cmd, self.work_tree)
+        result = queue.submit(rel_path, git_msg, log_line, self.trops_logfile,
+                              f'{ self.username }@{ self.hostname }')
+        if result is not None and result.commit:
+            self.git_session.set_tracked(rel_path)
+        return result
+
     def get_config_value(self, key: str, default: str = None) -> str:
         """Get a value from the configuration file."""
         try:
@@ -116,30 +235,51 @@ class TropsBase:
                 return default
             raise TropsError(f'{key} does not exist in your configuration file')
         
-    def add_and_commit_file(self, file_path) -> None:
+    def log_rotation_settings(self):
+        """Return (codec, max_bytes, max_age) from log_compress, log_rotate_size
+        and log_rotate_age; the limits are None when not configured."""
+        from .logarchive import CODECS, parse_age, parse_size
+
+        codec = self.get_config_value('log_compress', default='gzip')
+        if codec not in CODECS:
+            raise TropsError(f"log_compress must be one of { ', '.join(CODECS) }, not { codec }")
+        try:
+            size = self.get_config_value('log_rotate_size', default='')
+            age = self.get_config_value('log_rotate_age', default='')
+            return codec, parse_size(size) if size else None, parse_age(age) if age else None
+        except ValueError as e:
+            raise TropsError(f'ERROR: {e}')
+
+    def add_and_commit_file(self, file_path, note: str = None) -> None:
+        """Add and commit file_path, logging an FL entry when it changed.
+
+        note, if given, is attached to the log note, e.g. ``UPDATE(+nginx)``.
+        """
         rel_path = self.to_work_tree_rel_path(file_path)
-        cmd = self.git_cmd + ['ls-files', rel_path]
-        result = subprocess.run(cmd, capture_output=True)
-        if result.stdout.decode("utf-8"):
+        if self.git_session.is_tracked(rel_path):
             git_msg = f"Update { rel_path }"
             log_note = 'UPDATE'
         else:
             git_msg = f"Add { rel_path }"
             log_note = 'ADD'
+        if note:
+            log_note = f"{ log_note }({ note })"
         if self.trops_tags:
             git_msg = f"{ git_msg } ({ self.trops_tags })"
+        self._apply_large_file_policy(file_path, rel_path)
         cmd = self.git_cmd + ['add', rel_path]
-        subprocess.call(cmd)
+        if gitcmd.call(cmd) == 0:
+            self.git_session.set_tracked(rel_path)
         cmd = self.git_cmd + ['commit', '-m', git_msg, rel_path]
         # Commit the change if needed
-        result = subprocess.run(cmd, capture_output=True)
+        result = gitcmd.run(cmd, capture_output=True)
         # If there's an update, log it in the log file
         if result.returncode == 0:
             msg = result.stdout.decode('utf-8').splitlines()[0]
             print(msg)
             cmd = self.git_cmd + ['log', '--oneline', '-1', '--', rel_path]
             try:
-                output = subprocess.check_output(cmd).decode("utf-8").split()
+                output = gitcmd.check_output(cmd).decode("utf-8").split()
             except subprocess.CalledProcessError:
                 output = []
             if rel_path in output:
@@ -211,7 +351,7 @@ class TropsCLI(TropsBase):
 
         if getattr(self.args, 'verbose', False):
             print('WRAP:', ' '.join(full_cmd))
-        result = subprocess.run(full_cmd, env=git_env)
+        result = gitcmd.run(full_cmd, env=git_env)
         if result.returncode != 0:
             raise TropsError(f'git command failed with exit code {result.returncode}')
 
@@ -221,7 +361,7 @@ class TropsCLI(TropsBase):
         """Git status wrapper command"""
 
         cmd = self.git_cmd + ['status']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def ll(self) -> None:
         """Shows the list of git-tracked files"""
@@ -238,7 +378,7 @@ class TropsCLI(TropsBase):
         else:
             cmd = self.git_cmd + ['ls-files']
 
-        output = subprocess.check_output(cmd)
+        output = gitcmd.check_output(cmd)
 
         # For each tracked file (relative to work_tree), show its absolute file metadata
         abs_work_tree = os.path.realpath(self.work_tree)
@@ -249,20 +389,40 @@ class TropsCLI(TropsBase):
     def show(self) -> None:
         """trops show hash[:path]"""
 
+        from .chunkstore import parse_pointer
+
+        pointer = None
+        if not sys.stdout.isatty():
+            # git would not page here either, so the output is the same
+            from .gitobj import INLINE_MAX
+            data = self.read_blob(self.args.commit, max_size=INLINE_MAX)
+            if data is not None:
+                pointer = parse_pointer(data)
+                if pointer is None:
+                    sys.stdout.flush()
+                    sys.stdout.buffer.write(data)
+                    sys.stdout.buffer.flush()
+                    return
+        if pointer is None:
+            pointer = self.read_pointer(self.args.commit)
+        if pointer is not None:
+            # Large file: git only has a pointer to the chunk store
+            self.write_chunked(pointer)
+            return
         cmd = self.git_cmd + ['show', self.args.commit]
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def branch(self) -> None:
         """trops branch"""
 
         cmd = self.git_cmd + ['branch', '-a']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def fetch(self) -> None:
         """trops fetch"""
 
         cmd = self.git_cmd + ['fetch', '-a']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     @staticmethod
     def _is_destructive_git(args: List[str]) -> bool:
@@ -298,7 +458,7 @@ class TropsCLI(TropsBase):
             return
 
         # Determine current branch
-        result = subprocess.run(self.git_cmd + ['branch', '--show-current'], capture_output=True)
+        result = gitcmd.run(self.git_cmd + ['branch', '--show-current'], capture_output=True)
         current_branch = result.stdout.decode('utf-8').strip() if result.returncode == 0 else ''
         if not current_branch:
             return
@@ -308,14 +468,14 @@ class TropsCLI(TropsBase):
 
         # Ensure origin exists
         if not git_conf.has_option('remote "origin"', 'url'):
-            subprocess.call(self.git_cmd + ['remote', 'add', 'origin', self.git_remote])
+            gitcmd.call(self.git_cmd + ['remote', 'add', 'origin', self.git_remote])
 
         # Set upstream if missing, else regular push
         if not git_conf.has_option(f'branch "{current_branch}"', 'remote'):
             cmd = self.git_cmd + ['push', '--set-upstream', 'origin', current_branch]
         else:
             cmd = self.git_cmd + ['push']
-        subprocess.call(cmd)
+        gitcmd.call(cmd)
 
     def _normalize_git_paths(self, args: List[str]) -> List[str]:
         """Convert absolute paths under work_tree to relative pathspecs without
@@ -423,15 +583,15 @@ class TropsCLI(TropsBase):
 
         # Use path relative to work_tree for git commands
         rel_path = self.to_work_tree_rel_path(file_path)
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+            raise TropsError(f"{ file_path } is outside the work tree { self.work_tree }")
         # Check if the path is in the git repo
-        cmd = self.git_cmd + ['ls-files', rel_path]
-        result = subprocess.run(cmd, capture_output=True)
-        if result.returncode != 0:
-            stderr = result.stderr.decode('utf-8')
-            raise TropsError(stderr or 'git ls-files failed')
-        output = result.stdout.decode('utf-8')
+        try:
+            tracked = self.git_session.is_tracked(rel_path)
+        except RuntimeError as e:
+            raise TropsError(str(e))
         # Set the message based on the output
-        if output:
+        if tracked:
             git_msg = f"Update { rel_path }"
             log_note = "UPDATE"
         else:
@@ -440,29 +600,28 @@ class TropsCLI(TropsBase):
         if self.trops_tags:
             git_msg = f"{ git_msg } ({ self.trops_tags })"
         # Add and commit
-        cmd = self.git_cmd + ['add', '--', rel_path]
-        subprocess.call(cmd)
-        cmd = self.git_cmd + ['commit', '-m', git_msg, '--', rel_path]
-        subprocess.call(cmd)
-        cmd = self.git_cmd + ['log', '--oneline', '-1', '--', rel_path]
-        try:
-            output = subprocess.check_output(cmd).decode("utf-8").split()
-        except subprocess.CalledProcessError:
-            output = []
-        if rel_path in output:
-            env = self.trops_env
-            commit = output[0]
-            path = rel_path
-            mode = oct(os.stat(file_path).st_mode)[-4:]
-            owner = Path(file_path).owner()
-            group = Path(file_path).group()
-            message = f"FL trops show { commit }:{ path }  #> { log_note } O={ owner },G={ group },M={ mode }"
-            if self.trops_sid:
-                message = message + f" TROPS_SID={ self.trops_sid }"
-            message = message + f" TROPS_ENV={ env }"
-            if self.trops_tags:
-                message = message + f" TROPS_TAGS={self.trops_tags}"
-            self.logger.info(message)
+        from .commitq import HASH
+
+        self._apply_large_file_policy(file_path, rel_path)
+        env = self.trops_env
+        path = rel_path
+        mode = oct(os.stat(file_path).st_mode)[-4:]
+        owner = Path(file_path).owner()
+        group = Path(file_path).group()
+        message = f"FL trops show { HASH }:{ path }  #> { log_note } O={ owner },G={ group },M={ mode }"
+        if self.trops_sid:
+            message = message + f" TROPS_SID={ self.trops_sid }"
+        message = message + f" TROPS_ENV={ env }"
+        if self.trops_tags:
+            message = message + f" TROPS_TAGS={self.trops_tags}"
+        result = self._commit_file(rel_path, git_msg, message)
+        if result is None:
+            print(f"Queued { rel_path } (another trops process is committing)")
+        elif result.commit:
+            print(result.summary)
+            self.logger.info(message.replace(HASH, result.commit, 1))
+        else:
+            print(f"No changes in { rel_path }")
 
     def drop(self) -> None:
 
@@ -487,22 +646,25 @@ class TropsCLI(TropsBase):
 
         rel_path = self.to_work_tree_rel_path(file_path)
         # Check if the path is in the git repo
-        cmd = self.git_cmd + ['ls-files', rel_path]
-        output = subprocess.check_output(cmd).decode("utf-8")
+        try:
+            tracked = self.git_session.is_tracked(rel_path)
+        except RuntimeError as e:
+            raise TropsError(str(e))
         # Set the message based on the output
-        if output:
+        if tracked:
             cmd = self.git_cmd + ['rm', '--cached', '--', rel_path]
-            subprocess.call(cmd)
+            if gitcmd.call(cmd) == 0:
+                self.git_session.set_tracked(rel_path, False)
             git_msg = f"Goodbye { rel_path }"
             if self.trops_tags:
                 git_msg = f"{ git_msg } ({ self.trops_tags })"
             cmd = self.git_cmd + ['commit', '-m', git_msg]
-            subprocess.call(cmd)
+            gitcmd.call(cmd)
         else:
             message = f"{ file_path } is not in the git repo"
             raise TropsError(message)
         cmd = self.git_cmd + ['log', '--oneline', '-1', '--', rel_path]
-        output = subprocess.check_output(cmd).decode("utf-8").split()
+        output = gitcmd.check_output(cmd).decode("utf-8").split()
         message = f"FL trops show { output[0] }:{ rel_path }  #> BYE BYE"
         if self.trops_sid:
             message = message + f" TROPS_SID={ self.trops_sid }"
@@ -3,6 +3,7 @@ import os
 
 from datetime import datetime
 from random import randint
+from typing import Optional
 
 
 
@@ -96,3 +97,181 @@ def sid_seed_text():
             d[chr(i+c)] = chr((i+13) % 26 + c)
 
     return "".join([d.get(c, c) for c in s if c.isalnum()])
+
+
+# Memoized results of find_git_work_tree(), keyed by real directory path.
+_git_work_tree_cache = {}
+
+
+def _git_ceiling_dirs():
+    """Return the real paths listed in GIT_CEILING_DIRECTORIES."""
+    value = os.environ.get('GIT_CEILING_DIRECTORIES', '')
+    return [os.path.realpath(d) for d in value.split(os.pathsep) if d and os.path.isabs(d)]
+
+
+def _has_dot_git(dir_path: str) -> bool:
+    """Return True if dir_path holds a usable .git directory or gitfile."""
+    dot_git = os.path.join(dir_path, '.git')
+    try:
+        if os.path.isdir(dot_git):
+            return os.path.exists(os.path.join(dot_git, 'HEAD'))
+        if os.path.isfile(dot_git):
+            with open(dot_git, 'rb') as f:
+                return f.read(8) == b'gitdir: '
+    except OSError:
+        pass
+    return False
+
+
+def find_git_work_tree(path: str) -> Optional[str]:
+    """Return the root of the git work tree containing path, or None.
+
+    Follows the same discovery rules as git without forking it: walk up the
+    parent directories looking for a .git entry, never entering a directory
+    listed in GIT_CEILING_DIRECTORIES and stopping at filesystem boundaries
+    unless GIT_DISCOVERY_ACROSS_FILESYSTEM is set. Results are memoized per
+    directory for the lifetime of the process.
+    """
+    if os.path.isdir(path):
+        start = os.path.realpath(path)
+    else:
+        start = os.path.realpath(os.path.dirname(path) or '.')
+    if start in _git_work_tree_cache:
+        return _git_work_tree_cache[start]
+
+    try:
+        start_dev = os.stat(start).st_dev
+    except OSError:
+        # git -C <missing dir> fails, so the path is not inside a work tree
+        return None
+
+    ceilings = [c for c in _git_ceiling_dirs() if start.startswith(c.rstrip('/') + '/')]
+    ceiling_len = max((len(c.rstrip('/')) for c in ceilings), default=-1)
+    try:
+        across_fs = strtobool(os.environ.get('GIT_DISCOVERY_ACROSS_FILESYSTEM', 'false'))
+    except ValueError:
+        across_fs = False
+
+    visited = []
+    found = None
+    current = start
+    while True:
+        if current in _git_work_tree_cache:
+            found = _git_work_tree_cache[current]
+            break
+        # Directories inside a .git directory are not part of a work tree
+        if os.path.basename(current) == '.git':
+            break
+        visited.append(current)
+        if _has_dot_git(current):
+            found = current
+            break
+        parent = os.path.dirname(current)
+        if parent == current or len(parent.rstrip('/')) <= ceiling_len:
+            break
+        if not across_fs:
+            try:
+                if os.stat(parent).st_dev != start_dev:
+                    break
+            except OSError:
+                break
+        current = parent
+
+    for d in visited:
+        _git_work_tree_cache[d] = found
+    return found
+
+
+def is_in_git_work_tree(path: str) -> bool:
+    """Return True if path lives inside a git work tree (see find_git_work_tree)."""
+    if os.environ.get('GIT_DIR'):
+        # An explicit GIT_DIR overrides discovery entirely; let git decide.
+        from . import gitcmd
+        parent_dir = os.path.dirname(path) or '.'
+        result = gitcmd.run(['git', '-C', parent_dir, 'rev-parse', '--is-inside-work-tree'], capture_output=True)
+        return result.returncode == 0
+    return find_git_work_tree(path) is not None
+
+
+# Bytes moved per read/write when copying or shifting file content
+COPY_CHUNK = 1 << 20
+
+
+def _copy_fd(src_fd: int, dst_fd: int) -> None:
+    """Copy the rest of src_fd to dst_fd, in the kernel when possible."""
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range is not None:
+        try:
+            while copy_file_range(src_fd, dst_fd, COPY_CHUNK * 64):
+                pass
+            return
+        except OSError:
+            # EXDEV, ENOSYS, EINVAL...: the offsets are where the kernel
+            # left them, so a plain copy can carry on from there
+            pass
+    while True:
+        chunk = os.read(src_fd, COPY_CHUNK)
+        if not chunk:
+            return
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+
+def _shift_in_place(fd: int, header: bytes, size: int) -> None:
+    """Insert header at offset 0 of fd by moving its content up, last chunk first."""
+    shift = len(header)
+    pos = size
+    while pos > 0:
+        start = max(0, pos - COPY_CHUNK)
+        chunk = os.pread(fd, pos - start, start)
+        os.pwrite(fd, chunk, start + shift)
+        pos = start
+    os.pwrite(fd, header, 0)
+
+
+def prepend_line(path: str, line: str) -> bool:
+    """Put line at the top of the file at path, unless it already starts with it.
+
+    The header and the original content are streamed into a temporary file
+    next to path, which then replaces it with the original mode and owner.
+    When that is not possible (the directory is not writable, or the owner
+    cannot be kept) the content is shifted in place in bounded chunks
+    instead. Returns True if the file was changed.
+    """
+    import tempfile
+
+    prefix = line.encode('utf-8')
+    header = prefix + b'\n'
+    path = os.path.realpath(path)
+    with open(path, 'rb', buffering=0) as src:
+        if src.read(len(prefix)) == prefix:
+            return False
+        src.seek(0)
+        st = os.fstat(src.fileno())
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.trops-ttee.', dir=os.path.dirname(path))
+        except PermissionError:
+            fd = None
+        if fd is not None:
+            try:
+                if (st.st_uid, st.st_gid) != (os.geteuid(), os.getegid()):
+                    os.fchown(fd, st.st_uid, st.st_gid)
+                os.fchmod(fd, st.st_mode & 0o7777)
+                os.write(fd, header)
+                _copy_fd(src.fileno(), fd)
+                os.close(fd)
+                fd = None
+                os.replace(tmp_path, path)
+                return True
+            except PermissionError:
+                # Cannot keep the owner (or mode): fall back to in-place
+                pass
+            finally:
+                if fd is not None:
+                    os.close(fd)
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+    with open(path, 'r+b', buffering=0) as f:
+        _shift_in_place(f.fileno(), header, os.fstat(f.fileno()).st_size)
+    return True
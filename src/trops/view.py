@@ -1,14 +1,141 @@
 import os
+import re
 import subprocess
+import threading
 import webbrowser
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
 from urllib.parse import urlparse, parse_qs
 
 from textwrap import dedent
 
+from . import gitcmd
 from .trops import TropsCLI, TropsError
 from .utils import absolute_path
 
+# Response bodies are sent in pieces of this size
+CHUNK_SIZE = 64 << 10
+# Content with a NUL byte in its first SNIFF_BYTES is binary (as in git)
+SNIFF_BYTES = 8000
+HEX_PREVIEW_BYTES = 4096
+# Front matter is only looked for in the head of a file
+FRONT_MATTER_MAX = 64 << 10
+
+_RANGE = re.compile(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*')
+
+
+def parse_range(header: str, size: int):
+    """(first, last) byte of a single 'bytes=' range, None to send everything.
+
+    Raises ValueError if the range cannot be satisfied. Multiple ranges and
+    malformed headers are ignored, as RFC 9110 allows.
+    """
+    m = _RANGE.fullmatch(header or '')
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if m.group(1):
+        first = int(m.group(1))
+        if m.group(2) and int(m.group(2)) < first:
+            return None
+        if first >= size:
+            raise ValueError(header)
+        last = int(m.group(2)) if m.group(2) else size - 1
+        return first, min(last, size - 1)
+    suffix = int(m.group(2))
+    if suffix == 0 or size == 0:
+        raise ValueError(header)
+    return max(0, size - suffix), size - 1
+
+
+def is_binary(head: bytes) -> bool:
+    return b'\0' in head[:SNIFF_BYTES]
+
+
+def hex_preview(data: bytes, size=None) -> str:
+    """hexdump -C style preview of the first bytes of binary content."""
+    total = f'{size} bytes' if size is not None else 'unknown size'
+    lines = [f'Binary content ({total}); first {len(data)} bytes shown. Add raw=1 to the URL to download.', '']
+    for offset in range(0, len(data), 16):
+        row = data[offset:offset + 16]
+        hex_part = ' '.join(f'{b:02x}' for b in row)
+        text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in row)
+        lines.append(f'{offset:08x}  {hex_part:<47}  |{text}|')
+    return '\n'.join(lines) + '\n'
+
+
+def peek(chunks, n: int):
+    """Read at least n bytes (unless shorter) from chunks; return (head, all chunks)."""
+    head = []
+    got = 0
+    for chunk in chunks:
+        head.append(chunk)
+        got += len(chunk)
+        if got >= n:
+            break
+    return b''.join(head), chain(head, chunks)
+
+
+def front_matter_end(path: str) -> int:
+    """Offset of the content after a leading YAML front matter block (0 if none)."""
+    with open(path, 'rb') as f:
+        head = f.read(FRONT_MATTER_MAX)
+    lines = head.split(b'\n')
+    if lines[0].strip() != b'---':
+        return 0
+    pos = len(lines[0]) + 1
+    for line in lines[1:]:
+        pos += len(line) + 1
+        if line.strip() == b'---':
+            pos = min(pos, len(head))
+            while head[pos:pos + 1] == b'\n':
+                pos += 1
+            return pos
+    return 0
+
+
+def file_chunks(path: str, start: int = 0, length=None):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def memory_chunks(data: bytes, start: int = 0, length=None):
+    end = len(data) if length is None else min(len(data), start + length)
+    view = memoryview(data)
+    for pos in range(start, end, CHUNK_SIZE):
+        yield bytes(view[pos:min(pos + CHUNK_SIZE, end)])
+
+
+def pipe_chunks(cmd, start: int = 0, length=None):
+    """Stream the stdout of cmd from byte start; the process is killed if not read to the end."""
+    proc = gitcmd.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while start > 0:
+            skipped = len(proc.stdout.read(min(start, CHUNK_SIZE)))
+            if not skipped:
+                return
+            start -= skipped
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = proc.stdout.read1(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
 
 class TropsView(TropsCLI):
     """View tracked file contents from the repository.
@@ -57,71 +184,197 @@ class TropsView(TropsCLI):
                     raise TropsError('trops tablog get -auf failed')
             self._serve_web(self.target_path)
         else:
-            cmd = self.git_cmd + ['show', f'{self.commit}:{self.rel_path}']
-            subprocess.call(cmd)
+            spec = f'{self.commit}:{self.rel_path}'
+            pointer = self.read_pointer(spec)
+            if pointer is not None:
+                self.write_chunked(pointer)
+                return
+            cmd = self.git_cmd + ['show', spec]
+            gitcmd.call(cmd)
 
     def _serve_web(self, folder: str) -> None:
+        httpd = ThreadingHTTPServer(('127.0.0.1', 8001), self._make_handler(folder))
+        print('Serving trops view on http://localhost:8001 (Ctrl+C to stop)')
+        # Optionally open browser
+        if not self.no_browser:
+            try:
+                webbrowser.open('http://localhost:8001', new=2)
+            except Exception:
+                pass
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print('\nStopping server...')
+        finally:
+            httpd.server_close()
+
+    def _object_info(self, spec: str):
+        """(oid, type, size) of spec, or None if it does not exist."""
+        from .gitobj import GitObjectError
+
+        with self._store_lock:
+            store = self.object_store
+            if store is not None:
+                try:
+                    oid = store.resolve(spec)
+                    return (oid,) + store.info(oid)
+                except (GitObjectError, OSError, ValueError, IndexError):
+                    pass
+        obj = self.git_session.info(spec)
+        return None if obj is None else (obj.oid, obj.type, obj.size)
+
+    def _read_object(self, oid: str) -> bytes:
+        from .gitobj import GitObjectError
+
+        with self._store_lock:
+            store = self.object_store
+            if store is not None:
+                try:
+                    return store.read(oid)[1]
+                except (GitObjectError, OSError, ValueError, IndexError):
+                    pass
+        obj = self.git_session.read(oid)
+        if obj is None:
+            raise TropsError(f'object not found: {oid}')
+        return obj.data
+
+    def _object_body(self, spec: str):
+        """(size, chunks) for /git, or None when spec does not exist.
+
+        Blobs have a size and can be read from any offset: small ones are
+        read in one piece, larger ones are streamed from git cat-file.
+        Other objects are rendered by git show and streamed with size None.
+        Pointers to the chunk store are served from the chunk store.
+        """
+        from .chunkstore import POINTER_MAX, ChunkStore, parse_pointer
+        from .gitobj import INLINE_MAX
+
+        info = self._object_info(spec)
+        if info is None:
+            return None
+        oid, obj_type, size = info
+        if obj_type != 'blob':
+            return None, lambda start, length: pipe_chunks(self.git_cmd + ['show', spec])
+        if size <= POINTER_MAX:
+            data = self._read_object(oid)
+            pointer = parse_pointer(data)
+            if pointer is not None:
+                store = ChunkStore(self.chunk_store_dir)
+                if not store.has(pointer):
+                    raise TropsError(f'chunks of {spec} are missing from {store.root}')
+                return pointer.size, lambda start, length: store.iter_range(pointer, start, length, CHUNK_SIZE)
+            return size, lambda start, length: memory_chunks(data, start, length)
+        if size <= INLINE_MAX:
+            return size, lambda start, length: memory_chunks(self._read_object(oid), start, length)
+        return size, lambda start, length: pipe_chunks(self.git_cmd + ['cat-file', 'blob', oid], start, length)
+
+    def _make_handler(self, folder: str):
         md_files = [f for f in os.listdir(folder) if f.endswith('.md')]
         md_files.sort()
 
-        # Use trops CLI for show operations to respect trops configuration
-        trops_cmd = ['trops']
+        # Blobs are read in-process, else through the run's cat-file
+        # session; other objects (commits with their diff, trees) go
+        # through git show. Request threads share one object store.
+        view = self
+        self._store_lock = threading.Lock()
 
         class Handler(BaseHTTPRequestHandler):
-            def _send(self, code: int, body: str, content_type: str = 'text/html; charset=utf-8'):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, code: int, body: str, content_type: str = 'text/html; charset=utf-8', headers=()):
+                data = body.encode('utf-8')
                 self.send_response(code)
                 self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
                 self.end_headers()
-                self.wfile.write(body.encode('utf-8'))
+                self.wfile.write(data)
+
+            def _stream(self, size, chunks, raw: bool = False):
+                """Send chunks(start, length) as a (ranged) response.
+
+                Binary content gets a hex preview unless raw or a range is
+                requested. Full responses use chunked transfer encoding.
+                """
+                byte_range = None
+                if size is not None and self.headers.get('Range'):
+                    try:
+                        byte_range = parse_range(self.headers['Range'], size)
+                    except ValueError:
+                        self._send(416, 'Range not satisfiable', 'text/plain; charset=utf-8',
+                                   [('Content-Range', f'bytes */{size}')])
+                        return
+                if byte_range:
+                    start, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+                else:
+                    start, length = 0, size
+                source = chunks(start, length)
+                try:
+                    head, body = peek(source, SNIFF_BYTES)
+                    binary = is_binary(head)
+                    if binary and not raw and byte_range is None:
+                        self._send(200, hex_preview(head[:HEX_PREVIEW_BYTES], size), 'text/plain; charset=utf-8')
+                        return
+                    self.send_response(206 if byte_range else 200)
+                    self.send_header('Content-Type', 'application/octet-stream' if binary else 'text/plain; charset=utf-8')
+                    if size is not None:
+                        self.send_header('Accept-Ranges', 'bytes')
+                    if byte_range:
+                        self.send_header('Content-Range', f'bytes {byte_range[0]}-{byte_range[1]}/{size}')
+                        self.send_header('Content-Length', str(length))
+                        self.end_headers()
+                        for chunk in body:
+                            self.wfile.write(chunk)
+                    else:
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.end_headers()
+                        for chunk in body:
+                            if chunk:
+                                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                        self.wfile.write(b'0\r\n\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                finally:
+                    source.close()
 
             def do_GET(self):  # noqa: N802 (http.server API)
                 parsed = urlparse(self.path)
+                qs = parse_qs(parsed.query)
+                raw = (qs.get('raw') or [''])[0] == '1'
                 if parsed.path == '/' or parsed.path == '/index.html':
                     self._send(200, self._render_index(md_files))
                 elif parsed.path == '/raw':
-                    qs = parse_qs(parsed.query)
                     name = (qs.get('name') or [''])[0]
                     if not name or name not in md_files:
                         self._send(404, 'Not found', 'text/plain; charset=utf-8')
                         return
                     file_path = os.path.join(folder, name)
                     try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
                         # YAML front matter (--- ... ---) を先頭に持つ場合は無視
-                        if content.startswith('---'):
-                            lines = content.splitlines()
-                            if lines and lines[0].strip() == '---':
-                                end_idx = -1
-                                for i in range(1, len(lines)):
-                                    if lines[i].strip() == '---':
-                                        end_idx = i
-                                        break
-                                if end_idx != -1:
-                                    content = '\n'.join(lines[end_idx+1:]).lstrip('\n')
-                        self._send(200, content, 'text/plain; charset=utf-8')
+                        offset = front_matter_end(file_path)
+                        size = os.path.getsize(file_path) - offset
                     except Exception as e:
                         self._send(500, f'Error: {e}', 'text/plain; charset=utf-8')
+                        return
+                    self._stream(size, lambda start, length: file_chunks(file_path, offset + start, length), raw)
                 elif parsed.path == '/git':
-                    qs = parse_qs(parsed.query)
                     hashv = (qs.get('hash') or [''])[0]
                     pathv = (qs.get('path') or [''])[0]
                     # very simple validation for hash
                     if not hashv or not all(c in '0123456789abcdefABCDEF' for c in hashv):
                         self._send(400, 'Invalid hash', 'text/plain; charset=utf-8')
                         return
+                    spec = f'{hashv}:{pathv}' if pathv else hashv
                     try:
-                        if pathv:
-                            cmd = trops_cmd + ['show', f'{hashv}:{pathv}']
-                        else:
-                            cmd = trops_cmd + ['show', hashv]
-                        result = subprocess.run(cmd, capture_output=True)
-                        if result.returncode != 0:
-                            self._send(500, result.stderr.decode('utf-8') or 'git show failed', 'text/plain; charset=utf-8')
-                        else:
-                            self._send(200, result.stdout.decode('utf-8'), 'text/plain; charset=utf-8')
+                        body = view._object_body(spec)
                     except Exception as e:
                         self._send(500, f'Error: {e}', 'text/plain; charset=utf-8')
+                        return
+                    if body is None:
+                        self._send(404, f'Not found: {spec}', 'text/plain; charset=utf-8')
+                        return
+                    self._stream(*body, raw)
                 else:
                     self._send(404, 'Not found', 'text/plain; charset=utf-8')
 
@@ -286,20 +539,7 @@ class TropsView(TropsCLI):
                 """
                 return html
 
-        httpd = HTTPServer(('127.0.0.1', 8001), Handler)
-        print('Serving trops view on http://localhost:8001 (Ctrl+C to stop)')
-        # Optionally open browser
-        if not self.no_browser:
-            try:
-                webbrowser.open('http://localhost:8001', new=2)
-            except Exception:
-                pass
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print('\nStopping server...')
-        finally:
-            httpd.server_close()
+        return Handler
 
 
 def run(args, other_args):
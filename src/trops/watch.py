@@ -0,0 +1,388 @@
+"""Auto-commit tracked files that change outside the shell.
+
+``trops watch`` reads the tracked set from ``git ls-files`` and watches the
+directories holding tracked files with inotify, so edits made by config
+management, cron jobs or other users get recorded without a ``trops
+check``. The work done is proportional to the events, not to the size of
+the tracked tree:
+
+  - one inotify watch per directory, plus one on the git dir to notice
+    ``trops touch``/``trops drop`` (and any other index update), which
+    reloads the tracked set;
+  - events for untracked names are dropped on arrival;
+  - bursts are debounced: the changed files are committed together, in one
+    commit through trops.commitq, once nothing changed for ``--debounce``
+    seconds, or ``--max-delay`` seconds after the first change of a burst
+    that does not calm down.
+
+FL log lines of the watcher carry the ``UPDATE(watch)`` note. Deleted files
+are not committed; that is what ``trops drop`` is for.
+
+Without inotify (not Linux, or out of watches) the tracked files are
+stat()ed every ``--interval`` seconds instead.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+
+from pathlib import Path
+from textwrap import dedent
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import gitcmd
+from .trops import TropsBase, TropsError
+
+# inotify(7) event bits
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Written and closed, renamed into place (editors, config management) or
+# chmod/chown (recorded in the FL line's O/G/M)
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_ATTRIB | IN_ONLYDIR
+_EVENT = struct.Struct('iIII')
+
+# (directory, name) of a changed entry; None stands for "events were lost"
+Event = Optional[Tuple[str, str]]
+
+
+class InotifyWatcher:
+    """inotify(7) on a set of directories, through libc."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs: Dict[int, str] = {}
+        self.wds: Dict[str, int] = {}
+
+    def sync(self, dirs: Dict[str, Set[str]]) -> None:
+        """Watch exactly the directories in dirs."""
+        for path in list(self.wds):
+            if path not in dirs:
+                self._rm_watch(self.fd, self.wds.pop(path))
+        for path in dirs:
+            if path in self.wds:
+                continue
+            wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    # Gone or unreadable; picked up again on the next reload
+                    continue
+                raise OSError(err, f'inotify_add_watch { path }: { os.strerror(err) }')
+            self.wds[path] = wd
+            self.dirs[wd] = path
+
+    def read(self, timeout: float) -> List[Event]:
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        events: List[Event] = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append(None)
+            elif mask & IN_IGNORED:
+                path = self.dirs.pop(wd, None)
+                if path is not None and self.wds.get(path) == wd:
+                    del self.wds[path]
+            elif wd in self.dirs and name:
+                events.append((self.dirs[wd], name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """Fallback: stat() every watched file each interval seconds."""
+
+    def __init__(self, interval: float, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.files: Dict[Tuple[str, str], Optional[tuple]] = {}
+        self.next_scan = clock() + interval
+
+    @staticmethod
+    def _stat(path: str) -> Optional[tuple]:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode, st.st_uid, st.st_gid)
+
+    def sync(self, dirs: Dict[str, Set[str]]) -> None:
+        files = {}
+        for path, names in dirs.items():
+            for name in names:
+                key = (path, name)
+                files[key] = self.files[key] if key in self.files else self._stat(os.path.join(path, name))
+        self.files = files
+
+    def read(self, timeout: float) -> List[Event]:
+        wait = self.next_scan - self.clock()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self.next_scan = self.clock() + self.interval
+        events: List[Event] = []
+        for key, old in self.files.items():
+            new = self._stat(os.path.join(*key))
+            if new != old:
+                self.files[key] = new
+                events.append(key)
+        return events
+
+    def close(self) -> None:
+        pass
+
+
+class Debouncer:
+    """Collects changed paths and hands them out as one batch once the
+    burst is over (quiet seconds without events) or max_delay seconds after
+    its first event."""
+
+    def __init__(self, quiet: float, max_delay: float, clock: Callable[[], float] = time.monotonic):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.clock = clock
+        self.pending: Dict[str, None] = {}
+        self.first = self.last = 0.0
+
+    def add(self, path: str) -> None:
+        now = self.clock()
+        if not self.pending:
+            self.first = now
+        self.pending[path] = None
+        self.last = now
+
+    def timeout(self) -> Optional[float]:
+        """Seconds until the pending batch is due, None if nothing is pending."""
+        if not self.pending:
+            return None
+        due = min(self.last + self.quiet, self.first + self.max_delay)
+        return max(0.0, due - self.clock())
+
+    def due(self) -> List[str]:
+        """The pending paths, in order of first change, if the batch is due."""
+        if not self.pending or self.timeout() > 0:
+            return []
+        paths = list(self.pending)
+        self.pending = {}
+        return paths
+
+
+class TropsWatch(TropsBase):
+
+    def __init__(self, args, other_args):
+        super().__init__(args, other_args)
+
+        if other_args:
+            msg = f"""\
+                Unsupported argments: { ', '.join(other_args)}
+                > trops watch --help"""
+            raise TropsError(dedent(msg))
+        if not hasattr(self, 'git_dir'):
+            msg = f"""\
+                ERROR: No trops environment to watch (TROPS_ENV={ self.trops_env or '' })
+                > trops watch -e <env>"""
+            raise TropsError(dedent(msg))
+
+        self.debouncer = Debouncer(args.debounce, max(args.debounce, args.max_delay))
+        self.index = os.path.join(self.git_dir, 'index')
+        self.index_stat = None
+        # directory -> {name in it: path relative to work_tree}
+        self.tracked: Dict[str, Dict[str, str]] = {}
+        self.watcher = None
+
+    def _index_signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.index)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_tracked(self) -> None:
+        """Read the tracked set and (re)point the watches at its directories."""
+        self.index_stat = self._index_signature()
+        result = gitcmd.run(self.git_cmd + ['ls-files', '-z'], capture_output=True)
+        if result.returncode != 0:
+            raise TropsError(result.stderr.decode('utf-8', errors='replace').strip())
+        tracked: Dict[str, Dict[str, str]] = {}
+        for rel_path in os.fsdecode(result.stdout).split('\0'):
+            if rel_path:
+                path = os.path.join(self.work_tree, rel_path)
+                tracked.setdefault(os.path.dirname(path), {})[os.path.basename(path)] = rel_path
+        self.tracked = tracked
+        dirs = {path: set(names) for path, names in tracked.items()}
+        dirs.setdefault(self.git_dir, set()).add('index')
+        try:
+            self.watcher.sync(dirs)
+        except OSError as e:
+            if isinstance(self.watcher, PollWatcher):
+                raise
+            print(f'trops watch: { e }; falling back to polling every { self.args.interval }s', file=sys.stderr)
+            self.watcher.close()
+            self.watcher = PollWatcher(self.args.interval)
+            self.watcher.sync(dirs)
+
+    def _handle(self, events: List[Event]) -> None:
+        reload = False
+        for event in events:
+            if event is None:
+                # Lost events: anything tracked may have changed
+                for names in self.tracked.values():
+                    for rel_path in names.values():
+                        self.debouncer.add(rel_path)
+                continue
+            path, name = event
+            rel_path = self.tracked.get(path, {}).get(name)
+            if rel_path is not None:
+                self.debouncer.add(rel_path)
+            if path == self.git_dir and name == 'index':
+                reload = True
+        # Our own commits rewrite the index too; only reload when someone
+        # else did
+        if reload and self._index_signature() != self.index_stat:
+            self._load_tracked()
+
+    def _log_line(self, rel_path: str, file_path: str) -> str:
+        from .commitq import HASH
+
+        mode = oct(os.stat(file_path).st_mode)[-4:]
+        owner = Path(file_path).owner()
+        group = Path(file_path).group()
+        message = f"FL trops show { HASH }:{ rel_path }  #> UPDATE(watch) O={ owner },G={ group },M={ mode }"
+        if self.trops_sid:
+            message = message + f" TROPS_SID={ self.trops_sid }"
+        message = message + f" TROPS_ENV={ self.trops_env }"
+        if self.trops_tags:
+            message = message + f" TROPS_TAGS={self.trops_tags}"
+        return message
+
+    def commit(self, rel_paths: List[str]) -> None:
+        """Commit the changed rel_paths together through the commit queue."""
+        from .commitq import HASH, CommitQueue
+
+        requests = []
+        for rel_path in rel_paths:
+            file_path = os.path.join(self.work_tree, rel_path)
+            if not os.path.isfile(file_path):
+                continue
+            git_msg = f"Update { rel_path }"
+            if self.trops_tags:
+                git_msg = f"{ git_msg } ({ self.trops_tags })"
+            try:
+                self._apply_large_file_policy(file_path, rel_path)
+                requests.append((rel_path, git_msg, self._log_line(rel_path, file_path)))
+            except (OSError, KeyError):
+                # Removed between the event and now, or owned by an unknown uid
+                continue
+        if not requests:
+            return
+        queue = CommitQueue(self.git_dir, self.git_cmd, self.work_tree)
+        results = queue.submit_many(requests, self.trops_logfile, f'{ self.username }@{ self.hostname }')
+        if results is None:
+            print(f"Queued { len(requests) } file(s) (another trops process is committing)")
+        else:
+            summaries = dict.fromkeys(r.summary for r in results if r.commit)
+            for summary in summaries:
+                print(summary)
+            for (_, _, log_line), result in zip(requests, results):
+                if result.commit:
+                    self.logger.info(log_line.replace(HASH, result.commit, 1))
+        sys.stdout.flush()
+        self.index_stat = self._index_signature()
+
+    def run(self, stop: Optional[threading.Event] = None, idle: float = 1.0) -> None:
+        """Watch and commit until stop is set; idle bounds how long a wait
+        for events may take before stop is checked."""
+        if self.args.poll:
+            self.watcher = PollWatcher(self.args.interval)
+        else:
+            try:
+                self.watcher = InotifyWatcher()
+            except OSError as e:
+                print(f'trops watch: { e }; falling back to polling every { self.args.interval }s', file=sys.stderr)
+                self.watcher = PollWatcher(self.args.interval)
+        try:
+            self._load_tracked()
+            while stop is None or not stop.is_set():
+                timeout = self.debouncer.timeout()
+                self._handle(self.watcher.read(idle if timeout is None else min(timeout, idle)))
+                paths = self.debouncer.due()
+                if paths:
+                    self.commit(paths)
+        finally:
+            self.watcher.close()
+
+    def watch(self) -> None:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        print(f'Watching files tracked in { self.git_dir } (Ctrl-C to stop)')
+        sys.stdout.flush()
+        try:
+            self.run(stop)
+        except KeyboardInterrupt:
+            pass
+
+
+def trops_watch(args, other_args):
+
+    tw = TropsWatch(args, other_args)
+    tw.watch()
+
+
+def add_watch_subparsers(subparsers):
+
+    parser_watch = subparsers.add_parser(
+        'watch', help='auto-commit tracked files changed outside the shell')
+    parser_watch.add_argument('-e', '--env', help='Set environment name')
+    parser_watch.add_argument(
+        '--debounce', type=float, default=2.0,
+        help='commit once nothing changed for this many seconds (default: %(default)s)')
+    parser_watch.add_argument(
+        '--max-delay', type=float, default=30.0,
+        help='commit a burst that keeps going after this many seconds (default: %(default)s)')
+    parser_watch.add_argument(
+        '--poll', action='store_true', help='stat() the tracked files instead of using inotify')
+    parser_watch.add_argument(
+        '--interval', type=float, default=2.0,
+        help='seconds between scans with --poll (default: %(default)s)')
+    parser_watch.set_defaults(handler=trops_watch)
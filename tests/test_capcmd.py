@@ -386,3 +386,155 @@ def test_sudo_ttee_is_not_detected(monkeypatch, tmp_path):
 
 	assert rv is False
 	assert called['add'] is False
+
+
+def test_redirect_target_is_committed(monkeypatch, tmp_path, caplog):
+	"""`echo ... > file` inside the work tree is committed and logged as FL."""
+	import logging
+	import subprocess
+	from trops.capcmd import capture_cmd
+
+	trops_dir = tmp_path / 'trops'
+	trops_dir.mkdir(parents=True, exist_ok=True)
+	monkeypatch.setenv("TROPS_DIR", str(trops_dir))
+	monkeypatch.setenv("TROPS_ENV", "env1")
+	work_tree = tmp_path / 'work_tree'
+	work_tree.mkdir()
+	git_dir = tmp_path / 'repo.git'
+	subprocess.run(['git', 'init', '--bare', str(git_dir)], check=True, capture_output=True)
+	subprocess.run(['git', f'--git-dir={git_dir}', 'config', 'user.email', 'test@example.com'], check=True)
+	subprocess.run(['git', f'--git-dir={git_dir}', 'config', 'user.name', 'Test User'], check=True)
+	(trops_dir / 'trops.cfg').write_text(
+		f"[env1]\ngit_dir = {git_dir}\nwork_tree = {work_tree}\ndisable_header = True\n", encoding='utf-8')
+
+	target = work_tree / 'etc' / 'sysctl.conf'
+	target.parent.mkdir()
+	target.write_text('net.ipv4.ip_forward=1\n', encoding='utf-8')
+
+	with patch("sys.argv", ["trops", "capture-cmd", '0', "echo", "net.ipv4.ip_forward=1", ">", str(target)]):
+		parser = argparse.ArgumentParser(prog='trops')
+		subparsers = parser.add_subparsers()
+		add_capture_cmd_subparsers(subparsers)
+		args, other_args = parser.parse_known_args()
+
+	caplog.set_level(logging.INFO)
+	capture_cmd(args, other_args)
+
+	tracked = subprocess.run(['git', f'--git-dir={git_dir}', 'ls-files', '--with-tree=HEAD'],
+							 capture_output=True, cwd=work_tree).stdout.decode()
+	assert 'etc/sysctl.conf' in tracked
+	assert any(r.getMessage().startswith('FL trops show ') for r in caplog.records)
+
+
+def test_redirect_outside_work_tree_is_ignored(monkeypatch, tmp_path):
+	called = {'add': False}
+
+	def fake_add(self, executed_cmd, start_index, first_line_comment=None):
+		called['add'] = True
+
+	monkeypatch.setattr(TropsCapCmd, '_add_file_in_git_repo', fake_add, raising=True)
+	tcc = _make_capcmd(monkeypatch, tmp_path)
+	tcc.git_cmd = ['git']
+	tcc.work_tree = str(tmp_path / 'work_tree')
+	out = tmp_path / 'elsewhere.txt'
+	out.write_text('x')
+
+	assert tcc._add_redirect_output_files(['echo', 'x', '>', str(out)]) is False
+	assert called['add'] is False
+
+
+def test_apt_install_snapshots_packages(monkeypatch, tmp_path):
+	"""`sudo apt install ...` refreshes the dpkg snapshot and commits with a summary note."""
+	from trops import pkgsnap
+	committed = {}
+
+	def fake_commit(self, file_path, note=None):
+		committed['path'] = file_path
+		committed['note'] = note
+
+	monkeypatch.setattr(TropsCapCmd, 'add_and_commit_file', fake_commit, raising=True)
+	monkeypatch.setattr(pkgsnap.PackageSnapshot, 'update', lambda self: '+nginx:amd64', raising=True)
+
+	tcc = _make_capcmd(monkeypatch, tmp_path)
+	tcc.git_cmd = ['git']
+	tcc._pkg_log(['sudo', '-E', 'apt', 'install', 'nginx'])
+
+	assert committed['path'].endswith(f'log/apt_pkg_list.{tcc.hostname}')
+	assert committed['note'] == '+nginx:amd64'
+
+
+def test_non_package_command_skips_snapshot(monkeypatch, tmp_path):
+	from trops import pkgsnap
+	monkeypatch.setattr(pkgsnap.PackageSnapshot, 'update', lambda self: (_ for _ in ()).throw(AssertionError), raising=True)
+	tcc = _make_capcmd(monkeypatch, tmp_path)
+	tcc.git_cmd = ['git']
+	tcc._pkg_log(['apt', 'list', '--installed'])
+	tcc._pkg_log(['ls', 'install'])
+
+
+def test_log_rotation_starts_when_limit_reached(monkeypatch, tmp_path):
+	started = []
+	monkeypatch.setattr(TropsCapCmd, '_rotate_in_background', lambda self, *a: started.append(a), raising=True)
+	tcc = _make_capcmd(monkeypatch, tmp_path)
+	log_file = tmp_path / 'trops' / 'log' / 'trops.log'
+	log_file.parent.mkdir(parents=True, exist_ok=True)
+	log_file.write_text('2024-01-01 00:00:00 u@h INFO CM ls #> PWD=/, EXIT=0\n')
+	tcc.trops_logfile = str(log_file)
+
+	# not configured: nothing to do
+	tcc._rotate_log_if_due()
+	assert started == []
+
+	tcc.trops_env = 'myenv'
+	tcc.config.read_dict({'myenv': {'log_rotate_size': '1M', 'log_compress': 'gzip'}})
+	tcc._rotate_log_if_due()
+	assert started == []
+
+	tcc.config.read_dict({'myenv': {'log_rotate_size': '10'}})
+	tcc._rotate_log_if_due()
+	assert started == [('gzip', 10, None)]
+
+
+def _ttee_env(monkeypatch, tmp_path, extra_cfg=''):
+	import subprocess
+
+	trops_dir = tmp_path / 'trops'
+	trops_dir.mkdir(parents=True, exist_ok=True)
+	monkeypatch.setenv("TROPS_DIR", str(trops_dir))
+	monkeypatch.setenv("TROPS_ENV", "env1")
+	work_tree = tmp_path / 'work_tree'
+	work_tree.mkdir()
+	git_dir = tmp_path / 'repo.git'
+	subprocess.run(['git', 'init', '--bare', str(git_dir)], check=True, capture_output=True)
+	subprocess.run(['git', f'--git-dir={git_dir}', 'config', 'user.email', 'test@example.com'], check=True)
+	subprocess.run(['git', f'--git-dir={git_dir}', 'config', 'user.name', 'Test User'], check=True)
+	(trops_dir / 'trops.cfg').write_text(
+		f"[env1]\ngit_dir = {git_dir}\nwork_tree = {work_tree}\ndisable_header = True\n{extra_cfg}", encoding='utf-8')
+	target = work_tree / 'dump.sql'
+	target.write_text('CREATE TABLE t ();\n', encoding='utf-8')
+	with patch("sys.argv", ["trops", "capture-cmd", '0', "pg_dump", "db", "|", "ttee", str(target)]):
+		parser = argparse.ArgumentParser(prog='trops')
+		add_capture_cmd_subparsers(parser.add_subparsers())
+		args, other_args = parser.parse_known_args()
+	return git_dir, target, args, other_args
+
+
+@pytest.mark.parametrize('mode', ['file', 'commit', 'notes'])
+def test_ttee_comment_modes(monkeypatch, tmp_path, mode):
+	"""ttee_comment decides where `# <left-command>` is recorded."""
+	import subprocess
+	from trops.capcmd import capture_cmd
+
+	git_dir, target, args, other_args = _ttee_env(monkeypatch, tmp_path, f'ttee_comment = {mode}\n')
+	capture_cmd(args, other_args)
+
+	def git(*cmd):
+		return subprocess.run(['git', f'--git-dir={git_dir}'] + list(cmd), capture_output=True).stdout.decode()
+
+	committed = git('show', 'HEAD:dump.sql')
+	if mode == 'file':
+		assert committed == target.read_text() == '# pg_dump db\nCREATE TABLE t ();\n'
+	else:
+		assert committed == target.read_text() == 'CREATE TABLE t ();\n'
+	assert ('# pg_dump db' in git('log', '-1', '--format=%B')) is (mode == 'commit')
+	assert ('# pg_dump db' in git('notes', 'show', 'HEAD')) is (mode == 'notes')
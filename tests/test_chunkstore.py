@@ -0,0 +1,126 @@
+import argparse
+import io
+import os
+import subprocess
+
+import pytest
+
+from trops import chunkstore
+from trops.chunkstore import ChunkStore, Pointer, format_pointer, parse_pointer
+
+
+def test_pointer_round_trip():
+    pointer = Pointer('ab' * 32, 123456789, '0640')
+    data = format_pointer(pointer)
+    assert data.startswith(b'trops-chunks v1\n') and len(data) <= chunkstore.POINTER_MAX
+    assert parse_pointer(data) == pointer
+    assert parse_pointer(b'trops-chunks v1\noid sha256:abc\nsize 1\n') is None
+    assert parse_pointer(b'plain text') is None
+
+
+def test_versions_share_chunks(monkeypatch, tmp_path):
+    monkeypatch.setattr(chunkstore, 'CHUNK_BYTES', 1024)
+    store = ChunkStore(str(tmp_path / 'chunks'))
+    first = os.urandom(10 * 1024 + 100)
+    p1 = store.put(io.BytesIO(first))
+    # a dump that grew at the end reuses every full chunk
+    second = first + os.urandom(3000)
+    p2 = store.put(io.BytesIO(second))
+    objects = [f for _, _, files in os.walk(tmp_path / 'chunks' / 'objects') for f in files]
+    # 11 chunks of first, then the old partial chunk plus 3 more of second
+    assert len(objects) == 11 + 4
+    assert p1.size == len(first)
+    assert b''.join(store.iter_range(p1)) == first
+    assert b''.join(store.iter_range(p2, 5000, 7000, block=333)) == second[5000:12000]
+    assert b''.join(store.iter_range(p1, 1020, 10)) == first[1020:1030]
+
+
+def test_missing_chunks_raise(tmp_path):
+    store = ChunkStore(str(tmp_path / 'chunks'))
+    with pytest.raises(chunkstore.ChunkStoreError):
+        list(store.iter_range(Pointer('cd' * 32, 10)))
+    assert not store.has(Pointer('cd' * 32, 10))
+
+
+def test_attributes_line_escapes_globs():
+    assert chunkstore._attributes_line('var/dump[1].sql') == '/var/dump\\[1\\].sql filter=trops-chunks'
+    assert chunkstore._attributes_line('has space.sql') is None
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    trops_dir = tmp_path / 'trops'
+    trops_dir.mkdir()
+    work_tree = tmp_path / 'wt'
+    work_tree.mkdir()
+    git_dir = tmp_path / 'repo.git'
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    (trops_dir / 'trops.cfg').write_text(
+        f'[e1]\ngit_dir = {git_dir}\nwork_tree = {work_tree}\nlarge_file_threshold = 64k\nsudo = False\n')
+    for var in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv(f'GIT_{var}_NAME', 't')
+        monkeypatch.setenv(f'GIT_{var}_EMAIL', 't@t')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.setenv('TROPS_ENV', 'e1')
+    monkeypatch.delenv('TROPS_TAGS', raising=False)
+    return trops_dir, work_tree, git_dir
+
+
+def _cli(commit='HEAD'):
+    from trops.trops import TropsCLI
+    return TropsCLI(argparse.Namespace(commit=commit), [])
+
+
+def test_large_file_is_stored_as_pointer(env, capfdbinary):
+    trops_dir, work_tree, git_dir = env
+    small = work_tree / 'small.txt'
+    small.write_text('hello\n')
+    dump = work_tree / 'dump.sql'
+    content = os.urandom(200 << 10)
+    dump.write_bytes(content)
+
+    cli = _cli()
+    cli._touch_file(str(small))
+    cli._touch_file(str(dump))
+
+    blob = subprocess.run(['git', f'--git-dir={git_dir}', 'cat-file', 'blob', 'HEAD:dump.sql'],
+                          capture_output=True, check=True).stdout
+    pointer = parse_pointer(blob)
+    assert pointer is not None and pointer.size == len(content)
+    assert subprocess.run(['git', f'--git-dir={git_dir}', 'cat-file', 'blob', 'HEAD:small.txt'],
+                          capture_output=True, check=True).stdout == b'hello\n'
+    assert 'dump.sql' in (git_dir / 'info' / 'attributes').read_text()
+    assert 'small.txt' not in (git_dir / 'info' / 'attributes').read_text()
+
+    # trops show resolves the pointer
+    capfdbinary.readouterr()
+    _cli('HEAD:dump.sql').show()
+    assert capfdbinary.readouterr().out == content
+
+    # re-adding unchanged content does not create a new commit
+    head = subprocess.run(['git', f'--git-dir={git_dir}', 'rev-parse', 'HEAD'], capture_output=True).stdout
+    cli._touch_file(str(dump))
+    assert subprocess.run(['git', f'--git-dir={git_dir}', 'rev-parse', 'HEAD'], capture_output=True).stdout == head
+
+
+def test_file_put_and_view_resolve_pointers(env, tmp_path):
+    from trops.file import TropsFile
+    from trops.view import TropsView
+
+    trops_dir, work_tree, git_dir = env
+    dump = work_tree / 'dump.sql'
+    content = b'INSERT INTO t VALUES (1);\n' * 4000
+    dump.write_bytes(content)
+    _cli()._touch_file(str(dump))
+
+    dest = tmp_path / 'restore'
+    dest.mkdir()
+    TropsFile(argparse.Namespace(path='dump.sql', dest=str(dest)), []).put()
+    assert (dest / 'dump.sql').read_bytes() == content
+
+    view = TropsView(argparse.Namespace(file=str(work_tree), web=True), [])
+    view._make_handler(str(work_tree))
+    size, chunks = view._object_body('HEAD:dump.sql')
+    assert size == len(content)
+    assert b''.join(chunks(0, None)) == content
+    assert b''.join(chunks(100, 50)) == content[100:150]
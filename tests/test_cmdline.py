@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from trops.cmdline import classify, editor_targets, unwrap
+
+
+@pytest.mark.parametrize('line, inner', (
+    ('sudo ttags', ['ttags']),
+    ('sudo -u root -E systemctl restart nginx', ['systemctl', 'restart', 'nginx']),
+    ('sudo -uroot vim /etc/hosts', ['vim', '/etc/hosts']),
+    ('sudo --user=root -- vim /etc/hosts', ['vim', '/etc/hosts']),
+    ('doas -u root nano /etc/x', ['nano', '/etc/x']),
+    ('env EDITOR=vim LANG=C vim /etc/x', ['vim', '/etc/x']),
+    ('env -i -u HOME PATH=/bin vi a', ['vi', 'a']),
+    ('sudo env FOO=1 command exec vim a', ['vim', 'a']),
+    ('command -v vim', []),
+    ('sudo -l', []),
+    ('timeout -s KILL 5 vim a', ['vim', 'a']),
+    ('ls -al', ['ls', '-al']),
+))
+def test_unwrap(line, inner):
+    assert unwrap(line.split())[0] == inner
+
+
+@pytest.mark.parametrize('line, targets', (
+    ('vim /etc/hosts', ['/etc/hosts']),
+    ('vim -O a b', ['a', 'b']),
+    ('vim +42 a', ['a']),
+    ('vim -c startinsert -S session.vim a', ['a']),
+    ('vim --cmd startinsert -- -weird', ['-weird']),
+    ('nvim -d a b', ['a', 'b']),
+    ('nano -Y sh +3,2 /etc/profile', ['/etc/profile']),
+    ('emacs -nw --eval (foo) -l init.el /etc/x', ['/etc/x']),
+    ('sudo -u root vim /etc/x', ['/etc/x']),
+    ('sudo -e /etc/a /etc/b', ['/etc/a', '/etc/b']),
+    ('sudoedit -u root /etc/sudoers.d/x', ['/etc/sudoers.d/x']),
+    ('/usr/bin/vim a', ['a']),
+    ('cat /etc/hosts', []),
+    ('sudo -u root', []),
+))
+def test_editor_targets(line, targets):
+    assert editor_targets(line.split()) == targets
+
+
+def test_classify_returns_inner_argv():
+    c = classify('sudo -u root vim -p a b'.split())
+    assert c.argv == ['vim', '-p', 'a', 'b']
+    assert c.edit_targets == ['a', 'b']
+
+
+# A slice of real shell history used as a parsing benchmark corpus
+HISTORY_CORPUS = [
+    'ls -al',
+    'cd /etc/nginx',
+    'sudo vim /etc/nginx/nginx.conf',
+    'sudo systemctl reload nginx',
+    'sudo -u postgres psql -c select\\ 1',
+    'git status',
+    'journalctl -u nginx -f',
+    'sudoedit /etc/sudoers.d/ops',
+    'env LANG=C sudo -E nano +12 /etc/default/grub',
+    'grep -rn listen /etc/nginx/conf.d',
+    'docker ps -a',
+    'kubectl -n kube-system get pods',
+    'vim -O /etc/hosts /etc/resolv.conf',
+    'doas -u root vi /etc/rc.conf',
+    'echo 1 | sudo tee /proc/sys/net/ipv4/ip_forward',
+    'ttags #123',
+    'trops log | trops tldr',
+    'timeout 10 curl -sS http://localhost/healthz',
+    'command -v python3',
+    'nohup ./run.sh',
+]
+
+
+def test_classify_benchmark_history_corpus():
+    tokenized = [line.split() for line in HISTORY_CORPUS]
+    rounds = 500
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for tokens in tokenized:
+            classify(tokens)
+    per_line = (time.perf_counter() - start) / (rounds * len(tokenized))
+    # Typically a few microseconds; the bound only guards against regressions
+    # that would make the prompt hook noticeably slower.
+    assert per_line < 200e-6
+
+
+def test_tokenize_quotes_and_fd_redirections():
+    from trops.cmdline import tokenize
+    toks = tokenize('echo "a b" \'c|d\' 2>&1 >>out')
+    assert [t.text for t in toks] == ['echo', 'a b', 'c|d', '2>&', '1', '>>', 'out']
+    assert [t.op for t in toks] == [False, False, False, True, False, True, False]
+
+
+@pytest.mark.parametrize('line, files, copies', (
+    ('echo 1 > /etc/sysctl.d/99.conf', ['/etc/sysctl.d/99.conf'], []),
+    ('echo 1 >> /etc/x 2>&1', ['/etc/x'], []),
+    ('cmd > /dev/null 2>&1', [], []),
+    ('cmd &> all.log', ['all.log'], []),
+    ('cmd 2> err.log', ['err.log'], []),
+    ('cat <<EOF > /etc/motd', ['/etc/motd'], []),
+    ('echo "a > b"', [], []),
+    ('sudo sed -i s/a/b/ /etc/a /etc/b', ['/etc/a', '/etc/b'], []),
+    ('sed -e s/a/b/ -i.bak /etc/a', ['/etc/a'], []),
+    ('sed s/a/b/ /etc/a', [], []),
+    ('perl -pi -e s/a/b/ /etc/a', ['/etc/a'], []),
+    ('cp -p a /etc/b', [], ['/etc/b']),
+    ('mv -t /etc a b', [], ['/etc/a', '/etc/b']),
+    ('install -m 0644 a /etc/b', [], ['/etc/b']),
+    ('install -d /etc/x', [], []),
+    ('echo x | tee /etc/a > /etc/b', [], []),
+))
+def test_write_targets(line, files, copies):
+    from trops.cmdline import write_targets
+    targets = write_targets(line.split())
+    assert targets.files == files
+    assert targets.copies == copies
+
+
+def test_write_targets_benchmark_history_corpus():
+    from trops.cmdline import write_targets
+    corpus = HISTORY_CORPUS + [
+        'echo net.ipv4.ip_forward=1 > /etc/sysctl.d/99-forward.conf',
+        'sudo sed -i s/^#Port/Port/ /etc/ssh/sshd_config',
+        'make 2>&1 > build.log',
+    ]
+    tokenized = [line.split() for line in corpus]
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for tokens in tokenized:
+            write_targets(tokens)
+    per_line = (time.perf_counter() - start) / (rounds * len(tokenized))
+    assert per_line < 500e-6
@@ -0,0 +1,105 @@
+import fcntl
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from trops.commitq import HASH, LOCK_FILE, SPOOL_DIR, CommitQueue
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git_dir = tmp_path / 'repo.git'
+    work_tree = tmp_path / 'wt'
+    work_tree.mkdir()
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    subprocess.run(['git', f'--git-dir={git_dir}', 'config', 'user.email', 'test@example.com'], check=True)
+    subprocess.run(['git', f'--git-dir={git_dir}', 'config', 'user.name', 'Test User'], check=True)
+    return git_dir, work_tree
+
+
+def _git(git_dir, *args):
+    return subprocess.run(['git', f'--git-dir={git_dir}'] + list(args), capture_output=True, check=True).stdout.decode()
+
+
+def _queue(git_dir, work_tree):
+    git_cmd = ['git', '-C', str(work_tree), f'--git-dir={git_dir}', f'--work-tree={work_tree}']
+    return CommitQueue(str(git_dir), git_cmd, str(work_tree))
+
+
+def test_submit_commits_and_returns_the_commit(repo, tmp_path):
+    git_dir, work_tree = repo
+    (work_tree / 'hosts').write_text('127.0.0.1 localhost\n')
+    queue = _queue(git_dir, work_tree)
+    result = queue.submit('hosts', 'Add hosts', f'FL trops show {HASH}:hosts', str(tmp_path / 'log'), 'u@h')
+    assert result.commit == _git(git_dir, 'rev-parse', '--short', 'HEAD').strip()
+    assert result.summary.endswith('Add hosts')
+    # own FL line is left to the caller
+    assert not (tmp_path / 'log').exists()
+    # unchanged: nothing to commit
+    assert queue.submit('hosts', 'Update hosts', 'FL', str(tmp_path / 'log'), 'u@h').commit is None
+
+
+def test_requests_queued_while_locked_are_committed_by_the_holder(repo, tmp_path):
+    git_dir, work_tree = repo
+    queue = _queue(git_dir, work_tree)
+    log = tmp_path / 'trops.log'
+    lock_fd = os.open(str(git_dir / LOCK_FILE), os.O_RDWR | os.O_CREAT)
+    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+    try:
+        for name in ('a', 'b'):
+            (work_tree / name).write_text(name)
+            assert queue.submit(name, f'Add {name}', f'FL trops show {HASH}:{name}  #> ADD', str(log), 'u@h') is None
+        assert len(os.listdir(git_dir / SPOOL_DIR)) == 2
+    finally:
+        os.close(lock_fd)
+
+    results = queue.drain()
+    assert len(results) == 2
+    assert sorted(_git(git_dir, 'ls-tree', '--name-only', 'HEAD').split()) == ['a', 'b']
+    commit = _git(git_dir, 'rev-parse', '--short', 'HEAD').strip()
+    assert _git(git_dir, 'log', '-1', '--format=%B').startswith('Update 2 files\n\nAdd a\nAdd b')
+    lines = log.read_text().splitlines()
+    assert [line.split(' INFO ')[1] for line in lines] == [
+        f'FL trops show {commit}:a  #> ADD', f'FL trops show {commit}:b  #> ADD']
+    assert all(line.split()[2] == 'u@h' for line in lines)
+    assert os.listdir(git_dir / SPOOL_DIR) == []
+
+
+def test_concurrent_capture_cmd_edits_all_get_committed(repo, tmp_path):
+    git_dir, work_tree = repo
+    trops_dir = tmp_path / 'trops'
+    trops_dir.mkdir()
+    (trops_dir / 'trops.cfg').write_text(
+        f'[env1]\ngit_dir = {git_dir}\nwork_tree = {work_tree}\ndisable_header = True\n')
+    count = 50
+    for i in range(count):
+        (work_tree / f'file{i}.conf').write_text(f'value = {i}\n')
+
+    go = tmp_path / 'go'
+    # Import everything first, then start all captures at once
+    script = ('import os, sys, time\n'
+              'from trops.exec import main\n'
+              'import trops.capcmd, trops.commitq\n'
+              f'while not os.path.exists({str(go)!r}):\n'
+              '    time.sleep(0.001)\n'
+              'main()\n')
+    env = dict(os.environ, TROPS_DIR=str(trops_dir), TROPS_ENV='env1', TROPS_SID='stress')
+    env.pop('TROPS_TAGS', None)
+    procs = [subprocess.Popen([sys.executable, '-c', script, 'capture-cmd', '0', 'vi', str(work_tree / f'file{i}.conf')],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+             for i in range(count)]
+    time.sleep(0.5)
+    go.touch()
+    outputs = [p.communicate(timeout=120) for p in procs]
+    assert all(p.returncode == 0 for p in procs), [err.decode() for _, err in outputs if err]
+
+    committed = _git(git_dir, 'ls-tree', '--name-only', 'HEAD').split()
+    assert sorted(committed) == sorted(f'file{i}.conf' for i in range(count))
+    fl_lines = [line for line in (trops_dir / 'log' / 'trops.log').read_text().splitlines() if ' FL trops show ' in line]
+    assert len(fl_lines) == count
+    assert all('TROPS_SID=stress' in line for line in fl_lines)
+    assert os.listdir(git_dir / SPOOL_DIR) == []
+    assert int(_git(git_dir, 'rev-list', '--count', 'HEAD')) <= count
@@ -0,0 +1,142 @@
+import subprocess
+import sys
+
+import pytest
+
+from trops import gitcmd
+
+
+@pytest.fixture(autouse=True)
+def clean_calls():
+    gitcmd.reset()
+    yield
+    gitcmd.reset()
+
+
+def test_subcommand_skips_global_options():
+    argv = ['sudo', 'git', '-C', '/', '--git-dir=/x.git', '--work-tree=/', 'ls-files', 'etc']
+    assert gitcmd.subcommand(argv) == 'git ls-files'
+    assert gitcmd.subcommand(['git', '-c', 'a=b', 'commit', '-m', 'x']) == 'git commit'
+    assert gitcmd.subcommand(['git']) == 'git'
+
+
+def test_run_records_argv_time_and_stdout(monkeypatch):
+    class Result:
+        returncode = 0
+        stdout = b'a\nb\n'
+
+    monkeypatch.setattr(subprocess, 'run', lambda cmd, **kw: Result())
+    result = gitcmd.run(['git', 'status'], capture_output=True)
+
+    assert result.stdout == b'a\nb\n'
+    (call,) = gitcmd.calls
+    assert call.argv == ['git', 'status']
+    assert call.stdout_bytes == 4
+    assert call.returncode == 0
+    assert call.seconds >= 0
+    # only trops frames make up the stack
+    assert call.stack == ()
+
+
+def test_call_passes_only_given_kwargs(monkeypatch):
+    seen = {}
+
+    def fake_call(cmd):
+        seen['cmd'] = cmd
+        return 3
+
+    monkeypatch.setattr(subprocess, 'call', fake_call)
+    assert gitcmd.call(['git', 'log']) == 3
+    assert seen['cmd'] == ['git', 'log']
+    assert gitcmd.calls[0].returncode == 3
+
+
+def test_check_output_records_failures():
+    with pytest.raises(subprocess.CalledProcessError):
+        gitcmd.check_output([sys.executable, '-c', 'import sys; print("x"); sys.exit(2)'])
+    assert gitcmd.calls[0].returncode == 2
+    assert gitcmd.calls[0].stdout_bytes == 2
+
+
+def test_summary_groups_by_caller_and_subcommand(monkeypatch):
+    calls = [
+        gitcmd.GitCall(['git', 'ls-files'], 0.010, 10, 0, ('TropsCapCmd.capture_cmd', 'TropsCapCmd._ls')),
+        gitcmd.GitCall(['git', 'ls-files'], 0.020, 10, 0, ('TropsCapCmd.capture_cmd', 'TropsCapCmd._ls')),
+        gitcmd.GitCall(['git', 'commit', '-m', 'x'], 0.040, 0, 0, ('TropsCapCmd.capture_cmd',)),
+    ]
+    lines = gitcmd.summary(calls).splitlines()
+
+    assert lines[0] == 'trops profile: 3 git calls, 70.0 ms, 20 bytes of stdout'
+    assert lines[1].startswith('TropsCapCmd.capture_cmd') and '3x' in lines[1]
+    # slowest child first, indented under its caller
+    assert lines[2].startswith('  git commit') and '40.0 ms' in lines[2]
+    assert lines[3].startswith('  TropsCapCmd._ls') and '2x' in lines[3]
+    assert lines[4].startswith('    git ls-files')
+    assert gitcmd.summary([]) == 'trops profile: no git calls'
+
+
+def test_profile_flag_prints_summary(monkeypatch, capsys):
+    from trops import exec as trops_exec
+
+    monkeypatch.setattr(sys, 'argv', ['trops', '--profile', 'gensid'])
+    trops_exec.main()
+    assert capsys.readouterr().err.startswith('trops profile:')
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    work_tree = tmp_path / 'wt'
+    work_tree.mkdir()
+    git_dir = tmp_path / 'repo.git'
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    git_cmd = ['git', '-C', str(work_tree), f'--git-dir={git_dir}', f'--work-tree={work_tree}']
+    (work_tree / 'a.txt').write_text('hello\n')
+    (work_tree / 'b.txt').write_text('new\n')
+    subprocess.run(git_cmd + ['add', 'a.txt'], check=True)
+    subprocess.run(git_cmd + ['-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-qm', 'a'], check=True)
+    return git_cmd
+
+
+def test_session_answers_over_one_process(git_repo):
+    session = gitcmd.GitSession(git_repo)
+    try:
+        assert session.is_tracked('a.txt')
+        assert not session.is_tracked('b.txt')
+        assert not session.is_tracked('../outside')
+
+        info = session.info('HEAD:a.txt')
+        assert info.type == 'blob' and info.size == 6 and info.data is None
+        assert session.read('HEAD:a.txt').data == b'hello\n'
+        assert session.read('HEAD').type == 'commit'
+        assert session.read('HEAD:missing.txt') is None
+        assert session.info('bad\nspec') is None
+    finally:
+        session.close()
+
+    started = [c for c in gitcmd.calls if c.returncode is None]
+    # one --batch-check and one --batch process for all of the queries above
+    assert sorted(c.argv[-1] for c in started) == ['--batch', '--batch-check']
+    # plus one record per query that reached git
+    assert len(gitcmd.calls) == 2 + 6
+
+
+def test_session_tracks_own_index_changes(git_repo):
+    session = gitcmd.GitSession(git_repo)
+    try:
+        assert not session.is_tracked('b.txt')
+        subprocess.run(git_repo + ['add', 'b.txt'], check=True)
+        # cat-file keeps the index it read first; callers record their changes
+        session.set_tracked('b.txt')
+        assert session.is_tracked('b.txt')
+        session.set_tracked('a.txt', False)
+        assert not session.is_tracked('a.txt')
+    finally:
+        session.close()
+
+
+def test_session_restarts_after_close(git_repo):
+    session = gitcmd.GitSession(git_repo)
+    assert session.is_tracked('a.txt')
+    session.close()
+    assert session.is_tracked('a.txt')
+    session.close()
@@ -0,0 +1,130 @@
+import subprocess
+
+import pytest
+
+from trops.gitobj import GitObjectError, ObjectStore, apply_delta
+
+
+def _git(git_dir, *args, **kw):
+    return subprocess.run(['git', f'--git-dir={git_dir}', '-c', 'user.name=t', '-c', 'user.email=t@t'] + list(args),
+                          check=True, capture_output=True, **kw).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git_dir = tmp_path / 'repo.git'
+    work_tree = tmp_path / 'wt'
+    (work_tree / 'etc').mkdir(parents=True)
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    wt = ['--work-tree', str(work_tree)]
+    base = ''.join(f'line {i} of a config file that changes a little\n' for i in range(400))
+    for n in range(12):
+        (work_tree / 'etc' / 'hosts').write_text(base + f'127.0.0.{n} host{n}\n' * (n + 1))
+        (work_tree / 'etc' / f'conf{n % 3}').write_text(base[n * 50:] + f'rev {n}\n')
+        _git(git_dir, *wt, 'add', '-A')
+        _git(git_dir, *wt, 'commit', '-qm', f'rev {n}')
+    return git_dir
+
+
+def _all_objects(git_dir):
+    out = _git(git_dir, 'cat-file', '--batch-all-objects', '--batch-check=%(objectname) %(objecttype)')
+    return [line.split() for line in out.decode().splitlines()]
+
+
+def _assert_matches_git(git_dir):
+    store = ObjectStore(str(git_dir))
+    objects = _all_objects(git_dir)
+    assert objects
+    for oid, obj_type in objects:
+        got_type, data = store.read(oid)
+        assert got_type == obj_type
+        assert data == _git(git_dir, 'cat-file', obj_type, oid)
+        assert store.info(oid) == (obj_type, len(data))
+    store.close()
+
+
+def test_reads_loose_objects(repo):
+    assert not list((repo / 'objects' / 'pack').glob('*.pack'))
+    _assert_matches_git(repo)
+
+
+def test_reads_packed_objects_with_ofs_deltas(repo):
+    _git(repo, 'repack', '-adf', '--depth=50', '--window=50')
+    (pack,) = (repo / 'objects' / 'pack').glob('*.idx')
+    assert b'chain length' in _git(repo, 'verify-pack', '-v', str(pack))
+    _assert_matches_git(repo)
+
+
+def test_reads_packed_objects_with_ref_deltas(repo):
+    _git(repo, '-c', 'repack.useDeltaBaseOffset=false', 'repack', '-adf', '--depth=50')
+    _assert_matches_git(repo)
+
+
+def test_resolves_revisions_and_paths(repo):
+    _git(repo, 'repack', '-ad')
+    _git(repo, 'tag', '-a', '-m', 'v1', 'v1', 'HEAD~3')
+    branch = _git(repo, 'symbolic-ref', '--short', 'HEAD').decode().strip()
+    store = ObjectStore(str(repo))
+    for rev in ('HEAD', branch, 'HEAD~1', 'HEAD^', 'HEAD~2^', 'v1', 'v1~1', 'HEAD:etc/hosts', 'HEAD~4:etc'):
+        expected = _git(repo, 'rev-parse', rev).decode().strip()
+        assert store.resolve(rev) == expected, rev
+
+    head = store.resolve('HEAD')
+    assert store.resolve(head[:7]) == head
+    oid, obj_type, data = store.read_spec(f'{head[:7]}:etc/hosts')
+    assert obj_type == 'blob'
+    assert data == _git(repo, 'show', f'{head}:etc/hosts')
+
+
+def test_unsupported_specs_raise(repo):
+    store = ObjectStore(str(repo))
+    for spec in (':etc/hosts', 'HEAD^{tree}', 'HEAD:missing', 'nosuchref', 'HEAD~99'):
+        with pytest.raises(GitObjectError):
+            store.resolve(spec)
+
+
+def test_replace_refs_are_left_to_git(repo):
+    head = _git(repo, 'rev-parse', 'HEAD').decode().strip()
+    parent = _git(repo, 'rev-parse', 'HEAD~1').decode().strip()
+    _git(repo, 'replace', head, parent)
+    with pytest.raises(GitObjectError):
+        ObjectStore(str(repo))
+
+
+def test_apply_delta_copy_and_insert():
+    base = b'0123456789'
+    # source size 10, target size 7: copy 4 bytes at offset 2, insert 'abc'
+    delta = bytes([10, 7, 0x80 | 0x01 | 0x10, 2, 4, 3]) + b'abc'
+    assert apply_delta(base, delta) == b'2345abc'
+
+
+def _trops_cli(monkeypatch, tmp_path, repo, extra=''):
+    import argparse
+    from trops.trops import TropsCLI
+
+    trops_dir = tmp_path / 'trops'
+    trops_dir.mkdir(exist_ok=True)
+    (trops_dir / 'trops.cfg').write_text(f'[e1]\ngit_dir = {repo}\nwork_tree = {tmp_path / "wt"}\n{extra}')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.setenv('TROPS_ENV', 'e1')
+    return TropsCLI(argparse.Namespace(commit='HEAD:etc/hosts'), [])
+
+
+def test_show_reads_blob_without_git(monkeypatch, tmp_path, repo, capfdbinary):
+    cli = _trops_cli(monkeypatch, tmp_path, repo)
+    expected = _git(repo, 'show', 'HEAD:etc/hosts')
+
+    def no_git(cmd, **kw):
+        raise AssertionError(f'unexpected git call: {cmd}')
+
+    monkeypatch.setattr(subprocess, 'call', no_git)
+    cli.show()
+    assert capfdbinary.readouterr().out == expected
+    # trees and commits are left to git show
+    assert cli.read_blob('HEAD:etc') is None
+    assert cli.read_blob('HEAD') is None
+
+
+def test_object_reader_can_be_turned_off(monkeypatch, tmp_path, repo):
+    cli = _trops_cli(monkeypatch, tmp_path, repo, 'object_reader = git\n')
+    assert cli.read_blob('HEAD:etc/hosts') is None
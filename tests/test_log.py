@@ -1,10 +1,13 @@
 import argparse
+import time
+
 import pytest
 
 from unittest.mock import patch
 
 from trops.log import TropsLog, add_log_subparsers
-from trops.log import check_tags
+from trops.log import TagFilter, check_tags
+from trops.trops import TropsError
 
 
 @pytest.fixture
@@ -118,4 +121,87 @@ def test_log_follow_without_filters_prints_lines(monkeypatch, tmp_path, setup_lo
     out = capsys.readouterr().out
     # Expect the two lines from follow, then the closing message (which starts with a leading newline)
     assert 'first line\nsecond line\n' in out
-    assert 'Closing trops log...' in out
\ No newline at end of file
+    assert 'Closing trops log...' in out
+
+def test_check_tags_separators_and_misses():
+    line = "2024-01-01 00:00:00 user@host INFO CM echo ok #> PWD=/, EXIT=0, TROPS_SID=abc, TROPS_TAGS=#12;prod"
+
+    assert check_tags('#12', line) is True
+    assert check_tags('#1', line) is False
+    assert check_tags('#1;prod', line) is True
+    assert check_tags('', line) is False
+    assert check_tags(',', line) is False
+    assert check_tags('#12', 'no tags here') is False
+
+
+def test_tag_filter_expressions():
+    line = "2024-01-01 00:00:00 user@host INFO CM echo ok #> PWD=/, EXIT=0, TROPS_TAGS=#123,prod"
+
+    assert TagFilter('#123 AND prod')(line) is True
+    assert TagFilter('#123 AND NOT prod')(line) is False
+    assert TagFilter('NOT test')(line) is True
+    assert TagFilter('#1,#123 AND NOT test')(line) is True
+    assert TagFilter('(#1 OR test) AND prod')(line) is False
+    assert TagFilter('#1 OR (prod AND #123)')(line) is True
+    assert TagFilter.is_expression('#1 AND prod') is True
+    assert TagFilter.is_expression('#1,prod') is False
+    with pytest.raises(TropsError):
+        TagFilter('(#1 AND')
+    with pytest.raises(TropsError):
+        TagFilter('#1 AND OR prod')
+
+
+def test_log_tags_expression_option(monkeypatch, tmp_path, capsys):
+    trops_dir = tmp_path / 'trops'
+    (trops_dir / 'log').mkdir(parents=True)
+    lines = [
+        "2024-01-01 00:00:00 u@h INFO CM a #> PWD=/, EXIT=0, TROPS_TAGS=#1,prod",
+        "2024-01-01 00:00:01 u@h INFO CM b #> PWD=/, EXIT=0, TROPS_TAGS=#1,test",
+        "2024-01-01 00:00:02 u@h INFO CM c #> PWD=/, EXIT=0, TROPS_TAGS=#2",
+    ]
+    (trops_dir / 'log' / 'trops.log').write_text('\n'.join(lines) + '\n')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.delenv('TROPS_TAGS', raising=False)
+    monkeypatch.delenv('TROPS_SID', raising=False)
+
+    with patch("sys.argv", ["trops", "log", "--tags", "#1 AND NOT test"]):
+        parser = argparse.ArgumentParser(prog='trops')
+        add_log_subparsers(parser.add_subparsers())
+        args, other_args = parser.parse_known_args()
+    tl = TropsLog(args, other_args)
+    assert tl.trops_prim_tag == '#1'
+    tl.log()
+    assert capsys.readouterr().out == lines[0] + '\n'
+
+
+def _legacy_check_tags(tag_string, line):
+    desired_tags = {t.strip() for sep in [',', ';'] for t in tag_string.split(sep)}
+    desired_tags = {t for t in desired_tags if t}
+    idx = line.find('TROPS_TAGS=')
+    if idx == -1:
+        return False
+    value = line[idx + len('TROPS_TAGS='):].split()[0]
+    line_tags = {t.strip() for sep in [',', ';'] for t in value.split(sep)}
+    return any(t in line_tags for t in desired_tags)
+
+
+def test_tag_filter_benchmark():
+    lines = [f"2024-01-01 00:00:00 u@h INFO CM cmd{i} #> PWD=/, EXIT=0, TROPS_SID=s{i % 9}, "
+             f"TROPS_TAGS=#{i % 50},env{i % 3}" for i in range(50000)]
+    lines += [f"2024-01-01 00:00:00 u@h INFO CM plain{i} #> PWD=/, EXIT=0" for i in range(10000)]
+    tag_string = '#7,#8'
+
+    def best_of(fn):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            matched = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), matched
+
+    tag_filter = TagFilter(tag_string)
+    new_time, new_matched = best_of(lambda: [l for l in lines if tag_filter(l)])
+    old_time, old_matched = best_of(lambda: [l for l in lines if _legacy_check_tags(tag_string, l)])
+    assert new_matched == old_matched
+    assert len(new_matched) == 2000
+    assert new_time < old_time
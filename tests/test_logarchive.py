@@ -0,0 +1,132 @@
+import argparse
+import gzip
+import os
+
+import pytest
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from trops import log as trops_log
+from trops.log import TropsLog, add_log_subparsers
+from trops.logarchive import (iter_segment_lines, list_segments, parse_age, parse_size,
+                              read_index, rotate, rotation_due)
+from trops.logquery import LogStore
+
+
+def _cm(ts, cmd, sid='s1', tags='#1'):
+    return f"{ts} u@h INFO CM {cmd} #> PWD=/, EXIT=0, TROPS_SID={sid}, TROPS_TAGS={tags}"
+
+
+OLD = [_cm('2024-01-01 00:00:00', 'ls'), _cm('2024-01-01 00:00:01', 'vi a', sid='s2', tags='#2,prod')]
+NEW = [_cm('2024-02-01 00:00:00', 'pwd', tags='#3')]
+
+
+@pytest.fixture
+def log_file(monkeypatch, tmp_path):
+    trops_dir = tmp_path / 'trops'
+    (trops_dir / 'log').mkdir(parents=True)
+    path = trops_dir / 'log' / 'trops.log'
+    path.write_text('\n'.join(OLD) + '\n')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    for var in ('TROPS_ENV', 'TROPS_SID', 'TROPS_TAGS'):
+        monkeypatch.delenv(var, raising=False)
+    return path
+
+
+def _rotate_and_append(path):
+    inode = os.stat(path).st_ino
+    segment = rotate(str(path), force=True)
+    with open(path, 'a') as f:
+        f.write('\n'.join(NEW) + '\n')
+    return segment, inode
+
+
+def test_rotate_writes_segment_and_index(log_file):
+    mode = os.stat(log_file).st_mode
+    segment, inode = _rotate_and_append(log_file)
+
+    assert list_segments(str(log_file)) == [segment]
+    assert segment.endswith('.gz')
+    with gzip.open(segment, 'rt') as f:
+        assert f.read().splitlines() == OLD
+    assert [l.decode().rstrip('\n') for l in iter_segment_lines(segment, len(OLD[0]) + 1)] == OLD[1:]
+    assert os.stat(log_file).st_mode == mode
+
+    index = read_index(segment)
+    assert index['first'] == '2024-01-01 00:00:00'
+    assert index['last'] == '2024-01-01 00:00:01'
+    assert index['sids'] == ['s1', 's2']
+    assert index['tags'] == ['#1', '#2', 'prod']
+    assert index['source_inode'] == inode
+    assert index['lines'] == 2
+
+
+def test_rotation_due_and_limits(log_file):
+    assert parse_size('10') == 10
+    assert parse_size('2k') == 2048
+    assert parse_size('1G') == 1 << 30
+    assert parse_age('12h') == timedelta(hours=12)
+    assert parse_age('3') == timedelta(days=3)
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+    assert rotation_due(str(log_file), max_bytes=10) is True
+    assert rotation_due(str(log_file), max_bytes=1 << 20) is False
+    assert rotation_due(str(log_file), max_age=timedelta(days=1)) is True
+    assert rotate(str(log_file), max_bytes=1 << 20) is None
+    assert list_segments(str(log_file)) == []
+
+
+def _run(capsys, *argv):
+    with patch('sys.argv', ['trops', 'log', *argv]):
+        parser = argparse.ArgumentParser(prog='trops')
+        add_log_subparsers(parser.add_subparsers())
+        args, other_args = parser.parse_known_args()
+    args.handler(args, other_args)
+    return capsys.readouterr().out.splitlines()
+
+
+def test_log_reads_across_segments(log_file, capsys, monkeypatch):
+    _rotate_and_append(log_file)
+
+    assert _run(capsys) == OLD + NEW
+    assert _run(capsys, '-t', '2') == OLD[1:] + NEW
+    assert _run(capsys, '--tags', 'prod') == OLD[1:]
+
+    # the index rules the segment out, so it is not decompressed
+    opened = []
+    real = trops_log.iter_segment_lines
+    monkeypatch.setattr(trops_log, 'iter_segment_lines', lambda *a: opened.append(a) or real(*a))
+    assert _run(capsys, '--tags', '#3') == NEW
+    assert opened == []
+
+
+def test_log_rotate_command(log_file, capsys):
+    assert _run(capsys, 'rotate', '--if-due') == []
+    out = _run(capsys, 'rotate')
+    assert out[0].startswith('Rotated ')
+    assert len(list_segments(str(log_file))) == 1
+    assert log_file.read_text() == ''
+
+
+def test_query_store_continues_into_segment(log_file, tmp_path):
+    store = LogStore(str(log_file), str(tmp_path / 'store.sqlite'))
+    try:
+        with open(log_file, 'w') as f:
+            f.write(OLD[0] + '\n')
+        assert store.sync() == 1
+        with open(log_file, 'a') as f:
+            f.write(OLD[1] + '\n')
+        _rotate_and_append(log_file)
+        # the rest of the rotated file, then the new live log
+        assert store.sync() == 2
+        assert store.query() == OLD + NEW
+
+        # a fresh store starts with the archived history
+        fresh = LogStore(str(log_file), str(tmp_path / 'fresh.sqlite'))
+        assert fresh.sync() == 3
+        assert fresh.query(sid='s2') == OLD[1:]
+        fresh.close()
+    finally:
+        store.close()
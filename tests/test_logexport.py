@@ -0,0 +1,90 @@
+import argparse
+import sqlite3
+
+import pytest
+
+from datetime import datetime
+from unittest.mock import patch
+
+from trops.log import add_log_subparsers
+from trops.logparse import parse_record
+
+
+CM_LINE = ("2024-01-02 03:04:05 alice@web1 WARNING CM systemctl restart nginx #> "
+           "PWD=/etc/nginx, EXIT=1, TROPS_SID=abc1234, TROPS_ENV=prod, TROPS_TAGS=#123,INC")
+FL_LINE = ("2024-01-02 03:04:06 alice@web1 INFO FL trops show 1a2b3c4:etc/nginx/nginx.conf  #> "
+           "UPDATE O=root,G=root,M=0644 TROPS_SID=abc1234 TROPS_ENV=prod TROPS_TAGS=#123,INC")
+
+
+def test_parse_cm_record():
+    r = parse_record(CM_LINE)
+    assert r.timestamp == datetime(2024, 1, 2, 3, 4, 5)
+    assert (r.user, r.host, r.level, r.type) == ('alice', 'web1', 'WARNING', 'CM')
+    assert r.command == 'systemctl restart nginx'
+    assert (r.pwd, r.exit, r.sid, r.env, r.tags) == ('/etc/nginx', 1, 'abc1234', 'prod', '#123,INC')
+    assert r.meta is None
+
+
+def test_parse_fl_record():
+    r = parse_record(FL_LINE)
+    assert r.type == 'FL'
+    assert r.command == 'trops show 1a2b3c4:etc/nginx/nginx.conf'
+    assert r.meta == 'UPDATE O=root,G=root,M=0644'
+    assert (r.pwd, r.exit, r.sid, r.env) == (None, None, 'abc1234', 'prod')
+    # capture-cmd variant with a comma after the note
+    r = parse_record(FL_LINE.replace('UPDATE O=', 'UPDATE, O='))
+    assert r.meta == 'UPDATE O=root,G=root,M=0644'
+
+
+def test_parse_ignores_other_lines():
+    assert parse_record('first line') is None
+    assert parse_record('2024-01-02 03:04:05 a@b INFO something else entirely') is None
+
+
+def _export_args(fmt, output):
+    argv = ['trops', 'log', 'export', '--format', fmt, '-o', str(output)]
+    with patch('sys.argv', argv):
+        parser = argparse.ArgumentParser(prog='trops')
+        subparsers = parser.add_subparsers()
+        add_log_subparsers(subparsers)
+        return parser.parse_known_args()
+
+
+def test_log_export_sqlite_is_incremental(monkeypatch, tmp_path, capsys):
+    trops_dir = tmp_path / 'trops'
+    (trops_dir / 'log').mkdir(parents=True)
+    log_file = trops_dir / 'log' / 'trops.log'
+    log_file.write_text(CM_LINE + '\n' + 'noise\n' + FL_LINE + '\n')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.delenv('TROPS_ENV', raising=False)
+
+    db = tmp_path / 'out' / 'log.db'
+    args, other_args = _export_args('sqlite', db)
+    args.handler(args, other_args)
+    assert 'Exported 2 records' in capsys.readouterr().out
+
+    with open(log_file, 'a') as f:
+        f.write(CM_LINE.replace('EXIT=1', 'EXIT=0') + '\n')
+    args.handler(args, other_args)
+    assert 'Exported 1 records' in capsys.readouterr().out
+
+    conn = sqlite3.connect(db)
+    rows = conn.execute('SELECT type, exit FROM records ORDER BY rowid').fetchall()
+    assert rows == [('CM', 1), ('FL', None), ('CM', 0)]
+
+
+def test_log_export_parquet(monkeypatch, tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    trops_dir = tmp_path / 'trops'
+    (trops_dir / 'log').mkdir(parents=True)
+    (trops_dir / 'log' / 'trops.log').write_text(CM_LINE + '\n' + FL_LINE + '\n')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.delenv('TROPS_ENV', raising=False)
+
+    out = tmp_path / 'parquet'
+    args, other_args = _export_args('parquet', out)
+    args.handler(args, other_args)
+    table = pq.read_table(str(out / 'part-00000.parquet'))
+    assert table.num_rows == 2
+    assert table.column('exit').to_pylist() == [1, None]
@@ -0,0 +1,87 @@
+import argparse
+import gzip
+import sqlite3
+import subprocess
+
+from unittest.mock import patch
+
+from trops.log import add_log_subparsers
+from trops.logmerge import merge_lines
+
+
+def _cm(ts, cmd, host='web1'):
+    return f"2024-01-01 {ts} u@{host} INFO CM {cmd} #> PWD=/, EXIT=0, TROPS_SID=s1"
+
+
+def test_merge_orders_by_time():
+    a = [_cm('00:00:01', 'a1'), _cm('00:00:05', 'a2')]
+    b = [_cm('00:00:02', 'b1'), 'continuation of b1', _cm('00:00:04', 'b2')]
+    assert list(merge_lines([a, b])) == [a[0], b[0], b[1], b[2], a[1]]
+
+
+def test_merge_reorders_within_skew_and_dedupes_across_inputs():
+    a = [_cm('00:00:03', 'x'), _cm('00:00:01', 'late'), _cm('00:00:09', 'y')]
+    b = [_cm('00:00:02', 'x'), _cm('00:00:08', 'z')]
+    merged = list(merge_lines([a, b], skew=2))
+    # 'late' is put back in order; 'x' from b is a copy of a's within the window
+    assert merged == [a[1], b[0], b[1], a[2]]
+    assert len(list(merge_lines([a, b], skew=2, unique=False))) == 5
+
+
+def test_merge_keeps_repeats_from_the_same_input():
+    a = [_cm('00:00:01', 'ls'), _cm('00:00:02', 'ls')]
+    assert list(merge_lines([a], skew=5)) == a
+
+
+def test_merge_is_streaming():
+    def endless(host):
+        i = 0
+        while True:
+            yield _cm(f'00:{i // 60 % 60:02d}:{i % 60:02d}', f'cmd{i}', host)
+            i += 1
+
+    merged = merge_lines([endless('a'), endless('b')], skew=1)
+    first = [next(merged) for _ in range(6)]
+    assert [l.split()[2] for l in first] == ['u@a', 'u@b'] * 3
+
+
+def _run(capsys, *argv):
+    with patch('sys.argv', ['trops', 'log', 'merge', *argv]):
+        parser = argparse.ArgumentParser(prog='trops')
+        add_log_subparsers(parser.add_subparsers())
+        args, other_args = parser.parse_known_args()
+    args.handler(args, other_args)
+    return capsys.readouterr().out
+
+
+def test_log_merge_files_segments_and_git_blobs(monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv('TROPS_DIR', str(tmp_path / 'trops'))
+    monkeypatch.delenv('TROPS_ENV', raising=False)
+    plain = tmp_path / 'web1.log'
+    plain.write_text(_cm('00:00:01', 'a') + '\n' + _cm('00:00:04', 'c') + '\n')
+    segment = tmp_path / 'trops.log.20240101000000.gz'
+    with gzip.open(segment, 'wt') as f:
+        f.write(_cm('00:00:02', 'b', 'web2') + '\n')
+
+    out = _run(capsys, str(plain), str(segment))
+    assert out.splitlines() == [_cm('00:00:01', 'a'), _cm('00:00:02', 'b', 'web2'), _cm('00:00:04', 'c')]
+
+    db = tmp_path / 'merged.db'
+    assert 'Merged 3 records' in _run(capsys, '--format', 'sqlite', '-o', str(db), str(plain), str(segment))
+    assert sqlite3.connect(db).execute('SELECT host FROM records ORDER BY rowid').fetchall() == [
+        ('web1',), ('web2',), ('web1',)]
+
+    # git:<ref>:<path> is streamed from 'git cat-file -p' in the env repo
+    work_tree = tmp_path / 'wt'
+    work_tree.mkdir()
+    git_dir = tmp_path / 'env.git'
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    git = ['git', f'--git-dir={git_dir}', f'--work-tree={work_tree}']
+    (work_tree / 'host3.log').write_text(_cm('00:00:03', 'from-git', 'web3') + '\n')
+    subprocess.run(git + ['add', 'host3.log'], check=True)
+    subprocess.run(git + ['-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-qm', 'log'], check=True)
+    trops_dir = tmp_path / 'trops'
+    trops_dir.mkdir(exist_ok=True)
+    (trops_dir / 'trops.cfg').write_text(f'[myenv]\ngit_dir = {git_dir}\nwork_tree = {work_tree}\n')
+    out = _run(capsys, '-e', 'myenv', str(plain), 'git:HEAD:host3.log')
+    assert out.splitlines() == [_cm('00:00:01', 'a'), _cm('00:00:03', 'from-git', 'web3'), _cm('00:00:04', 'c')]
@@ -0,0 +1,117 @@
+import argparse
+import time
+
+import pytest
+
+from unittest.mock import patch
+
+from trops.log import add_log_subparsers
+from trops.logquery import LogStore, parse_exit_expr
+from trops.trops import TropsError
+
+
+def _cm(ts, cmd, pwd='/root', exit_code=0, sid='abc1234', env='prod', tags='#123', user='alice@web1'):
+    return (f"{ts} {user} INFO CM {cmd} #> PWD={pwd}, EXIT={exit_code}, "
+            f"TROPS_SID={sid}, TROPS_ENV={env}, TROPS_TAGS={tags}")
+
+
+LINES = [
+    _cm('2024-01-01 10:00:00', 'ls -la'),
+    _cm('2024-01-01 11:00:00', 'systemctl restart nginx', pwd='/etc/nginx', exit_code=1),
+    'free text line',
+    _cm('2024-01-02 09:00:00', 'vi /etc/hosts', pwd='/etc', sid='def5678', tags='#124,INC'),
+    ("2024-01-02 09:00:01 alice@web1 INFO FL trops show 1a2b3c4:etc/hosts  #> "
+     "UPDATE, O=root,G=root,M=0644 TROPS_SID=def5678 TROPS_ENV=prod TROPS_TAGS=#124,INC"),
+    _cm('2024-01-03 08:00:00', 'systemctl status sshd', pwd='/etcetera', user='bob@web2', exit_code=3),
+]
+
+
+def _run(argv, capsys):
+    with patch('sys.argv', ['trops'] + argv):
+        parser = argparse.ArgumentParser(prog='trops')
+        subparsers = parser.add_subparsers()
+        add_log_subparsers(subparsers)
+        args, other_args = parser.parse_known_args()
+    args.handler(args, other_args)
+    return capsys.readouterr().out
+
+
+@pytest.fixture
+def log_env(monkeypatch, tmp_path):
+    trops_dir = tmp_path / 'trops'
+    (trops_dir / 'log').mkdir(parents=True)
+    log_file = trops_dir / 'log' / 'trops.log'
+    log_file.write_text('\n'.join(LINES) + '\n')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    for var in ('TROPS_ENV', 'TROPS_SID', 'TROPS_TAGS'):
+        monkeypatch.delenv(var, raising=False)
+    return log_file
+
+
+def test_query_without_filters_matches_trops_log(log_env, capsys):
+    assert _run(['log', 'query'], capsys) == _run(['log', '--all'], capsys)
+    assert _run(['log', 'query', '-t', '2'], capsys) == _run(['log', '--all', '-t', '2'], capsys)
+
+
+def test_query_filters(log_env, capsys):
+    def lines(*argv):
+        return _run(['log', 'query', *argv], capsys).splitlines()
+
+    assert lines('--exit!=0') == [LINES[1], LINES[5]]
+    assert lines('--exit', '>1') == [LINES[5]]
+    assert lines('--cmd', 'systemctl*') == [LINES[1], LINES[5]]
+    assert lines('--pwd', '/etc') == [LINES[1], LINES[3]]
+    assert lines('--sid', 'def5678') == [LINES[3], LINES[4]]
+    assert lines('--tag', 'INC', '--type', 'CM') == [LINES[3]]
+    assert _run(['log', 'query', '--tag', '#124', '--tag', '#123'], capsys) == '\n'
+    assert lines('--tag', '#124,#123', '--user', 'alice') == [LINES[0], LINES[1], LINES[3], LINES[4]]
+    assert lines('--user', 'bob@web2') == [LINES[5]]
+    assert lines('--since', '2024-01-01 10:30', '--until', '2024-01-02') == LINES[1:2] + LINES[3:5]
+
+
+def test_store_syncs_incrementally_and_rebuilds(log_env, tmp_path):
+    store = LogStore(str(log_env), str(tmp_path / 'store.sqlite'))
+    try:
+        assert store.sync() == len(LINES)
+        assert store.sync() == 0
+        with open(log_env, 'a') as f:
+            f.write(_cm('2024-01-04 00:00:00', 'uptime') + '\n' + 'partial')
+        assert store.sync() == 1
+        assert store.query(cmd='uptime') == [_cm('2024-01-04 00:00:00', 'uptime')]
+
+        # a rotated log replaces the index instead of appending to it
+        log_env.unlink()
+        log_env.write_text(LINES[0] + '\n')
+        assert store.sync() == 1
+        assert store.query() == [LINES[0]]
+    finally:
+        store.close()
+
+
+def test_parse_exit_expr():
+    assert parse_exit_expr('0') == ('=', 0)
+    assert parse_exit_expr('!=0') == ('!=', 0)
+    assert parse_exit_expr('<>0') == ('!=', 0)
+    assert parse_exit_expr('>= 2') == ('>=', 2)
+    with pytest.raises(TropsError):
+        parse_exit_expr('nonzero')
+
+
+def test_query_benchmark(tmp_path):
+    log_file = tmp_path / 'trops.log'
+    with open(log_file, 'w') as f:
+        for i in range(50000):
+            f.write(_cm(f'2024-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}',
+                        f'cmd{i % 100} arg', exit_code=i % 7, sid=f's{i % 50}') + '\n')
+    store = LogStore(str(log_file), str(tmp_path / 'store.sqlite'))
+    try:
+        store.sync()
+        start = time.perf_counter()
+        for _ in range(20):
+            rows = store.query(sid='s7', exit_expr='!=0', cmd='cmd7*')
+        elapsed = (time.perf_counter() - start) / 20
+    finally:
+        store.close()
+    assert len(rows) == sum(1 for i in range(50000) if i % 100 == 7 and i % 7)
+    # an indexed lookup; a linear scan in Python takes far longer
+    assert elapsed < 0.05
@@ -0,0 +1,67 @@
+import argparse
+
+from unittest.mock import patch
+
+from trops.log import TagFilter, TropsLog, add_log_subparsers
+from trops.logscan import scan, scan_range
+
+
+def _line(i):
+    return (f"2024-01-01 00:00:{i % 60:02d} u@h INFO CM cmd{i} #> PWD=/, EXIT=0, "
+            f"TROPS_SID=s{i % 7}, TROPS_ENV=prod, TROPS_TAGS=#{i % 5},env{i % 3}")
+
+
+def _write_log(path, count=3000):
+    lines = [_line(i) for i in range(count)]
+    # lines without the fields, and a multibyte one, must not confuse the scan
+    lines[10] = 'free text ä TROPS_SID=s1 in the middle'
+    lines[11] = ''
+    # only the first TROPS_TAGS= of a line is the tag field
+    lines[12] = 'x u@h INFO CM echo TROPS_TAGS=#9 #> PWD=/, TROPS_SID=s0, TROPS_TAGS=#2,env1'
+    lines[13] = 'x u@h INFO CM echo TROPS_TAGS=#2,env1 #> PWD=/, TROPS_SID=s0, TROPS_TAGS=#2,env2'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return lines
+
+
+def test_scan_matches_sequential_filter(tmp_path):
+    log_file = tmp_path / 'trops.log'
+    lines = _write_log(log_file)
+
+    expected_sid = [l for l in lines if 'TROPS_SID=s1' in l]
+    tag_filter = TagFilter('#2 AND NOT env0')
+    expected_tags = [l for l in lines if tag_filter(l)]
+
+    # small chunks so that many chunk boundaries fall inside lines
+    for jobs in (1, 3):
+        assert scan(str(log_file), 'sid', 's1', jobs=jobs, chunk_size=997) == expected_sid
+        assert scan(str(log_file), 'tags', '#2 AND NOT env0', jobs=jobs, chunk_size=997) == expected_tags
+
+
+def test_scan_range_is_bounded(tmp_path):
+    log_file = tmp_path / 'trops.log'
+    lines = _write_log(log_file, count=20)
+    size = log_file.stat().st_size
+    first = len(lines[0]) + 1
+    assert scan_range(str(log_file), 0, first, 'sid', 's0') == lines[0].encode() + b'\n'
+    assert scan_range(str(log_file), first, size, 'sid', 's0').count(b'\n') == sum('TROPS_SID=s0' in l for l in lines[1:])
+
+
+def test_log_jobs_output_matches_sequential(monkeypatch, tmp_path, capsys):
+    trops_dir = tmp_path / 'trops'
+    (trops_dir / 'log').mkdir(parents=True)
+    _write_log(trops_dir / 'log' / 'trops.log', count=500)
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.delenv('TROPS_ENV', raising=False)
+    monkeypatch.delenv('TROPS_TAGS', raising=False)
+    monkeypatch.setenv('TROPS_SID', 's3')
+
+    def run(*argv):
+        with patch('sys.argv', ['trops', 'log', *argv]):
+            parser = argparse.ArgumentParser(prog='trops')
+            add_log_subparsers(parser.add_subparsers())
+            args, other_args = parser.parse_known_args()
+        TropsLog(args, other_args).log()
+        return capsys.readouterr().out
+
+    assert run('-j', '2') == run('-j', '1')
+    assert run('-j', '2', '--tags', '#1,#4') == run('-j', '1', '--tags', '#1,#4')
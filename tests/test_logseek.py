@@ -0,0 +1,120 @@
+import argparse
+import random
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from trops import logseek
+from trops.logseek import filter_window, find_offset, read_window, time_key
+
+
+START = datetime(2024, 1, 1)
+
+
+def _write_log(path, count=20000, jitter=5, seed=7):
+    """A log with a line every ~3s, some written up to jitter seconds late,
+    and an untimed continuation line now and then."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        ts = START + timedelta(seconds=3 * i)
+        if rng.random() < 0.05:
+            ts -= timedelta(seconds=rng.randint(1, jitter))
+        lines.append(f'{ts:%Y-%m-%d %H:%M:%S} u@h INFO CM cmd{i} #> PWD=/, EXIT=0, TROPS_SID=s\n')
+        if i % 500 == 0:
+            lines.append(f'  continuation of cmd{i}\n')
+    path.write_text(''.join(lines))
+    return lines
+
+
+def _naive(lines, since, until):
+    out, current = [], None
+    for line in lines:
+        if line[:4].isdigit():
+            current = line[:19]
+        if current and since.strftime('%Y-%m-%d %H:%M:%S') <= current <= until.strftime('%Y-%m-%d %H:%M:%S'):
+            out.append(line.encode())
+    return out
+
+
+@pytest.mark.parametrize('scan_bytes', [64 << 10, 512])
+def test_read_window_matches_full_scan(monkeypatch, tmp_path, scan_bytes):
+    monkeypatch.setattr(logseek, 'SCAN_BYTES', scan_bytes)
+    log = tmp_path / 'trops.log'
+    lines = _write_log(log)
+    for start_s, length_s in ((0, 60), (1500, 1800), (30000, 7), (59990, 100), (3 * 20000 + 50, 10)):
+        since = START + timedelta(seconds=start_s)
+        until = since + timedelta(seconds=length_s)
+        assert list(read_window(str(log), since, until)) == _naive(lines, since, until), (start_s, length_s)
+
+
+def test_open_ended_windows(tmp_path):
+    log = tmp_path / 'trops.log'
+    lines = _write_log(log, count=2000)
+    cut = START + timedelta(seconds=3000)
+    assert list(read_window(str(log), since=cut)) == _naive(lines, cut, START + timedelta(days=1))
+    head = list(read_window(str(log), until=START + timedelta(seconds=2)))
+    assert head == [lines[0].encode(), lines[1].encode()]
+
+
+def test_find_offset_probes_few_lines(monkeypatch, tmp_path):
+    log = tmp_path / 'trops.log'
+    _write_log(log, count=50000)
+    reads = []
+
+    class CountingFile:
+        def __init__(self, f):
+            self.f = f
+
+        def readline(self):
+            line = self.f.readline()
+            reads.append(len(line))
+            return line
+
+        def __getattr__(self, name):
+            return getattr(self.f, name)
+
+    with open(log, 'rb') as f:
+        size = log.stat().st_size
+        offset = find_offset(CountingFile(f), size, time_key(START + timedelta(hours=24)))
+        f.seek(offset)
+        assert f.readline().startswith(b'2024-01-02 00:00:00')
+    # binary search plus one SCAN_BYTES block, not the whole file
+    assert sum(reads) < (logseek.SCAN_BYTES + 64 * 1024) < size
+
+
+def test_filter_window_untimed_lines_follow_their_record():
+    lines = [b'2024-01-01 00:00:01 a\n', b'  more a\n', b'2024-01-01 00:00:05 b\n', b'  more b\n']
+    got = list(filter_window(lines, since=datetime(2024, 1, 1, 0, 0, 3)))
+    assert got == lines[2:]
+
+
+def test_log_since_until_options(monkeypatch, tmp_path, capsys):
+    from trops.log import TropsLog
+
+    monkeypatch.setenv('TROPS_DIR', str(tmp_path))
+    monkeypatch.delenv('TROPS_ENV', raising=False)
+    monkeypatch.delenv('TROPS_TAGS', raising=False)
+    monkeypatch.delenv('TROPS_SID', raising=False)
+    log = tmp_path / 'log' / 'trops.log'
+    log.parent.mkdir(parents=True, exist_ok=True)
+    lines = _write_log(log, count=3000)
+
+    args = argparse.Namespace(save=False, name=None, tail=None, follow=False, all=False, tags=None, jobs=None,
+                              since='2024-01-01 01:00', until='2024-01-01 01:00')
+    TropsLog(args, []).log()
+    out = capsys.readouterr().out.splitlines()
+    expected = [l.decode().strip() for l in _naive(lines, datetime(2024, 1, 1, 1), datetime(2024, 1, 1, 1, 0, 59))]
+    assert out == expected and out
+
+
+def test_log_rejects_bad_time(monkeypatch, tmp_path):
+    from trops.log import TropsLog
+    from trops.trops import TropsError
+
+    monkeypatch.setenv('TROPS_DIR', str(tmp_path))
+    args = argparse.Namespace(save=False, name=None, tail=None, follow=False, all=False, tags=None, jobs=None,
+                              since='last tuesday', until=None)
+    with pytest.raises(TropsError):
+        TropsLog(args, [])
@@ -0,0 +1,77 @@
+import os
+
+from trops.pkgsnap import (PackageSnapshot, diff_packages, format_summary,
+                           read_dpkg_status, read_package_list)
+
+
+DPKG_STATUS = """\
+Package: nginx
+Status: install ok installed
+Architecture: amd64
+Version: 1.24.0-1
+Description: web server
+ with a continuation line
+
+Package: telnet
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 0.17-44
+
+Package: tzdata
+Status: install ok installed
+Architecture: all
+Version: 2024a-1
+"""
+
+
+def test_read_dpkg_status(tmp_path):
+    status = tmp_path / 'status'
+    status.write_text(DPKG_STATUS)
+    assert read_dpkg_status(str(status)) == {
+        'nginx:amd64': '1.24.0-1',
+        'tzdata:all': '2024a-1',
+    }
+
+
+def test_diff_and_summary():
+    old = {'a': '1', 'b': '1', 'c': '1'}
+    new = {'a': '1', 'b': '2', 'd': '1'}
+    added, removed, changed = diff_packages(old, new)
+    assert (added, removed, changed) == (['d'], ['c'], ['b'])
+    assert format_summary(added, removed, changed) == '+d,~b,-c'
+    many = format_summary([f'p{i}' for i in range(10)], [], [])
+    assert many.endswith(',...2more') and ' ' not in many
+
+
+def _snapshot(tmp_path):
+    status = tmp_path / 'status'
+    status.write_text(DPKG_STATUS)
+    snap = PackageSnapshot('dpkg', str(tmp_path / 'log' / 'apt_pkg_list.host'), str(tmp_path / 'tmp' / 'state'))
+    (tmp_path / 'log').mkdir()
+    snap.dpkg_status = str(status)
+    return snap, status
+
+
+def test_snapshot_writes_sorted_list_and_skips_unchanged_db(tmp_path, monkeypatch):
+    snap, status = _snapshot(tmp_path)
+    assert snap.update() == '+nginx:amd64,+tzdata:all'
+    assert open(snap.list_file).read() == 'nginx:amd64 1.24.0-1\ntzdata:all 2024a-1\n'
+
+    # Unchanged database: the status file is not even parsed
+    import trops.pkgsnap as pkgsnap
+    monkeypatch.setattr(pkgsnap, 'read_dpkg_status', lambda path: (_ for _ in ()).throw(AssertionError))
+    assert snap.update() is None
+
+
+def test_snapshot_reports_delta_only(tmp_path):
+    snap, status = _snapshot(tmp_path)
+    snap.update()
+    status.write_text(DPKG_STATUS.replace('1.24.0-1', '1.26.0-1'))
+    st = os.stat(status)
+    os.utime(status, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert snap.update() == '~nginx:amd64'
+    assert read_package_list(snap.list_file)['nginx:amd64'] == '1.26.0-1'
+
+    # Database touched but package set identical: nothing to commit
+    os.utime(status, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))
+    assert snap.update() is None
@@ -0,0 +1,93 @@
+import argparse
+import io
+import os
+
+from textwrap import dedent
+
+from trops import savemark
+
+
+def test_appends_only_new_content(monkeypatch, tmp_path):
+    target = tmp_path / 'ticket.log'
+    first = ''.join(f'line {i}\n' for i in range(1000))
+    assert savemark.save(str(tmp_path), str(target), first) is True
+    ino = target.stat().st_ino
+
+    writes = []
+    real_open = open
+
+    def tracking_open(path, mode='r', *a, **kw):
+        if str(path) == str(target) and mode in ('wb', 'ab'):
+            writes.append(mode)
+        return real_open(path, mode, *a, **kw)
+
+    monkeypatch.setattr('builtins.open', tracking_open)
+    second = first + 'line 1000\n'
+    assert savemark.save(str(tmp_path), str(target), second) is True
+    assert writes == ['ab']
+    assert target.read_text() == second
+    assert target.stat().st_ino == ino
+
+    # Nothing new: no write, nothing to commit
+    assert savemark.save(str(tmp_path), str(target), second) is False
+    assert writes == ['ab']
+
+
+def test_rewrites_when_the_prefix_changed(tmp_path):
+    target = tmp_path / 'ticket.md'
+    savemark.save(str(tmp_path), str(target), '| a |\n|---|\n| 1 |')
+    assert savemark.save(str(tmp_path), str(target), '| aa |\n|----|\n| 1  |\n| 22 |') is True
+    assert target.read_text() == '| aa |\n|----|\n| 1  |\n| 22 |'
+
+
+def test_rewrites_a_file_edited_since_the_last_save(tmp_path):
+    target = tmp_path / 'ticket.log'
+    savemark.save(str(tmp_path), str(target), 'a\n')
+    target.write_text('edited by hand\n')
+    assert savemark.save(str(tmp_path), str(target), 'a\nb\n') is True
+    assert target.read_text() == 'a\nb\n'
+
+
+def test_same_content_without_mark_is_unchanged(tmp_path):
+    target = tmp_path / 'ticket.log'
+    target.write_text('a\nb\n')
+    assert savemark.save(str(tmp_path), str(target), 'a\nb\n') is False
+    assert str(target) in savemark.load_marks(str(tmp_path))
+
+
+def _tldr_save(monkeypatch, trops_dir, logs):
+    from trops.tldr import TropsTLDR, add_tldr_subparsers
+
+    monkeypatch.setattr('sys.stdin', io.StringIO(logs))
+    parser = argparse.ArgumentParser(prog='trops')
+    add_tldr_subparsers(parser.add_subparsers())
+    args, other_args = parser.parse_known_args(['tldr', '-s'])
+    TropsTLDR(args, other_args).run()
+
+
+def test_tldr_save_skips_commit_when_nothing_changed(monkeypatch, tmp_path):
+    from trops.trops import TropsCLI
+
+    trops_dir = tmp_path / 'trops'
+    trops_dir.mkdir()
+    (tmp_path / 'work').mkdir()
+    (trops_dir / 'trops.cfg').write_text(dedent(f"""
+        [myenv]
+        git_dir = {tmp_path / 'repo.git'}
+        work_tree = {tmp_path / 'work'}
+        """))
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.setenv('TROPS_ENV', 'myenv')
+    monkeypatch.setenv('TROPS_TAGS', '#42')
+    touched = []
+    monkeypatch.setattr(TropsCLI, '_touch_file', lambda self, path: touched.append(path))
+
+    line = '2025-08-13 00:00:0{} u@h INFO CM make install  #> PWD=/src, EXIT=0, TROPS_ENV=myenv TROPS_TAGS=#42\n'
+    _tldr_save(monkeypatch, trops_dir, line.format(1))
+    _tldr_save(monkeypatch, trops_dir, line.format(1))
+    assert len(touched) == 1
+    _tldr_save(monkeypatch, trops_dir, line.format(1) + line.format(2))
+    assert len(touched) == 2
+    saved = trops_dir / 'tablog' / 'myenv__i42.md'
+    assert saved.read_text().count('make install') == 2
+    assert os.path.abspath(touched[0]) == str(saved)
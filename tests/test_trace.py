@@ -0,0 +1,85 @@
+import argparse
+import subprocess
+import sys
+
+from unittest.mock import patch
+
+from trops import trace
+from trops.capcmd import add_capture_cmd_subparsers
+from trops.stats import add_stats_subparsers, percentile
+
+
+def test_ring_keeps_the_last_records(monkeypatch, tmp_path):
+    monkeypatch.setattr(trace, 'RING_SLOTS', 4)
+    path = str(tmp_path / 'tmp' / 'trace.ring')
+    for i in range(6):
+        trace.append_record(path, {'t': i, 'cmd': f'c{i}', 'ms': float(i), 'sub': 0, 'rc': 0, 'p': {}})
+    assert [r['cmd'] for r in trace.read_records(path)] == ['c2', 'c3', 'c4', 'c5']
+    assert (tmp_path / 'tmp' / 'trace.ring').stat().st_size == trace.HEADER_SIZE + 4 * trace.SLOT_SIZE
+
+
+def test_oversized_record_drops_fastest_phases(tmp_path):
+    path = str(tmp_path / 'trace.ring')
+    phases = {f'phase{i:03d}': [float(i), 0] for i in range(100)}
+    trace.append_record(path, {'t': 0, 'cmd': 'x', 'ms': 1.0, 'sub': 0, 'rc': 0, 'p': phases})
+    (record,) = trace.read_records(path)
+    assert 'phase099' in record['p'] and 'phase000' not in record['p']
+
+
+def test_tracer_counts_subprocesses_per_phase():
+    original = subprocess.Popen.__init__
+    tracer = trace.Tracer('echo')
+    try:
+        subprocess.run([sys.executable, '-c', 'pass'])
+        tracer.mark('first')
+        tracer.mark('second')
+    finally:
+        tracer.stop()
+    assert subprocess.Popen.__init__ is original
+    assert tracer.phases['first'][1] == 1
+    assert tracer.phases['second'][1] == 0
+    assert tracer.record(0)['sub'] == 1
+
+
+def _capture(argv):
+    with patch('sys.argv', ['trops', 'capture-cmd', *argv]):
+        parser = argparse.ArgumentParser(prog='trops')
+        add_capture_cmd_subparsers(parser.add_subparsers())
+        args, other_args = parser.parse_known_args()
+    args.handler(args, other_args)
+
+
+def test_capture_cmd_trace_and_stats(monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv('TROPS_DIR', str(tmp_path))
+    monkeypatch.delenv('TROPS_ENV', raising=False)
+    ring = tmp_path / 'tmp' / 'trace.ring'
+
+    monkeypatch.delenv('TROPS_TRACE', raising=False)
+    _capture(['0', 'ls'])
+    assert not ring.exists()
+
+    monkeypatch.setenv('TROPS_TRACE', '1')
+    _capture(['1', 'make', 'all'])
+    (record,) = trace.read_records(str(ring))
+    assert record['cmd'] == 'make all'
+    assert record['rc'] == 1
+    assert {'config', 'logger', 'editor', 'log', 'exit'} <= set(record['p'])
+    assert not trace.active()
+
+    capsys.readouterr()
+    with patch('sys.argv', ['trops', 'stats']):
+        parser = argparse.ArgumentParser(prog='trops')
+        add_stats_subparsers(parser.add_subparsers())
+        args, other_args = parser.parse_known_args()
+    args.handler(args, other_args)
+    out = capsys.readouterr().out
+    assert '1 traced capture-cmd runs' in out
+    assert 'total' in out and 'make all' in out
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
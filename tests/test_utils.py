@@ -37,4 +37,101 @@ def test_generate_sid_format(capsys):
     generate_sid(None, None)
     out = capsys.readouterr().out
     import re
-    assert re.fullmatch(r"[a-z]{3}[0-9a-f]{4}\n", out) is not None
\ No newline at end of file
+    assert re.fullmatch(r"[a-z]{3}[0-9a-f]{4}\n", out) is not None
+
+def _make_fake_repo(root):
+    (root / '.git').mkdir(parents=True)
+    (root / '.git' / 'HEAD').write_text('ref: refs/heads/main\n')
+
+
+def test_find_git_work_tree_walks_up(monkeypatch, tmp_path):
+    from trops import utils
+    monkeypatch.setattr(utils, '_git_work_tree_cache', {})
+    monkeypatch.delenv('GIT_CEILING_DIRECTORIES', raising=False)
+    repo = tmp_path / 'repo'
+    _make_fake_repo(repo)
+    f = repo / 'a' / 'b' / 'file.txt'
+    f.parent.mkdir(parents=True)
+    f.write_text('x')
+    assert utils.find_git_work_tree(str(f)) == str(repo.resolve())
+    assert utils.is_in_git_work_tree(str(f)) is True
+    # Memoized for every directory visited on the way up
+    assert utils._git_work_tree_cache[str((repo / 'a').resolve())] == str(repo.resolve())
+
+
+def test_find_git_work_tree_honors_ceiling(monkeypatch, tmp_path):
+    from trops import utils
+    monkeypatch.setattr(utils, '_git_work_tree_cache', {})
+    repo = tmp_path / 'repo'
+    _make_fake_repo(repo)
+    f = repo / 'sub' / 'file.txt'
+    f.parent.mkdir(parents=True)
+    f.write_text('x')
+    monkeypatch.setenv('GIT_CEILING_DIRECTORIES', str(repo))
+    assert utils.find_git_work_tree(str(f)) is None
+
+
+def test_find_git_work_tree_outside_repo_and_in_git_dir(monkeypatch, tmp_path):
+    from trops import utils
+    monkeypatch.setattr(utils, '_git_work_tree_cache', {})
+    monkeypatch.setenv('GIT_CEILING_DIRECTORIES', str(tmp_path))
+    plain = tmp_path / 'plain' / 'file.txt'
+    plain.parent.mkdir(parents=True)
+    plain.write_text('x')
+    assert utils.find_git_work_tree(str(plain)) is None
+    repo = tmp_path / 'repo'
+    _make_fake_repo(repo)
+    assert utils.find_git_work_tree(str(repo / '.git' / 'HEAD')) is None
+    assert utils.find_git_work_tree(str(tmp_path / 'missing' / 'file')) is None
+
+
+def test_find_git_work_tree_matches_git(monkeypatch, tmp_path):
+    import subprocess
+    from trops import utils
+    monkeypatch.setattr(utils, '_git_work_tree_cache', {})
+    monkeypatch.setenv('GIT_CEILING_DIRECTORIES', str(tmp_path))
+    repo = tmp_path / 'real'
+    subprocess.run(['git', 'init', str(repo)], check=True, capture_output=True)
+    f = repo / 'd' / 'f.txt'
+    f.parent.mkdir()
+    f.write_text('x')
+    assert utils.is_in_git_work_tree(str(f)) is True
+    assert utils.is_in_git_work_tree(str(tmp_path / 'f.txt')) is False
+
+
+def test_prepend_line_streams_into_a_replacement(tmp_path):
+    import os
+    from trops import utils
+
+    target = tmp_path / 'dump.sql'
+    body = os.urandom(3 * utils.COPY_CHUNK + 123)
+    target.write_bytes(body)
+    target.chmod(0o640)
+    old_ino = target.stat().st_ino
+
+    assert utils.prepend_line(str(target), '# pg_dump db') is True
+    assert target.read_bytes() == b'# pg_dump db\n' + body
+    assert target.stat().st_mode & 0o7777 == 0o640
+    assert target.stat().st_ino != old_ino
+    assert [p.name for p in tmp_path.iterdir()] == ['dump.sql']
+    # already there: left alone
+    assert utils.prepend_line(str(target), '# pg_dump db') is False
+
+
+def test_prepend_line_shifts_in_place_without_a_writable_dir(monkeypatch, tmp_path):
+    import tempfile
+    from trops import utils
+
+    def no_tempfile(*args, **kwargs):
+        raise PermissionError('read-only directory')
+
+    monkeypatch.setattr(tempfile, 'mkstemp', no_tempfile)
+    monkeypatch.setattr(utils, 'COPY_CHUNK', 7)
+    target = tmp_path / 'out.txt'
+    body = b''.join(b'row %d\n' % i for i in range(100))
+    target.write_bytes(body)
+    old_ino = target.stat().st_ino
+
+    assert utils.prepend_line(str(target), '# seq 100') is True
+    assert target.read_bytes() == b'# seq 100\n' + body
+    assert target.stat().st_ino == old_ino
@@ -87,3 +87,145 @@ def test_view_requires_file_argument():
             _ = parser.parse_known_args()
 
 
+
+
+from trops.view import front_matter_end, hex_preview, parse_range
+
+
+def test_parse_range():
+    assert parse_range('bytes=0-9', 100) == (0, 9)
+    assert parse_range('bytes=90-', 100) == (90, 99)
+    assert parse_range('bytes=90-200', 100) == (90, 99)
+    assert parse_range('bytes=-10', 100) == (90, 99)
+    assert parse_range('bytes=-500', 100) == (0, 99)
+    # ignored: multiple ranges, garbage, reversed
+    assert parse_range('bytes=0-1,5-6', 100) is None
+    assert parse_range('lines=1-2', 100) is None
+    assert parse_range('bytes=9-3', 100) is None
+    for header in ('bytes=100-', 'bytes=-0'):
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
+
+
+def test_front_matter_end(tmp_path):
+    md = tmp_path / 'a.md'
+    md.write_bytes(b'---\ntitle: x\n---\n\n| a |\n')
+    assert md.read_bytes()[front_matter_end(str(md)):] == b'| a |\n'
+    md.write_bytes(b'--- not front matter\n')
+    assert front_matter_end(str(md)) == 0
+    md.write_bytes(b'---\nunterminated\n')
+    assert front_matter_end(str(md)) == 0
+
+
+def test_hex_preview():
+    text = hex_preview(b'\x00ABC', 1000)
+    assert '1000 bytes' in text
+    assert '00000000  00 41 42 43' in text and '|.ABC|' in text
+
+
+@pytest.fixture
+def web_view(monkeypatch, tmp_path):
+    import subprocess
+    import threading
+    from configparser import ConfigParser
+    from http.server import ThreadingHTTPServer
+
+    git_dir = tmp_path / 'repo.git'
+    work_tree = tmp_path / 'wt'
+    work_tree.mkdir()
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    git_cmd = ['git', '-C', str(work_tree), f'--git-dir={git_dir}', f'--work-tree={work_tree}']
+    (work_tree / 'small.txt').write_text('hello\n')
+    (work_tree / 'big.txt').write_bytes(b''.join(b'%08d\n' % i for i in range(50000)))
+    (work_tree / 'blob.bin').write_bytes(b'\x00\x01binary' * 100)
+    subprocess.run(git_cmd + ['add', '.'], check=True)
+    subprocess.run(git_cmd + ['-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-qm', 'x'], check=True)
+    head = subprocess.run(git_cmd + ['rev-parse', 'HEAD'], capture_output=True, check=True).stdout.decode().strip()
+
+    folder = tmp_path / 'tablog'
+    folder.mkdir()
+    (folder / 'a.md').write_text('---\ntitle: t\n---\n| cmd |\n')
+
+    def fake_init(self, a, b):
+        self.args = a
+        self.other_args = b
+        self.work_tree = str(work_tree)
+        self.git_dir = str(git_dir)
+        self.git_cmd = git_cmd
+        self.config = ConfigParser()
+        self.trops_env = 'test'
+    monkeypatch.setattr('trops.view.TropsCLI.__init__', fake_init)
+    # stream blobs above 64 KiB from git instead of reading them in one piece
+    monkeypatch.setattr('trops.gitobj.INLINE_MAX', 64 << 10)
+
+    args = argparse.Namespace(file=str(folder), web=True, update_tablog=False, no_browser=True, commit=None)
+    tv = TropsView(args, [])
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), tv._make_handler(str(folder)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1], head, work_tree
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(port, path, headers=None):
+    import http.client
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', path, headers=headers or {})
+    res = conn.getresponse()
+    body = res.read()
+    conn.close()
+    return res, body
+
+
+def test_web_git_streams_blobs_chunked(web_view):
+    port, head, work_tree = web_view
+    for name in ('small.txt', 'big.txt'):
+        res, body = _get(port, f'/git?hash={head[:7]}&path={name}')
+        assert res.status == 200
+        assert res.getheader('Transfer-Encoding') == 'chunked'
+        assert res.getheader('Accept-Ranges') == 'bytes'
+        assert body == (work_tree / name).read_bytes()
+
+
+def test_web_git_range_requests(web_view):
+    port, head, work_tree = web_view
+    data = (work_tree / 'big.txt').read_bytes()
+    for name, start in (('small.txt', 2), ('big.txt', 300000)):
+        res, body = _get(port, f'/git?hash={head}&path={name}', {'Range': f'bytes={start}-'})
+        expected = (work_tree / name).read_bytes()[start:]
+        assert res.status == 206
+        assert res.getheader('Content-Range') == f'bytes {start}-{start + len(expected) - 1}/{start + len(expected)}'
+        assert body == expected
+    res, body = _get(port, f'/git?hash={head}&path=big.txt', {'Range': 'bytes=-9'})
+    assert body == data[-9:]
+    res, _ = _get(port, f'/git?hash={head}&path=big.txt', {'Range': f'bytes={len(data)}-'})
+    assert res.status == 416
+    assert res.getheader('Content-Range') == f'bytes */{len(data)}'
+
+
+def test_web_git_binary_gets_hex_preview(web_view):
+    port, head, work_tree = web_view
+    res, body = _get(port, f'/git?hash={head}&path=blob.bin')
+    assert res.status == 200
+    assert body.startswith(b'Binary content (800 bytes)')
+    res, body = _get(port, f'/git?hash={head}&path=blob.bin&raw=1')
+    assert res.getheader('Content-Type') == 'application/octet-stream'
+    assert body == (work_tree / 'blob.bin').read_bytes()
+
+
+def test_web_git_commit_and_missing(web_view):
+    port, head, _ = web_view
+    res, body = _get(port, f'/git?hash={head}')
+    assert res.status == 200 and body.startswith(b'commit ' + head.encode())
+    res, _ = _get(port, f'/git?hash={head}&path=nope.txt')
+    assert res.status == 404
+
+
+def test_web_raw_skips_front_matter_and_supports_ranges(web_view):
+    port, _, _ = web_view
+    res, body = _get(port, '/raw?name=a.md')
+    assert res.status == 200 and body == b'| cmd |\n'
+    res, body = _get(port, '/raw?name=a.md', {'Range': 'bytes=2-4'})
+    assert res.status == 206 and body == b'cmd'
@@ -0,0 +1,123 @@
+import argparse
+import logging
+import subprocess
+import threading
+import time
+
+import pytest
+
+from trops.watch import Debouncer, TropsWatch
+
+
+def test_debouncer_batches_a_burst():
+    now = [0.0]
+    debouncer = Debouncer(2.0, 5.0, clock=lambda: now[0])
+    assert debouncer.timeout() is None
+    debouncer.add('a')
+    now[0] = 1.5
+    debouncer.add('b')
+    debouncer.add('a')
+    assert debouncer.due() == []
+    assert debouncer.timeout() == 2.0
+    now[0] = 3.5
+    assert debouncer.due() == ['a', 'b']
+    assert debouncer.timeout() is None
+
+    # a burst that keeps going is cut at max_delay
+    for t in (10.0, 11.0, 12.0, 13.0, 14.0):
+        now[0] = t
+        debouncer.add('c')
+        assert debouncer.due() == []
+    now[0] = 15.0
+    assert debouncer.due() == ['c']
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    trops_dir = tmp_path / 'trops'
+    trops_dir.mkdir()
+    work_tree = tmp_path / 'wt'
+    (work_tree / 'etc').mkdir(parents=True)
+    git_dir = tmp_path / 'repo.git'
+    subprocess.run(['git', 'init', '-q', '--bare', str(git_dir)], check=True)
+    (trops_dir / 'trops.cfg').write_text(
+        f'[e1]\ngit_dir = {git_dir}\nwork_tree = {work_tree}\nsudo = False\n')
+    for var in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv(f'GIT_{var}_NAME', 't')
+        monkeypatch.setenv(f'GIT_{var}_EMAIL', 't@t')
+    monkeypatch.setenv('TROPS_DIR', str(trops_dir))
+    monkeypatch.setenv('TROPS_ENV', 'e1')
+    monkeypatch.delenv('TROPS_SID', raising=False)
+    monkeypatch.delenv('TROPS_TAGS', raising=False)
+    return trops_dir, work_tree, git_dir
+
+
+def _touch(path):
+    from trops.trops import TropsCLI
+    TropsCLI(argparse.Namespace(), [])._touch_file(str(path))
+
+
+def _head_count(git_dir):
+    out = subprocess.run(['git', f'--git-dir={git_dir}', 'rev-list', '--count', 'HEAD'], capture_output=True).stdout
+    return int(out or 0)
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.parametrize('poll', [False, True])
+def test_watch_commits_changed_tracked_files(env, poll, caplog):
+    caplog.set_level(logging.INFO)
+    trops_dir, work_tree, git_dir = env
+    hosts = work_tree / 'etc' / 'hosts'
+    motd = work_tree / 'motd'
+    hosts.write_text('127.0.0.1 localhost\n')
+    motd.write_text('hello\n')
+    _touch(hosts)
+    _touch(motd)
+    commits = _head_count(git_dir)
+
+    args = argparse.Namespace(debounce=0.3, max_delay=5.0, poll=poll, interval=0.1)
+    watcher = TropsWatch(args, [])
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop, 0.05))
+    thread.start()
+    try:
+        time.sleep(0.3)
+        hosts.write_text('127.0.0.1 localhost\n10.0.0.1 db\n')
+        motd.write_text('maintenance tonight\n')
+        (work_tree / 'etc' / 'untracked').write_text('x\n')
+        assert _wait_for(lambda: _head_count(git_dir) > commits)
+        time.sleep(0.5)
+
+        # a file touched while watching is picked up from the index
+        new = work_tree / 'etc' / 'resolv.conf'
+        new.write_text('nameserver 1.1.1.1\n')
+        _touch(new)
+        count = _head_count(git_dir)
+        time.sleep(0.3)
+        new.write_text('nameserver 9.9.9.9\n')
+        assert _wait_for(lambda: _head_count(git_dir) > count)
+    finally:
+        stop.set()
+        thread.join()
+
+    # both edits of the burst went into one commit; then the add of
+    # resolv.conf and its update by the watcher
+    assert _head_count(git_dir) == commits + 3
+    names = subprocess.run(['git', f'--git-dir={git_dir}', 'show', '--name-only', '--format=', 'HEAD~2'],
+                           capture_output=True, check=True).stdout.decode().split()
+    assert sorted(names) == ['etc/hosts', 'motd']
+    tree = subprocess.run(['git', f'--git-dir={git_dir}', 'ls-tree', '-r', '--name-only', 'HEAD'],
+                          capture_output=True, check=True).stdout.decode().split()
+    assert 'etc/untracked' not in tree
+
+    fl_lines = [r.getMessage() for r in caplog.records if '#> UPDATE(watch) ' in r.getMessage()]
+    assert len(fl_lines) == 3
+    assert any(':etc/resolv.conf  #> UPDATE(watch) ' in line for line in fl_lines)